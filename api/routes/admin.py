@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from api.schemas.usage import UsageReport, AdminUsageReport
+from api.schemas.user import UserPriority
+from models.user import User
+from services.usage import usage_service
+from dependencies.auth import get_current_admin
+from dependencies.database import get_db
+from dependencies.scheduler import scheduler
+from dependencies.utils import json_body, json_body_openapi
+from dependencies.responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/admin", tags=["Admin"], dependencies=[Depends(get_current_admin)])
+
+@router.get("/usage", response_model=AdminUsageReport)
+async def get_usage(
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves usage totals for every user over a window.
+    """
+    report = usage_service.get_all_usage(db, granularity=granularity, start=start, end=end)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=report)
+
+@router.get("/users/{user_id}/usage", response_model=UsageReport)
+async def get_user_usage(
+    user_id: int,
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    endpoint: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves the per-bucket usage of a single user.
+    """
+    report = usage_service.get_user_usage(db, user_id, granularity=granularity, start=start, end=end, endpoint=endpoint)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=report)
+
+@router.put("/users/{user_id}/priority", response_model=UserPriority, openapi_extra=json_body_openapi(UserPriority))
+async def set_user_priority(
+    user_id: int,
+    request: UserPriority = Depends(json_body(UserPriority)),
+    db: Session = Depends(get_db),
+):
+    """
+    Sets the tier a user's requests are scheduled at for upstream slots.
+    """
+    if request.priority is not None and request.priority not in scheduler.priorities:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown priority {request.priority!r}. Choose from: {', '.join(scheduler.priorities)}",
+        )
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    user.priority = request.priority
+    db.commit()
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content={"priority": user.priority})
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Path
+
+from api.schemas.collections import AddDocumentsRequest, AddDocumentsResponse, SearchRequest, SearchResponse
+from services.collections import collection_service
+from dependencies.auth import get_current_user
+from dependencies.budget import enforce_budget
+from dependencies.scheduler import fair_share
+from dependencies.utils import track_api_usage, json_body, json_body_openapi
+from dependencies.timing import stage
+from dependencies.responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/collections", tags=["Collections"])
+
+CollectionName = Path(pattern=r"^[A-Za-z0-9_-]{1,64}$")
+
+@router.post(
+    "/{name}/documents",
+    response_model=AddDocumentsResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/collections/documents")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(AddDocumentsRequest),
+)
+async def add_documents(
+    name: str = CollectionName,
+    current_user: dict = Depends(get_current_user),
+    request: AddDocumentsRequest = Depends(json_body(AddDocumentsRequest))
+):
+    """
+    Embeds documents and adds them to one of the user's collections, creating it if needed.
+    """
+    with stage("upstream"):
+        response = await collection_service.add_documents(
+            owner=str(current_user.id),
+            name=name,
+            documents=[document.model_dump() for document in request.documents],
+            model=request.model,
+            dimensions=request.dimensions,
+            api_key=current_user.api_key
+        )
+    with stage("encode"):
+        return FastJSONResponse(status_code=200, content=response)
+
+@router.post(
+    "/{name}/search",
+    response_model=SearchResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/collections/search")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(SearchRequest),
+)
+async def search_collection(
+    name: str = CollectionName,
+    current_user: dict = Depends(get_current_user),
+    request: SearchRequest = Depends(json_body(SearchRequest))
+):
+    """
+    Finds the documents in one of the user's collections most similar to a text or an embedding.
+    """
+    with stage("search"):
+        response = await collection_service.search(
+            owner=str(current_user.id),
+            name=name,
+            text=request.text,
+            vector=request.vector,
+            k=request.k,
+            filter=request.filter,
+            api_key=current_user.api_key
+        )
+    with stage("encode"):
+        return FastJSONResponse(status_code=200, content=response)
@@ -0,0 +1,90 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Response, status
+from sqlalchemy.orm import Session
+
+from api.schemas.conversations import ConversationCreate, ConversationReply, ConversationResponse, ConversationTurn
+from services.conversations import conversation_service
+from dependencies.auth import get_current_user
+from dependencies.database import get_db
+from dependencies.budget import enforce_budget
+from dependencies.scheduler import fair_share
+from dependencies.utils import track_api_usage, json_body, json_body_openapi
+from dependencies.timing import stage
+from dependencies.responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/conversations", tags=["Conversations"])
+
+@router.post(
+    "",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ConversationResponse,
+    openapi_extra=json_body_openapi(ConversationCreate),
+)
+async def create_conversation(
+    current_user: dict = Depends(get_current_user),
+    request: ConversationCreate = Depends(json_body(ConversationCreate)),
+    db: Session = Depends(get_db),
+):
+    """
+    Starts a conversation kept server-side; its turns only send the new message.
+    """
+    conversation = conversation_service.create(db, current_user.id, request.model, request.system)
+    return FastJSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content=conversation,
+        headers={"Location": f"/api/v1/conversations/{conversation['id']}"},
+    )
+
+@router.get("/{conversation_id}", response_model=ConversationResponse)
+async def get_conversation(
+    conversation_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves a conversation with its latest messages, or the ones before message ``before``.
+    """
+    conversation = conversation_service.get(db, current_user.id, conversation_id, limit, before)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=conversation)
+
+@router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_conversation(
+    conversation_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Deletes a conversation and its messages.
+    """
+    conversation_service.delete(db, current_user.id, conversation_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post(
+    "/{conversation_id}/messages",
+    response_model=ConversationReply,
+    dependencies=[Depends(track_api_usage("/api/v1/conversations/messages")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(ConversationTurn),
+)
+async def add_message(
+    conversation_id: int,
+    current_user: dict = Depends(get_current_user),
+    request: ConversationTurn = Depends(json_body(ConversationTurn)),
+    db: Session = Depends(get_db),
+):
+    """
+    Adds a user message to a conversation and returns the assistant's reply.
+    """
+    with stage("upstream"):
+        reply = await conversation_service.reply(
+            db,
+            current_user,
+            conversation_id,
+            request.content,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        )
+    with stage("encode"):
+        return FastJSONResponse(status_code=status.HTTP_200_OK, content=reply)
@@ -0,0 +1,66 @@
+import orjson
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from api.schemas.jobs import JobRequest, JobResponse
+from services.jobs import job_service
+from dependencies.auth import get_current_user
+from dependencies.database import get_db
+from dependencies.utils import track_api_usage, json_body, json_body_openapi
+from dependencies.responses import FastJSONResponse
+
+router = APIRouter(prefix="/api/v1/jobs", tags=["Jobs"])
+
+@router.post(
+    "",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=JobResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/jobs"))],
+    openapi_extra=json_body_openapi(JobRequest),
+)
+async def create_job(
+    current_user: dict = Depends(get_current_user),
+    request: JobRequest = Depends(json_body(JobRequest)),
+    db: Session = Depends(get_db),
+):
+    """
+    Queues a summarize or translate job and returns its id at once.
+    """
+    params = request.model_dump(exclude={"kind"})
+    job = job_service.enqueue(db, current_user.id, request.kind, params)
+    return FastJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job,
+        headers={"Location": f"/api/v1/jobs/{job['id']}"},
+    )
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves a job's status, and its result once it has succeeded.
+    """
+    job = job_service.get(db, current_user.id, job_id)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=job)
+
+@router.get("/{job_id}/events")
+async def stream_job(
+    job_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Streams the job as server-sent events, one each time its status changes, until it has finished.
+    """
+    # Raises the 404 before the stream starts.
+    job_service.get(db, current_user.id, job_id)
+
+    async def events():
+        async for job in job_service.events(current_user.id, job_id):
+            yield b"event: " + job["status"].encode() + b"\ndata: " + orjson.dumps(job) + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
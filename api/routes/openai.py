@@ -1,87 +1,189 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, status
 
-from .schemas.openai import OpenAIRequest, OpenAIResponse
+from api.schemas.openai import EmbeddingRequest, EmbeddingResponse, OpenAIRequest, OpenAIResponse
 from dependencies.openai import openai_service
-from dependencies.auth import get_current_user
+from dependencies.auth import get_current_user, user_from_token
+from dependencies.database import SessionLocal
+from dependencies.budget import enforce_budget
+from dependencies.scheduler import fair_share
+from dependencies.utils import track_api_usage, json_body, json_body_openapi
+from dependencies.disconnect import cancel_on_disconnect
+from dependencies.timing import stage
+from dependencies.responses import FastJSONResponse
+from services.chat_stream import ChatStreamSession
 
 router = APIRouter(prefix="/api/v1/openai", tags=["OpenAI"])
 
-@router.post("/complete", response_model=OpenAIResponse)
+@router.post(
+    "/complete",
+    response_model=OpenAIResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/openai/complete")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(OpenAIRequest),
+)
 async def complete_text(
-    request: OpenAIRequest, 
-    current_user: dict = Depends(get_current_user)
+    http_request: Request,
+    current_user: dict = Depends(get_current_user),
+    request: OpenAIRequest = Depends(json_body(OpenAIRequest))
 ):
     """
     Completes a given text using OpenAI's text completion API.
     """
     try:
-        response = await openai_service.complete_text(
-            text=request.text,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
-        return JSONResponse(
-            status_code=200, 
-            content=jsonable_encoder(
-                {"response": response.choices[0].text}
-            )
-        )
+        with stage("upstream"):
+            response = await cancel_on_disconnect(http_request, openai_service.complete_text(
+                text=request.text,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                api_key=current_user.api_key,
+                cascade=request.cascade
+            ))
+        with stage("encode"):
+            return FastJSONResponse(status_code=200, content=response)
+    except HTTPException:
+        # Keep the upstream's status, or the 504 of a passed deadline, rather than reporting a 500.
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
             detail=f"Error completing text: {str(e)}"
         )
 
-@router.post("/translate", response_model=OpenAIResponse)
+@router.post(
+    "/translate",
+    response_model=OpenAIResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/openai/translate")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(OpenAIRequest),
+)
 async def translate_text(
-    request: OpenAIRequest, 
-    current_user: dict = Depends(get_current_user)
+    http_request: Request,
+    current_user: dict = Depends(get_current_user),
+    request: OpenAIRequest = Depends(json_body(OpenAIRequest))
 ):
     """
     Translates a given text using OpenAI's translation API.
     """
     try:
-        response = await openai_service.translate_text(
-            text=request.text,
-            source_language=request.source_language,
-            target_language=request.target_language
-        )
-        return JSONResponse(
-            status_code=200, 
-            content=jsonable_encoder(
-                {"response": response.choices[0].text}
-            )
-        )
+        with stage("upstream"):
+            response = await cancel_on_disconnect(http_request, openai_service.translate_text(
+                text=request.text,
+                source_language=request.source_language,
+                target_language=request.target_language,
+                api_key=current_user.api_key
+            ))
+        with stage("encode"):
+            return FastJSONResponse(status_code=200, content=response)
+    except HTTPException:
+        # Keep the upstream's status, or the 504 of a passed deadline, rather than reporting a 500.
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
             detail=f"Error translating text: {str(e)}"
         )
 
-@router.post("/summarize", response_model=OpenAIResponse)
+@router.post(
+    "/summarize",
+    response_model=OpenAIResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/openai/summarize")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(OpenAIRequest),
+)
 async def summarize_text(
-    request: OpenAIRequest, 
-    current_user: dict = Depends(get_current_user)
+    http_request: Request,
+    current_user: dict = Depends(get_current_user),
+    request: OpenAIRequest = Depends(json_body(OpenAIRequest))
 ):
     """
     Summarizes a given text using OpenAI's summarization API.
     """
     try:
-        response = await openai_service.summarize_text(
-            text=request.text,
-            model=request.model
+        with stage("upstream"):
+            response = await cancel_on_disconnect(http_request, openai_service.summarize_text(
+                text=request.text,
+                model=request.model,
+                api_key=current_user.api_key
+            ))
+        with stage("encode"):
+            return FastJSONResponse(status_code=200, content=response)
+    except HTTPException:
+        # Keep the upstream's status, or the 504 of a passed deadline, rather than reporting a 500.
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error summarizing text: {str(e)}"
         )
-        return JSONResponse(
-            status_code=200, 
-            content=jsonable_encoder(
-                {"response": response.choices[0].text}
+
+@router.post(
+    "/embeddings",
+    response_model=EmbeddingResponse,
+    dependencies=[Depends(track_api_usage("/api/v1/openai/embeddings")), Depends(enforce_budget), Depends(fair_share)],
+    openapi_extra=json_body_openapi(EmbeddingRequest),
+)
+async def create_embeddings(
+    current_user: dict = Depends(get_current_user),
+    request: EmbeddingRequest = Depends(json_body(EmbeddingRequest))
+):
+    """
+    Embeds one or many texts, embedding repeated and previously seen texts only once.
+    """
+    try:
+        texts = [request.input] if isinstance(request.input, str) else request.input
+        with stage("upstream"):
+            vectors, prompt_tokens, cached = await openai_service.embed_texts(
+                texts,
+                model=request.model,
+                dimensions=request.dimensions,
+                api_key=current_user.api_key
             )
-        )
+        with stage("encode"):
+            if request.encoding_format == "base64":
+                from dependencies.embeddings import encode_embedding
+
+                embeddings = [encode_embedding(vector) for vector in vectors]
+            else:
+                # float32 rows, serialized by orjson without a detour through Python floats.
+                embeddings = list(vectors)
+            return FastJSONResponse(
+                status_code=200,
+                content={
+                    "object": "list",
+                    "data": [
+                        {"object": "embedding", "index": index, "embedding": embedding}
+                        for index, embedding in enumerate(embeddings)
+                    ],
+                    "model": request.model,
+                    "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens, "cached_inputs": cached},
+                },
+            )
+    except HTTPException:
+        # Keep the upstream's status, e.g. 429 or 400, rather than reporting a 500.
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
-            detail=f"Error summarizing text: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Error creating embeddings: {str(e)}"
+        )
+
+@router.websocket("/chat/ws")
+async def chat_stream(websocket: WebSocket):
+    """
+    Streams chat completions over one WebSocket, authenticated once when it opens.
+
+    The access token comes in an ``Authorization: Bearer`` header or, for browsers, a
+    ``token`` query parameter. See ``ChatStreamSession`` for the frames exchanged.
+    """
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        token = authorization[7:]
+    db = SessionLocal()
+    try:
+        user = user_from_token(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        db.close()
+    await websocket.accept()
+    await ChatStreamSession(websocket, user).run()
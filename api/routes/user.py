@@ -1,43 +1,65 @@
+from datetime import datetime
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
 
-from .schemas.user import UserCreate, User, UserLogin, Token
-from services.user import user_service
+from api.schemas.user import UserCreate, User, UserLogin, Token
+from api.schemas.usage import UsageReport
+from services.user import UserService
+from services.usage import usage_service
 from dependencies.auth import create_access_token, get_current_user
+from dependencies.database import get_db
+from dependencies.utils import json_body, json_body_openapi
+from dependencies.responses import FastJSONResponse
 
 router = APIRouter(prefix="/api/v1/users", tags=["Users"])
 
-@router.post("/register", response_model=User)
-async def register_user(request: UserCreate):
+@router.post("/register", response_model=User, openapi_extra=json_body_openapi(UserCreate))
+async def register_user(request: UserCreate = Depends(json_body(UserCreate)), user_service: UserService = Depends()):
     """
     Registers a new user.
     """
     try:
         user = await user_service.create_user(request)
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content=jsonable_encoder(user))
+        return FastJSONResponse(status_code=status.HTTP_201_CREATED, content=User.model_validate(user))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error registering user: {str(e)}")
 
-@router.post("/login", response_model=Token)
-async def login_user(request: UserLogin):
+@router.post("/login", response_model=Token, openapi_extra=json_body_openapi(UserLogin))
+async def login_user(request: UserLogin = Depends(json_body(UserLogin)), user_service: UserService = Depends()):
     """
     Logs in a user and generates an access token.
     """
     try:
         user = await user_service.authenticate_user(request)
-        access_token = create_access_token(data={"sub": user.id})
-        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"access_token": access_token, "token_type": "bearer"}))
+        access_token = create_access_token(data={"sub": str(user.id)})
+        return FastJSONResponse(status_code=status.HTTP_200_OK, content=Token(access_token=access_token, token_type="bearer"))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid credentials: {str(e)}")
 
 @router.get("/me", response_model=User)
-async def get_current_user(current_user: User = Depends(get_current_user)):
+async def read_current_user(current_user: User = Depends(get_current_user), user_service: UserService = Depends()):
     """
     Retrieves the current user's information.
     """
     try:
         user = await user_service.get_user_by_id(current_user.id)
-        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(user))
+        return FastJSONResponse(status_code=status.HTTP_200_OK, content=User.model_validate(user))
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error retrieving user: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error retrieving user: {str(e)}")
+
+@router.get("/me/usage", response_model=UsageReport)
+async def read_current_user_usage(
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    endpoint: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves the current user's API usage, served from the hourly/daily rollups.
+    """
+    report = usage_service.get_user_usage(db, current_user.id, granularity=granularity, start=start, end=end, endpoint=endpoint)
+    return FastJSONResponse(status_code=status.HTTP_200_OK, content=report)
\ No newline at end of file
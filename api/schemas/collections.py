@@ -0,0 +1,43 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, Any, Dict, List, Optional
+
+from .openai import EmbeddingModel
+
+class Document(BaseModel):
+    # Generated when omitted.
+    id: Optional[Annotated[str, Field(min_length=1, max_length=256)]] = None
+    text: Annotated[str, Field(min_length=1)]
+    metadata: Dict[str, Any] = {}
+
+class AddDocumentsRequest(BaseModel):
+    documents: Annotated[List[Document], Field(min_length=1, max_length=2048)]
+    # Only used when the request creates the collection; later requests must match.
+    model: EmbeddingModel = "text-embedding-3-small"
+    dimensions: Optional[Annotated[int, Field(ge=1, le=3072)]] = None
+
+class AddDocumentsResponse(BaseModel):
+    collection: str
+    count: int
+    ids: List[str]
+
+class SearchRequest(BaseModel):
+    text: Optional[str] = None
+    vector: Optional[List[float]] = None
+    k: Annotated[int, Field(ge=1, le=100)] = 10
+    # Metadata every result must match: equal values, or any of a list of values.
+    filter: Optional[Dict[str, Any]] = None
+
+    @model_validator(mode="after")
+    def text_or_vector_required(self):
+        if (self.text is None) == (self.vector is None):
+            raise ValueError("Provide either text or vector.")
+        return self
+
+class SearchResult(BaseModel):
+    id: str
+    score: float
+    text: str
+    metadata: Dict[str, Any]
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
@@ -0,0 +1,50 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Optional
+
+from .openai import ChatModel, OpenAIUsage
+
+class ConversationCreate(BaseModel):
+    model: ChatModel = "gpt-3.5-turbo"
+    system: Optional[str] = None
+
+class ConversationTurn(BaseModel):
+    # Only the new user message; earlier turns are kept server-side.
+    content: Annotated[str, Field(min_length=1)]
+    temperature: Annotated[float, Field(ge=0, le=2)] = 0.7
+    max_tokens: Annotated[int, Field(ge=1, le=4096)] = 256
+
+class ConversationMessageResponse(BaseModel):
+    id: int
+    role: Literal["user", "assistant"]
+    content: str
+    tokens: int
+    created_at: Optional[datetime] = None
+
+class ConversationResponse(BaseModel):
+    id: int
+    model: str
+    system: Optional[str] = None
+    # Stands in for the turns trimmed from the context window, if they were summarized.
+    summary: Optional[str] = None
+    message_count: int
+    context_tokens: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    # Newest last; older ones with ?before=<id of the first>.
+    messages: List[ConversationMessageResponse] = []
+
+class ConversationContext(BaseModel):
+    # What the turn was sent upstream with.
+    messages: int
+    tokens: int
+    # Messages moved out of the context window by this turn, and whether they were folded into the summary.
+    trimmed: int
+    summarized: bool
+
+class ConversationReply(BaseModel):
+    conversation_id: int
+    response: str
+    context: ConversationContext
+    # Of the turn's upstream calls, a summary's included.
+    usage: Optional[OpenAIUsage] = None
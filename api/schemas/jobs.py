@@ -0,0 +1,32 @@
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, Literal, Optional
+
+from .openai import CompletionModel, OpenAIResponse
+
+class JobRequest(BaseModel):
+    kind: Literal["summarize", "translate"]
+    text: Annotated[str, Field(min_length=1)]
+    # Summarize only.
+    model: CompletionModel = "text-davinci-003"
+    # Translate only; both required.
+    source_language: Optional[str] = None
+    target_language: Optional[str] = None
+
+    @model_validator(mode="after")
+    def languages_required_to_translate(self):
+        if self.kind == "translate" and not (self.source_language and self.target_language):
+            raise ValueError("source_language and target_language are required to translate.")
+        return self
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    # queued, running, succeeded or failed.
+    status: str
+    attempts: int
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[OpenAIResponse] = None
+    error: Optional[str] = None
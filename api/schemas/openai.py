@@ -1,35 +1,19 @@
-from pydantic import BaseModel, validator
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Annotated, Literal, Optional, List, Union
+
+CompletionModel = Literal["text-davinci-003", "text-curie-001", "text-babbage-001", "text-ada-001"]
+EmbeddingModel = Literal["text-embedding-3-small", "text-embedding-3-large", "text-embedding-ada-002"]
+ChatModel = Literal["gpt-3.5-turbo", "gpt-4", "gpt-4o", "gpt-4o-mini"]
 
 class OpenAIRequest(BaseModel):
     text: str
-    model: str = "text-davinci-003"
-    temperature: float = 0.7
-    max_tokens: int = 256
+    model: CompletionModel = "text-davinci-003"
+    temperature: Annotated[float, Field(ge=0, le=1)] = 0.7
+    max_tokens: Annotated[int, Field(ge=1, le=4096)] = 256
     source_language: Optional[str] = None
     target_language: Optional[str] = None
-
-    @validator("model")
-    def model_must_be_valid(cls, value):
-        valid_models = ["text-davinci-003", "text-curie-001", "text-babbage-001", "text-ada-001"]
-        if value not in valid_models:
-            raise ValueError("Invalid model. Choose from: " + ", ".join(valid_models))
-        return value
-
-    @validator("temperature")
-    def temperature_must_be_valid(cls, value):
-        if value < 0 or value > 1:
-            raise ValueError("Temperature must be between 0 and 1")
-        return value
-
-    @validator("max_tokens")
-    def max_tokens_must_be_valid(cls, value):
-        if value < 1 or value > 4096:
-            raise ValueError("Max tokens must be between 1 and 4096")
-        return value
-
-class OpenAIResponse(BaseModel):
-    response: str
+    # Completion only: try the fast cascade model first, escalating to ``model`` when its answer falls short.
+    cascade: bool = False
 
 class OpenAIChoice(BaseModel):
     text: str
@@ -39,21 +23,69 @@ class OpenAIUsage(BaseModel):
     completion_tokens: int
     total_tokens: int
 
+class OpenAIResponse(BaseModel):
+    response: str
+    # Tokens of every upstream call made for the answer; None when it came from the cache.
+    usage: Optional[OpenAIUsage] = None
+
+class ChatMessage(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+class ChatStreamGenerate(BaseModel):
+    # A "generate" frame of the chat WebSocket; ``id`` names the generation in the frames sent back.
+    type: Literal["generate"]
+    id: Annotated[str, Field(min_length=1, max_length=64)]
+    messages: Annotated[List[ChatMessage], Field(min_length=1)]
+    model: ChatModel = "gpt-3.5-turbo"
+    temperature: Annotated[float, Field(ge=0, le=2)] = 0.7
+    max_tokens: Annotated[int, Field(ge=1, le=4096)] = 256
+    # A lower scheduling tier than the user's own, like the X-Priority header.
+    priority: Optional[str] = None
+    # Seconds the client will wait for the whole generation, like the X-Request-Timeout header.
+    timeout: Optional[Annotated[float, Field(gt=0)]] = None
+
+class EmbeddingRequest(BaseModel):
+    # One text or up to 2048, the most the upstream accepts in one request.
+    input: Union[str, Annotated[List[str], Field(min_length=1, max_length=2048)]]
+    model: EmbeddingModel = "text-embedding-3-small"
+    dimensions: Optional[Annotated[int, Field(ge=1, le=3072)]] = None
+    # "base64" returns each vector as the base64 of its little-endian float32 bytes.
+    encoding_format: Literal["float", "base64"] = "float"
+
+class EmbeddingData(BaseModel):
+    object: Literal["embedding"] = "embedding"
+    index: int
+    embedding: Union[List[float], str]
+
+class EmbeddingUsage(BaseModel):
+    prompt_tokens: int
+    total_tokens: int
+    # Distinct inputs served from the embedding cache rather than the upstream.
+    cached_inputs: int = 0
+
+class EmbeddingResponse(BaseModel):
+    object: Literal["list"] = "list"
+    data: List[EmbeddingData]
+    model: str
+    usage: EmbeddingUsage
+
 class OpenAIModel(BaseModel):
     id: str
     object: str
     created: int
     owned_by: str
-    permissions: List[dict]
-    root: str
-    parent: Optional[str]
-    is_moderation_model: bool
-    is_text_search_model: bool
-    is_translation_model: bool
-    is_code_model: bool
-    is_embedding_model: bool
-    is_question_answering_model: bool
-    is_completion_model: bool
-    is_chat_completion_model: bool
-    is_fine_tuned: bool
-    is_available: bool
\ No newline at end of file
+    # Not returned by the current models endpoint; kept for clients that read them.
+    permissions: List[dict] = []
+    root: Optional[str] = None
+    parent: Optional[str] = None
+    is_moderation_model: Optional[bool] = None
+    is_text_search_model: Optional[bool] = None
+    is_translation_model: Optional[bool] = None
+    is_code_model: Optional[bool] = None
+    is_embedding_model: Optional[bool] = None
+    is_question_answering_model: Optional[bool] = None
+    is_completion_model: Optional[bool] = None
+    is_chat_completion_model: Optional[bool] = None
+    is_fine_tuned: Optional[bool] = None
+    is_available: Optional[bool] = None
\ No newline at end of file
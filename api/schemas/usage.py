@@ -0,0 +1,49 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import List
+
+class UsageBucket(BaseModel):
+    bucket_start: datetime
+    endpoint: str
+    request_count: int
+    error_count: int
+    latency_sum_ms: int
+    latency_histogram: List[int]
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+class ModelUsageTotals(BaseModel):
+    model: str
+    # Upstream calls, which can be more than requests (cascades, summaries).
+    call_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+class UsageReport(BaseModel):
+    user_id: int
+    granularity: str
+    start: datetime
+    end: datetime
+    latency_buckets_ms: List[int]
+    buckets: List[UsageBucket]
+    models: List[ModelUsageTotals] = []
+
+class UserUsageTotals(BaseModel):
+    user_id: int
+    request_count: int
+    error_count: int
+    latency_sum_ms: int
+    latency_histogram: List[int]
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+class AdminUsageReport(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    latency_buckets_ms: List[int]
+    users: List[UserUsageTotals]
+    models: List[ModelUsageTotals] = []
@@ -1,30 +1,18 @@
-from pydantic import BaseModel, validator
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Annotated, Optional, List
 
 class UserCreate(BaseModel):
+    # Username and email uniqueness is checked by UserService.create_user with one
+    # indexed lookup, not here.
     username: str
     email: str
-    password: str
-
-    @validator("username")
-    def username_must_be_unique(cls, value, values):
-        # Check if username is already taken (use database query)
-        if User.objects.filter(username=value).exists():
-            raise ValueError("Username already exists.")
-        return value
-
-    @validator("email")
-    def email_must_be_unique(cls, value, values):
-        # Check if email is already taken (use database query)
-        if User.objects.filter(email=value).exists():
-            raise ValueError("Email already exists.")
-        return value
+    password: Annotated[str, Field(min_length=8)]
 
-    @validator("password")
-    def password_must_be_strong(cls, value):
-        # Ensure password meets minimum length and complexity requirements
-        if len(value) < 8:
-            raise ValueError("Password must be at least 8 characters long.")
+    @field_validator("password")
+    @classmethod
+    def password_must_be_strong(cls, value: str) -> str:
+        # The compiled regex engine has no lookaheads, so the character class
+        # requirements are checked in a single pass here.
         if not any(c.isupper() for c in value):
             raise ValueError("Password must contain at least one uppercase letter.")
         if not any(c.islower() for c in value):
@@ -34,6 +22,8 @@ class UserCreate(BaseModel):
         return value
 
 class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     username: str
     email: str
@@ -45,4 +35,12 @@ class UserLogin(BaseModel):
 
 class Token(BaseModel):
     access_token: str
-    token_type: str
\ No newline at end of file
+    token_type: str
+
+class UserPriority(BaseModel):
+    # A tier of SCHEDULER_PRIORITIES, or null for the default tier.
+    priority: Optional[str] = None
+
+class TokenData(BaseModel):
+    # The user id from the access token's "sub" claim (a string in the token).
+    id: Optional[int] = None
@@ -0,0 +1,150 @@
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+Imports ``main`` (or ``--module``) in ``--runs`` new processes and reports the median
+import time, the slowest modules by cumulative ``-X importtime`` cost, and whether any
+of the modules the app is meant to load lazily were imported at startup. Exits non-zero
+when the median exceeds ``--budget-ms`` or a lazy module was imported eagerly, so CI
+can track the budget::
+
+    python benchmarks/coldstart.py --budget-ms 1500 --output benchmarks/results/coldstart.json
+    python benchmarks/coldstart.py --compare benchmarks/results/coldstart.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use by the app; importing any of these at startup is a regression.
+LAZY_MODULES = ("openai", "jose", "passlib", "sqlalchemy.ext.asyncio", "numpy")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+lazy = {lazy!r}
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "eager": [name for name in lazy if name in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Returns ``(module, self_us, cumulative_us, depth)`` for every ``-X importtime`` line."""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def probe(module: str, env: Dict[str, str]) -> Tuple[dict, str]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to measure.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to report.")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when the median import time exceeds this.")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "coldstart.json"))
+    parser.add_argument("--compare", default=None, help="Previous result file to compare against.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="openai-gateway-coldstart-")
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'coldstart.db')}")
+    env.setdefault("OPENAI_API_KEY", "sk-coldstart")
+    env.setdefault("SECRET_KEY", "coldstart-secret")
+
+    # The first run also warms the bytecode cache so later runs measure imports only.
+    probe(args.module, env)
+    runs = []
+    stderr = ""
+    for _ in range(args.runs):
+        result, stderr = probe(args.module, env)
+        runs.append(result)
+
+    import_ms = sorted(run["import_ms"] for run in runs)
+    eager = sorted({name for run in runs for name in run["eager"]})
+    modules = parse_importtime(stderr)
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[: args.top]
+
+    median_ms = statistics.median(import_ms)
+    print(f"import {args.module}: median {median_ms:.1f}ms, min {import_ms[0]:.1f}ms, max {import_ms[-1]:.1f}ms over {args.runs} runs")
+    print(f"\n{'cumulative':>12} {'self':>10}  module")
+    for name, self_us, cumulative_us, depth in slowest:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {'  ' * depth}{name}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "module": args.module,
+            "runs": args.runs,
+            "budget_ms": args.budget_ms,
+        },
+        "results": {
+            "median_ms": round(median_ms, 3),
+            "min_ms": round(import_ms[0], 3),
+            "max_ms": round(import_ms[-1], 3),
+            "modules_imported": len(modules),
+            "eager_lazy_modules": eager,
+            "slowest": [
+                {"module": name, "self_ms": round(self_us / 1000, 3), "cumulative_ms": round(cumulative_us / 1000, 3)}
+                for name, self_us, cumulative_us, _ in slowest
+            ],
+        },
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)["results"]["median_ms"]
+        change = (median_ms - before) / before * 100 if before else 0.0
+        print(f"Compared with {args.compare}: median {before:.1f}ms -> {median_ms:.1f}ms ({change:+.1f}%)")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup but meant to load lazily: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"FAIL: median import time {median_ms:.1f}ms exceeds the {args.budget_ms:.0f}ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
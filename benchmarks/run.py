@@ -0,0 +1,291 @@
+"""
+End-to-end benchmark for the API gateway.
+
+Boots the app with uvicorn against the local OpenAI stand-in (tests/fake_openai.py) and a
+local database, then drives ``/complete``, ``/translate``, ``/summarize``, ``/users/login``
+and ``/users/me`` at the requested concurrency levels and reports RPS and p50/p95/p99
+latency. Results are written as JSON so runs can be compared::
+
+    python benchmarks/run.py --concurrency 1,16,64 --duration 15 --output benchmarks/results/main.json
+    python benchmarks/run.py --concurrency 16 --compare benchmarks/results/main.json
+
+To benchmark an app that is already running, pass ``--app-url`` (and ``--no-upstream``
+if its upstream is managed elsewhere).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USER = {"username": "bench", "email": "bench@example.com", "password": "BenchPassw0rd"}
+TEXT = "The quick brown fox jumps over the lazy dog. " * 8
+
+SCENARIOS = {
+    "complete": ("POST", "/api/v1/openai/complete", {"text": TEXT, "model": "text-davinci-003", "max_tokens": 32}, True),
+    "translate": ("POST", "/api/v1/openai/translate", {"text": TEXT, "source_language": "en", "target_language": "fr"}, True),
+    "summarize": ("POST", "/api/v1/openai/summarize", {"text": TEXT, "model": "text-davinci-003"}, True),
+    "login": ("POST", "/api/v1/users/login", {"email": BENCH_USER["email"], "password": BENCH_USER["password"]}, False),
+    "me": ("GET", "/api/v1/users/me", None, True),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def drive(client: httpx.AsyncClient, scenario: str, token: str, concurrency: int, duration: float, warmup: float) -> Dict[str, float]:
+    """Runs ``concurrency`` closed-loop clients against one scenario for ``duration`` seconds."""
+    method, path, body, needs_auth = SCENARIOS[scenario]
+    headers = {"Authorization": f"Bearer {token}"} if needs_auth else {}
+    latencies: List[float] = []
+    errors = 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        nonlocal errors
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            finished = time.perf_counter()
+            if sent >= measure_from:
+                if ok:
+                    latencies.append(finished - sent)
+                else:
+                    errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - measure_from)
+
+
+async def authenticate(client: httpx.AsyncClient) -> str:
+    await client.post("/api/v1/users/register", json=BENCH_USER)
+    response = await client.post("/api/v1/users/login", json={"email": BENCH_USER["email"], "password": BENCH_USER["password"]})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_benchmarks(args) -> Dict[str, Dict[str, Dict[str, float]]]:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.app_url, timeout=args.request_timeout, limits=limits) as client:
+        token = await authenticate(client)
+        results: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                stats = await drive(client, scenario, token, concurrency, args.duration, args.warmup)
+                results.setdefault(scenario, {})[str(concurrency)] = stats
+                print(
+                    f"{scenario:<10} c={concurrency:<4} rps={stats['rps']:>9.2f} "
+                    f"p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+                    f"p99={stats['p99_ms']:>9.2f}ms errors={stats['errors']}"
+                )
+        return results
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    """Prints the relative change of RPS and p50/p99 against a previous result file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nCompared with {baseline_path}:")
+    for scenario, by_concurrency in results.items():
+        for concurrency, stats in by_concurrency.items():
+            before = baseline.get(scenario, {}).get(concurrency)
+            if not before:
+                continue
+            deltas = []
+            for key in ("rps", "p50_ms", "p99_ms"):
+                change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                deltas.append(f"{key} {before[key]:.2f} -> {stats[key]:.2f} ({change:+.1f}%)")
+            print(f"{scenario:<10} c={concurrency:<4} " + ", ".join(deltas))
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_database(database_url: str) -> None:
+    """Creates the tables in a fresh local database."""
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import create_engine
+
+    import models.api_usage  # noqa: F401
+    import models.budget_counter  # noqa: F401
+    import models.conversation  # noqa: F401
+    import models.job  # noqa: F401
+    import models.usage_rollup  # noqa: F401
+    import models.user  # noqa: F401
+    from models.base import Base
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,16,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per scenario and level.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each measurement.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app under test.")
+    parser.add_argument("--upstream-latency-ms", type=float, default=300.0)
+    parser.add_argument("--upstream-latency-distribution", default="lognormal")
+    parser.add_argument("--upstream-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--database-url", default=None, help="Defaults to a fresh SQLite file in a temp dir.")
+    parser.add_argument("--app-url", default=None, help="Benchmark an already running app instead of booting one.")
+    parser.add_argument("--no-upstream", action="store_true", help="Do not start the local OpenAI stand-in.")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "latest.json"))
+    parser.add_argument("--compare", default=None, help="Previous result file to compare against.")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    args.scenarios = [value for value in args.scenarios.split(",") if value]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    processes: List[subprocess.Popen] = []
+    workdir = tempfile.mkdtemp(prefix="openai-gateway-bench-")
+    try:
+        env = dict(os.environ)
+        if not args.no_upstream:
+            upstream_port = free_port()
+            processes.append(
+                subprocess.Popen(
+                    [
+                        sys.executable, os.path.join(ROOT, "tests", "fake_openai.py"),
+                        "--port", str(upstream_port),
+                        "--latency-ms", str(args.upstream_latency_ms),
+                        "--latency-distribution", args.upstream_latency_distribution,
+                        "--tokens-per-second", str(args.upstream_tokens_per_second),
+                        "--seed", "0",
+                    ],
+                    cwd=ROOT,
+                )
+            )
+            env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{upstream_port}/v1"
+            wait_until_up(f"http://127.0.0.1:{upstream_port}/_fake/config")
+
+        if args.app_url is None:
+            database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            prepare_database(database_url)
+            app_port = free_port()
+            env.update(
+                DATABASE_URL=database_url,
+                OPENAI_API_KEY=env.get("OPENAI_API_KEY", "sk-bench"),
+                SECRET_KEY=env.get("SECRET_KEY", "bench-secret"),
+                PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, "prometheus"),
+            )
+            os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+            processes.append(
+                subprocess.Popen(
+                    [
+                        sys.executable, "-m", "uvicorn", "main:app",
+                        "--host", "127.0.0.1", "--port", str(app_port),
+                        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+                    ],
+                    cwd=ROOT,
+                    env=env,
+                )
+            )
+            args.app_url = f"http://127.0.0.1:{app_port}"
+            wait_until_up(f"{args.app_url}/docs")
+
+        results = asyncio.run(run_benchmarks(args))
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "workers": args.workers,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "upstream_latency_ms": args.upstream_latency_ms,
+                "upstream_latency_distribution": args.upstream_latency_distribution,
+                "upstream_tokens_per_second": args.upstream_tokens_per_second,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+        if args.compare:
+            compare(results, args.compare)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
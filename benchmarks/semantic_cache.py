@@ -0,0 +1,120 @@
+"""
+Semantic cache lookup benchmark.
+
+Fills a ``VectorIndex`` with random unit vectors and measures the search latency for
+queries near a stored vector (hits, at cosine similarity 0.97) and for unrelated queries
+(misses), next to a brute-force dot product over all vectors. It also reports the hit
+recall, i.e. how often the signature prefilter kept the true neighbour. Exits with
+status 1 when the median search time exceeds ``--budget-ms``::
+
+    python benchmarks/semantic_cache.py --entries 100000 --dimensions 256
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from dependencies.semantic_cache import VectorIndex  # noqa: E402
+
+
+def near(vector: np.ndarray, similarity: float, rng: np.random.Generator) -> np.ndarray:
+    """A unit vector at exactly ``similarity`` to ``vector``."""
+    noise = rng.standard_normal(len(vector)).astype(np.float32)
+    noise -= (noise @ vector) * vector
+    noise /= np.linalg.norm(noise)
+    return (similarity * vector + np.sqrt(1 - similarity**2) * noise).astype(np.float32)
+
+
+def timings_ms(fn: Callable[[np.ndarray], object], queries: List[np.ndarray]) -> Dict[str, float]:
+    for query in queries[:10]:
+        fn(query)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 4),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 4),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="Maximum median search time.")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "semantic_cache.json"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.entries, args.dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    index = VectorIndex(args.dimensions, args.entries, args.threshold)
+    for vector in vectors:
+        index.add(vector)
+    insert_us = (time.perf_counter() - start) / args.entries * 1_000_000
+
+    targets = rng.integers(0, args.entries, args.queries)
+    hits = [near(vectors[target], 0.97, rng) for target in targets]
+    misses = list(rng.standard_normal((args.queries, args.dimensions)).astype(np.float32))
+    misses = [query / np.linalg.norm(query) for query in misses]
+
+    found = sum(index.search(query)[0] == int(target) for query, target in zip(hits, targets))
+    results = {
+        "hit": timings_ms(index.search, hits),
+        "miss": timings_ms(index.search, misses),
+        "brute_force": timings_ms(lambda query: int(np.argmax(vectors @ query)), hits),
+        "recall": round(found / args.queries, 4),
+        "insert_us": round(insert_us, 2),
+    }
+    print(
+        f"{args.entries} entries x {args.dimensions} dims: hit p50={results['hit']['p50_ms']:.3f}ms "
+        f"p99={results['hit']['p99_ms']:.3f}ms, miss p50={results['miss']['p50_ms']:.3f}ms, "
+        f"brute force p50={results['brute_force']['p50_ms']:.3f}ms, recall={results['recall']:.2%}, "
+        f"insert={results['insert_us']:.1f}us"
+    )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "entries": args.entries,
+            "dimensions": args.dimensions,
+            "threshold": args.threshold,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if results["hit"]["p50_ms"] > args.budget_ms:
+        print(f"Median search time is over the {args.budget_ms}ms budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
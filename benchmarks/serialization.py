@@ -0,0 +1,133 @@
+"""
+Response serialization benchmark.
+
+Measures the CPU time each way of turning a route result into response bytes costs per
+request, for payloads shaped like the gateway's real responses:
+
+* ``jsonable_encoder``: the previous path, ``JSONResponse(content=jsonable_encoder(...))``.
+* ``response_model``: returning a dict and letting FastAPI validate it against
+  ``response_model`` before ``jsonable_encoder`` and ``JSONResponse``.
+* ``fast``: ``FastJSONResponse`` serializing the pydantic model (or dict) directly.
+
+Run it from the repository root::
+
+    python benchmarks/serialization.py --output benchmarks/results/serialization.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from api.schemas.openai import OpenAIResponse  # noqa: E402
+from api.schemas.usage import UsageReport  # noqa: E402
+from dependencies.responses import FastJSONResponse  # noqa: E402
+
+
+def usage_report(buckets: int) -> dict:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return {
+        "user_id": 1,
+        "granularity": "hour",
+        "start": start,
+        "end": start + timedelta(hours=buckets),
+        "latency_buckets_ms": [100, 250, 500, 1000, 2500, 5000, 10000],
+        "buckets": [
+            {
+                "bucket_start": start + timedelta(hours=i),
+                "endpoint": "/api/v1/openai/complete",
+                "request_count": 120,
+                "error_count": 2,
+                "latency_sum_ms": 48000,
+                "latency_histogram": [10, 40, 50, 15, 3, 1, 1, 0],
+                "prompt_tokens": 9000,
+                "completion_tokens": 4000,
+                "total_tokens": 13000,
+            }
+            for i in range(buckets)
+        ],
+    }
+
+
+PAYLOADS = {
+    "completion_small": (OpenAIResponse, {"response": "Bonjour le monde."}),
+    "completion_4kb": (OpenAIResponse, {"response": "The quick brown fox jumps over the lazy dog. " * 91}),
+    "usage_report_744": (UsageReport, usage_report(744)),
+}
+
+
+def paths(schema, payload: dict) -> Dict[str, Callable[[], bytes]]:
+    adapter = TypeAdapter(schema)
+    model = schema.model_validate(payload)
+    # A route builds its model either way; only the serialization work differs.
+    return {
+        "jsonable_encoder": lambda: JSONResponse(content=jsonable_encoder(model)).body,
+        "response_model": lambda: JSONResponse(content=jsonable_encoder(adapter.validate_python(payload))).body,
+        "fast": lambda: FastJSONResponse(content=model).body,
+    }
+
+
+def measure(fn: Callable[[], bytes], min_time: float) -> float:
+    """Returns the CPU microseconds per call, running at least ``min_time`` CPU seconds."""
+    for _ in range(10):
+        fn()
+    calls = 0
+    start = time.process_time()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(50):
+            fn()
+        calls += 50
+        elapsed = time.process_time() - start
+    return elapsed / calls * 1_000_000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-time", type=float, default=1.0, help="CPU seconds to measure each path for.")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "serialization.json"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    results: Dict[str, Dict[str, float]] = {}
+    for name, (schema, payload) in PAYLOADS.items():
+        timings = {path: round(measure(fn, args.min_time), 3) for path, fn in paths(schema, payload).items()}
+        saved = timings["jsonable_encoder"] - timings["fast"]
+        timings["cpu_saved_us"] = round(saved, 3)
+        timings["speedup"] = round(timings["jsonable_encoder"] / timings["fast"], 2)
+        results[name] = timings
+        print(
+            f"{name:<18} jsonable_encoder={timings['jsonable_encoder']:>9.2f}us "
+            f"response_model={timings['response_model']:>9.2f}us fast={timings['fast']:>8.2f}us "
+            f"saved={saved:>9.2f}us/request ({timings['speedup']}x)"
+        )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "min_time": args.min_time,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
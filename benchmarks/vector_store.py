@@ -0,0 +1,111 @@
+"""
+Vector store search benchmark.
+
+Appends ``--entries`` random unit vectors to a collection in a temporary directory
+(in segments of ``--segment-rows``), reopens it as another worker would, and measures
+the top-k search latency with and without a metadata filter matching a tenth of the
+documents. Exits with status 1 when the median unfiltered search exceeds ``--budget-ms``::
+
+    python benchmarks/vector_store.py --entries 100000 --dimensions 256
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from dependencies.vector_store import Collection  # noqa: E402
+
+
+def timings_ms(fn: Callable[[np.ndarray], object], queries: List[np.ndarray]) -> Dict[str, float]:
+    for query in queries[:10]:
+        fn(query)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 4),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 4),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--segment-rows", type=int, default=65536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=25.0, help="Maximum median unfiltered search time.")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "vector_store.json"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.entries, args.dimensions)).astype(np.float32)
+    queries = list(rng.standard_normal((args.queries, args.dimensions)).astype(np.float32))
+
+    with tempfile.TemporaryDirectory() as path:
+        writer = Collection.create(path, "benchmark", args.dimensions, args.segment_rows)
+        start = time.perf_counter()
+        for batch in range(0, args.entries, 2048):
+            rows = range(batch, min(batch + 2048, args.entries))
+            writer.add(vectors[batch : rows.stop], [str(i) for i in rows], [""] * len(rows), [{"shard": i % 10} for i in rows])
+        insert_us = (time.perf_counter() - start) / args.entries * 1_000_000
+
+        start = time.perf_counter()
+        reader = Collection.open(path, args.segment_rows)
+        open_ms = (time.perf_counter() - start) * 1000
+        results = {
+            "search": timings_ms(lambda query: reader.search(query, args.k), queries),
+            "filtered_search": timings_ms(lambda query: reader.search(query, args.k, {"shard": 3}), queries),
+            "insert_us": round(insert_us, 2),
+            "open_ms": round(open_ms, 2),
+        }
+    print(
+        f"{args.entries} entries x {args.dimensions} dims, top {args.k}: search p50={results['search']['p50_ms']:.3f}ms "
+        f"p99={results['search']['p99_ms']:.3f}ms, filtered p50={results['filtered_search']['p50_ms']:.3f}ms, "
+        f"insert={results['insert_us']:.1f}us, open={results['open_ms']:.1f}ms"
+    )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "entries": args.entries,
+            "dimensions": args.dimensions,
+            "segment_rows": args.segment_rows,
+            "k": args.k,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if results["search"]["p50_ms"] > args.budget_ms:
+        print(f"Median search time is over the {args.budget_ms}ms budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
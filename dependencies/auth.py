@@ -1,12 +1,16 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
-from . import schemas
+from api.schemas.user import TokenData
 from .config import settings
 from .database import get_db
-from .models import User
+from .deadline import check_deadline
+from models.user import User
+from .timing import stage
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -25,6 +29,9 @@ def create_access_token(data: dict) -> str:
     Returns:
         str: The encoded JWT access token.
     """
+    # jose (and the crypto backends it loads) is imported on first use to keep startup fast.
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -32,7 +39,7 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-def verify_access_token(token: str, credentials_exception) -> schemas.TokenData:
+def verify_access_token(token: str, credentials_exception) -> TokenData:
     """
     Verifies a JWT access token.
 
@@ -41,17 +48,20 @@ def verify_access_token(token: str, credentials_exception) -> schemas.TokenData:
         credentials_exception: An HTTPException to raise if the token is invalid.
 
     Returns:
-        schemas.TokenData: The decoded token data.
+        TokenData: The decoded token data.
 
     Raises:
         HTTPException: If the token is invalid or expired.
     """
+    from jose import JWTError, jwt
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage("jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         id: str = payload.get("sub")
         if id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(id=id)
+        token_data = TokenData(id=id)
     except JWTError:
         raise credentials_exception
     return token_data
@@ -71,13 +81,54 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     Raises:
         HTTPException: If the token is invalid or the user is not found.
     """
+    return user_from_token(token, db)
+
+def user_from_token(token: Optional[str], db: Session) -> User:
+    """
+    Looks up the user an access token was issued to, e.g. once for a whole WebSocket connection.
+
+    Args:
+        token (str, optional): The JWT access token; None when the client sent none.
+        db (Session): The database session.
+
+    Returns:
+        User: The user the token belongs to.
+
+    Raises:
+        HTTPException: If the token is missing, invalid or expired, or the user is not found; 504 if the
+            request's deadline passed before the user was looked up.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     token_data = verify_access_token(token, credentials_exception)
-    user = db.query(User).filter(User.id == token_data.id).first()
+    check_deadline("auth")
+    with stage("db"):
+        user = db.query(User).filter(User.id == token_data.id).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Retrieves the current user and ensures they are an administrator.
+
+    Args:
+        current_user (User): The authenticated user.
+
+    Returns:
+        User: The current user object.
+
+    Raises:
+        HTTPException: If the user is not an administrator.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator privileges required",
+        )
+    return current_user
@@ -0,0 +1,195 @@
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, List, Optional
+
+from dependencies.credentials import Credential, CredentialPool, parse_credentials
+from dependencies.metrics import BACKEND_EJECTIONS, BACKEND_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated "name=base_url" entries, e.g.
+# "primary=https://api.openai.com/v1,local=http://vllm:8000/v1". A backend uses the keys
+# in OPENAI_BACKEND_<NAME>_API_KEYS if set, else the shared OpenAI keys.
+OPENAI_BACKENDS = os.environ.get("OPENAI_BACKENDS", "")
+# Weight of the newest call in a backend's latency and error rate averages.
+OPENAI_BACKEND_EWMA_ALPHA = float(os.environ.get("OPENAI_BACKEND_EWMA_ALPHA", "0.2"))
+# Seconds over which an unused backend's latency estimate fades, so a backend that was
+# slow once is tried again eventually instead of being avoided forever.
+OPENAI_BACKEND_DECAY_SECONDS = float(os.environ.get("OPENAI_BACKEND_DECAY_SECONDS", "10"))
+# Average error rate above which a backend is ejected, and for how long; doubled for
+# each consecutive ejection up to OPENAI_BACKEND_MAX_EJECT_SECONDS.
+OPENAI_BACKEND_MAX_ERROR_RATE = float(os.environ.get("OPENAI_BACKEND_MAX_ERROR_RATE", "0.5"))
+OPENAI_BACKEND_EJECT_SECONDS = float(os.environ.get("OPENAI_BACKEND_EJECT_SECONDS", "10"))
+OPENAI_BACKEND_MAX_EJECT_SECONDS = float(os.environ.get("OPENAI_BACKEND_MAX_EJECT_SECONDS", "300"))
+
+
+class Backend:
+    """
+    One OpenAI-compatible endpoint with its keys and live latency and error statistics.
+
+    ``latency`` and ``error_rate`` are exponentially weighted moving averages over the
+    backend's recent calls. Errors are 5xx responses and connection failures; other
+    responses (including 4xx) show the backend itself is serving.
+    """
+
+    def __init__(self, name: str, base_url: Optional[str], pool: CredentialPool):
+        self.name = name
+        self.base_url = base_url
+        self.pool = pool
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.observed_at: Optional[float] = None
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self.consecutive_ejections = 0
+
+    def cost(self, now: float) -> float:
+        """
+        Expected cost of sending one more call here; lower is better.
+
+        The latency estimate, scaled by the calls already in flight and inflated by the
+        error rate. A backend without any observations yet costs nothing, so it is tried.
+        """
+        if self.observed_at is None:
+            return 0.0
+        latency = self.latency * math.exp(-(now - self.observed_at) / OPENAI_BACKEND_DECAY_SECONDS)
+        return latency * (self.in_flight + 1) / max(1.0 - self.error_rate, 0.01)
+
+    def observe(self, seconds: float, failed: bool, now: float) -> None:
+        if self.observed_at is None:
+            self.latency = seconds
+        else:
+            self.latency += OPENAI_BACKEND_EWMA_ALPHA * (seconds - self.latency)
+        self.error_rate += OPENAI_BACKEND_EWMA_ALPHA * (float(failed) - self.error_rate)
+        self.observed_at = now
+
+
+class BackendPool:
+    """
+    Routes upstream calls across OpenAI-compatible backends by latency and error rate.
+
+    ``acquire`` uses power-of-two-choices: it samples two available backends at random
+    and takes the one with the lower ``Backend.cost``. That sends most calls to the
+    fastest, healthiest backend while still spreading load when it queues up, without
+    every worker herding onto the same one. ``release`` folds the call's latency and
+    outcome back in. A backend whose error rate passes ``OPENAI_BACKEND_MAX_ERROR_RATE``
+    is ejected for ``OPENAI_BACKEND_EJECT_SECONDS`` (doubling while it keeps failing),
+    unless it is the last backend still available.
+    """
+
+    def __init__(self, backends: List[Backend], rng: Optional[random.Random] = None):
+        """
+        Args:
+            backends (List[Backend]): The backends to route across; the first is the primary.
+            rng (random.Random, optional): Source of the random choices, for reproducible tests.
+        """
+        if not backends:
+            raise ValueError("A backend pool needs at least one backend.")
+        self.backends = backends
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def acquire(self, exclude: Optional[List[Backend]] = None) -> Backend:
+        """
+        Picks a backend for one call and marks the call as in flight on it.
+
+        Args:
+            exclude (List[Backend], optional): Backends that already failed this call; used only if nothing else is left.
+
+        Returns:
+            Backend: The chosen backend. When every backend is ejected, the one that returns soonest.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [b for b in self.backends if b.ejected_until <= now]
+            candidates = [b for b in available if not (exclude and b in exclude)] or available
+            # Prefer backends with a key that is not rate-limited right now.
+            candidates = [b for b in candidates if b.pool.available(now)] or candidates
+            if not candidates:
+                backend = min(self.backends, key=lambda b: b.ejected_until)
+            elif len(candidates) == 1:
+                backend = candidates[0]
+            else:
+                first, second = self._rng.sample(candidates, 2)
+                backend = first if first.cost(now) <= second.cost(now) else second
+            backend.in_flight += 1
+            return backend
+
+    def release(self, backend: Backend, seconds: Optional[float] = None, failed: bool = False) -> None:
+        """
+        Ends a call started with ``acquire``.
+
+        Args:
+            backend (Backend): The backend the call used.
+            seconds (float, optional): How long the call took; None when it was abandoned (e.g. cancelled)
+                and says nothing about the backend.
+            failed (bool, optional): The backend answered with a 5xx or could not be reached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            backend.in_flight -= 1
+            if seconds is None:
+                return
+            backend.observe(seconds, failed, now)
+            BACKEND_REQUESTS.labels(backend.name, "error" if failed else "ok").inc()
+            if not failed:
+                if backend.error_rate < OPENAI_BACKEND_MAX_ERROR_RATE:
+                    backend.consecutive_ejections = 0
+            elif backend.error_rate > OPENAI_BACKEND_MAX_ERROR_RATE and backend.ejected_until <= now:
+                self._eject(backend, now)
+
+    def _eject(self, backend: Backend, now: float) -> None:
+        if not any(other is not backend and other.ejected_until <= now for other in self.backends):
+            return
+        backend.consecutive_ejections += 1
+        seconds = min(
+            OPENAI_BACKEND_EJECT_SECONDS * 2 ** (backend.consecutive_ejections - 1), OPENAI_BACKEND_MAX_EJECT_SECONDS
+        )
+        backend.ejected_until = now + seconds
+        # Back at the threshold on return: a failure ejects it again, successes bring it back under.
+        backend.error_rate = OPENAI_BACKEND_MAX_ERROR_RATE
+        BACKEND_EJECTIONS.labels(backend.name).inc()
+        logger.warning(f"Ejecting OpenAI backend {backend.name} for {seconds:.1f}s (error rate above {OPENAI_BACKEND_MAX_ERROR_RATE:.0%})")
+
+
+def parse_backends(
+    value: str,
+    default_credentials: Callable[[], List[Credential]],
+    organization: Optional[str] = None,
+) -> List[Backend]:
+    """
+    Parses ``OPENAI_BACKENDS``: comma-separated ``name=base_url`` entries.
+
+    Args:
+        value (str): The setting's value.
+        default_credentials (Callable): Builds the keys of a backend without ``OPENAI_BACKEND_<NAME>_API_KEYS``.
+        organization (str, optional): Organization for keys that do not name one.
+
+    Returns:
+        List[Backend]: One backend per entry, in order, each with its own key pool.
+    """
+    backends = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, separator, base_url = entry.partition("=")
+        if not separator or not name.strip() or not base_url.strip():
+            raise ValueError(f"Invalid OPENAI_BACKENDS entry {entry!r}; expected name=base_url.")
+        name = name.strip()
+        keys = os.environ.get(f"OPENAI_BACKEND_{re.sub(r'[^A-Z0-9]', '_', name.upper())}_API_KEYS", "")
+        credentials = parse_credentials(keys, organization) or default_credentials()
+        backends.append(Backend(name, base_url.strip(), CredentialPool(credentials)))
+    return backends
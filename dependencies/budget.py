@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
+
+from dependencies.auth import get_current_user
+from dependencies.database import SessionLocal
+from dependencies.metrics import BUDGET_REJECTIONS
+from dependencies.token_usage import count_tokens
+from models.api_usage import ApiUsage  # noqa: F401  (maps User.api_usages in a worker started on its own)
+from models.budget_counter import BudgetCounter
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Requests and upstream tokens each user may use per sliding minute and day; 0 means no limit.
+BUDGET_REQUESTS_PER_MINUTE = int(os.environ.get("BUDGET_REQUESTS_PER_MINUTE", "0"))
+BUDGET_REQUESTS_PER_DAY = int(os.environ.get("BUDGET_REQUESTS_PER_DAY", "0"))
+BUDGET_TOKENS_PER_MINUTE = int(os.environ.get("BUDGET_TOKENS_PER_MINUTE", "0"))
+BUDGET_TOKENS_PER_DAY = int(os.environ.get("BUDGET_TOKENS_PER_DAY", "0"))
+# Seconds between exchanges of counts with the other workers through the database. In
+# between, a worker only sees its own traffic, so a user may overshoot a budget by what
+# the other workers admitted since the last exchange.
+BUDGET_SYNC_INTERVAL = float(os.environ.get("BUDGET_SYNC_INTERVAL", "1"))
+# Rows each user's count of a window is spread over; a worker writes to the shard of its pid.
+BUDGET_COUNTER_SHARDS = int(os.environ.get("BUDGET_COUNTER_SHARDS", "16"))
+
+MINUTE = "minute"
+DAY = "day"
+WINDOWS = {MINUTE: 60, DAY: 86400}
+
+# Indexes into a window's counts.
+REQUESTS = 0
+TOKENS = 1
+
+# What each budget counts, and over which window.
+BUDGETS = {
+    "requests_per_minute": (MINUTE, REQUESTS),
+    "requests_per_day": (DAY, REQUESTS),
+    "tokens_per_minute": (MINUTE, TOKENS),
+    "tokens_per_day": (DAY, TOKENS),
+}
+
+# Seconds between deletions of counter rows of windows gone by.
+_CLEANUP_INTERVAL = 60.0
+
+CounterKey = Tuple[int, str, int]
+
+
+class SlidingWindow:
+    """
+    A user's requests and tokens over the last ``length`` seconds, in constant time and space.
+
+    Counts are kept for the current fixed window and the one before it. The sliding
+    count is the current one plus the previous one weighted by how much of it the
+    sliding window still covers, which assumes the previous window's traffic was spread
+    evenly but needs no timestamp per request.
+    """
+
+    __slots__ = ("length", "start", "current", "previous")
+
+    def __init__(self, length: int):
+        self.length = length
+        self.start = 0
+        self.current = [0, 0]
+        self.previous = [0, 0]
+
+    def roll(self, now: float) -> int:
+        """Moves on to the fixed window ``now`` falls in, if it is a later one, and returns its start."""
+        start = int(now // self.length) * self.length
+        if start > self.start:
+            self.previous = self.current if start - self.start == self.length else [0, 0]
+            self.current = [0, 0]
+            self.start = start
+        return self.start
+
+    def count(self, now: float, kind: int) -> float:
+        self.roll(now)
+        return self.previous[kind] * (1 - (now - self.start) / self.length) + self.current[kind]
+
+    def retry_after(self, now: float, kind: int, allowed: float) -> float:
+        """Seconds until the count is down to ``allowed``, if nothing more is counted."""
+        self.roll(now)
+        elapsed = now - self.start
+        current, previous = self.current[kind], self.previous[kind]
+        if current > allowed:
+            # Only the next window weights this one down: current * (1 - t / length) <= allowed.
+            return self.length - elapsed + self.length * (1 - allowed / current)
+        if not previous:
+            return 0.0
+        # previous * (1 - t / length) + current <= allowed
+        return self.length * (1 - (allowed - current) / previous) - elapsed
+
+    def apply(self, start: int, counts: List[int]) -> None:
+        """Replaces the counts of the fixed window starting at ``start``, if it is one of the two kept."""
+        if start == self.start:
+            self.current = counts
+        elif start == self.start - self.length:
+            self.previous = counts
+
+    def empty(self) -> bool:
+        return not any(self.current) and not any(self.previous)
+
+
+class UserBudgets:
+    """
+    Enforces per-user request and token budgets over sliding minute and day windows.
+
+    Each worker checks and counts in memory, in constant time per request, and every
+    ``sync_interval`` seconds exchanges its counts with the other workers and nodes
+    through the ``budget_counters`` table: it adds what it counted since the last
+    exchange onto its own shard of each window, then reads back the sums over all
+    shards. Workers thus write different rows, so a busy user's counts do not queue
+    every worker's flush on one row lock.
+
+    A request is admitted while it fits the request budgets and some of each token
+    budget is left; its upstream tokens are counted once it finishes, as only then
+    are they known.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        session_factory: sessionmaker = SessionLocal,
+        sync_interval: float = BUDGET_SYNC_INTERVAL,
+        shards: int = BUDGET_COUNTER_SHARDS,
+        shard: Optional[int] = None,
+        clock=time.time,
+    ):
+        """
+        Args:
+            limits (Dict[str, int], optional): Budget per name in ``BUDGETS``; missing or 0 means none.
+                Defaults to the ``BUDGET_*`` settings.
+            session_factory (sessionmaker, optional): Opens the sessions of the exchanges. Defaults to ``SessionLocal``.
+            sync_interval (float, optional): Seconds between exchanges. Defaults to ``BUDGET_SYNC_INTERVAL``.
+            shards (int, optional): Rows per user and window. Defaults to ``BUDGET_COUNTER_SHARDS``.
+            shard (int, optional): The shard this worker writes. Defaults to the process id modulo ``shards``,
+                taken at the first exchange so workers forked from a preloaded app differ.
+            clock (callable, optional): Returns the time in Unix seconds. Defaults to ``time.time``.
+        """
+        if limits is None:
+            limits = {
+                "requests_per_minute": BUDGET_REQUESTS_PER_MINUTE,
+                "requests_per_day": BUDGET_REQUESTS_PER_DAY,
+                "tokens_per_minute": BUDGET_TOKENS_PER_MINUTE,
+                "tokens_per_day": BUDGET_TOKENS_PER_DAY,
+            }
+        self.limits = {name: limit for name, limit in limits.items() if limit > 0}
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self.shards = shards
+        self.shard = shard
+        self.clock = clock
+        self.windows: Dict[int, Dict[str, SlidingWindow]] = {}
+        # Counted here but not yet added to the shared store, per user and fixed window.
+        self._pending: Dict[CounterKey, List[int]] = {}
+        self._cleaned = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def admit(self, user_id: int) -> None:
+        """
+        Counts a request of the user, unless it would go over one of their budgets.
+
+        Raises:
+            HTTPException: 429, with a Retry-After of when the budget allows the request, if it does not now.
+        """
+        if not self.limits:
+            return
+        now = self.clock()
+        windows = self._windows_of(user_id)
+        for name, limit in self.limits.items():
+            window, kind = BUDGETS[name]
+            counter = windows[window]
+            # A request needs one more of the request budget, and at least one token left of the token budget.
+            if counter.count(now, kind) + 1 > limit:
+                BUDGET_REJECTIONS.labels(name).inc()
+                retry_after = counter.retry_after(now, kind, limit - 1)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Budget of {limit} {name.replace('_', ' ')} used up. Please try again later.",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                )
+        self._add(user_id, now, REQUESTS, 1)
+
+    def charge(self, user_id: int, tokens: int) -> None:
+        """Counts upstream tokens a request of the user used."""
+        if self.limits and tokens > 0:
+            self._add(user_id, self.clock(), TOKENS, tokens)
+
+    def _windows_of(self, user_id: int) -> Dict[str, SlidingWindow]:
+        windows = self.windows.get(user_id)
+        if windows is None:
+            windows = self.windows[user_id] = {window: SlidingWindow(length) for window, length in WINDOWS.items()}
+        return windows
+
+    def _add(self, user_id: int, now: float, kind: int, amount: int) -> None:
+        for window, counter in self._windows_of(user_id).items():
+            start = counter.roll(now)
+            counter.current[kind] += amount
+            pending = self._pending.get((user_id, window, start))
+            if pending is None:
+                pending = self._pending[(user_id, window, start)] = [0, 0]
+            pending[kind] += amount
+
+    async def sync(self) -> None:
+        """Adds what was counted since the last sync to the shared store and takes in everyone's totals."""
+        if not self.windows and not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            totals = await run_in_threadpool(self._exchange, pending, list(self.windows), self.clock())
+        except Exception as e:
+            self._restore(pending)
+            logger.error(f"Error syncing user budgets: {e}")
+            return
+        now = self.clock()
+        for (user_id, window, start), counts in totals.items():
+            counter = self.windows.get(user_id, {}).get(window)
+            if counter is None:
+                continue
+            counter.roll(now)
+            # Counted here while the exchange ran, so not in the totals yet.
+            local = self._pending.get((user_id, window, start))
+            if local is not None:
+                counts = [counts[REQUESTS] + local[REQUESTS], counts[TOKENS] + local[TOKENS]]
+            counter.apply(start, counts)
+        self._evict(now)
+
+    async def run(self) -> None:
+        """Syncs every ``sync_interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    def _exchange(self, pending: Dict[CounterKey, List[int]], user_ids: Sequence[int], now: float) -> Dict[CounterKey, List[int]]:
+        if self.shard is None:
+            self.shard = os.getpid() % self.shards
+        db = self.session_factory()
+        try:
+            if pending:
+                db.execute(
+                    self._upsert_statement(db),
+                    [
+                        {"user_id": user_id, "window": window, "window_start": start, "shard": self.shard, "requests": counts[REQUESTS], "tokens": counts[TOKENS]}
+                        for (user_id, window, start), counts in pending.items()
+                    ],
+                )
+            totals = {}
+            if user_ids:
+                current = []
+                for window, length in WINDOWS.items():
+                    start = int(now // length) * length
+                    current.append(and_(BudgetCounter.window == window, BudgetCounter.window_start.in_((start, start - length))))
+                rows = db.execute(
+                    select(
+                        BudgetCounter.user_id,
+                        BudgetCounter.window,
+                        BudgetCounter.window_start,
+                        func.sum(BudgetCounter.requests),
+                        func.sum(BudgetCounter.tokens),
+                    )
+                    .where(BudgetCounter.user_id.in_(user_ids), or_(*current))
+                    .group_by(BudgetCounter.user_id, BudgetCounter.window, BudgetCounter.window_start)
+                )
+                totals = {(user_id, window, start): [int(requests), int(tokens)] for user_id, window, start, requests, tokens in rows}
+            if now - self._cleaned >= _CLEANUP_INTERVAL:
+                # Windows before the previous one no longer count towards any budget.
+                db.execute(
+                    delete(BudgetCounter).where(
+                        or_(
+                            *(
+                                and_(BudgetCounter.window == window, BudgetCounter.window_start < int(now // length) * length - length)
+                                for window, length in WINDOWS.items()
+                            )
+                        )
+                    )
+                )
+                self._cleaned = now
+            db.commit()
+            return totals
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upsert_statement(db: Session):
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(BudgetCounter)
+        return statement.on_conflict_do_update(
+            index_elements=["user_id", "window", "window_start", "shard"],
+            set_={
+                "requests": BudgetCounter.requests + statement.excluded.requests,
+                "tokens": BudgetCounter.tokens + statement.excluded.tokens,
+            },
+        )
+
+    def _restore(self, pending: Dict[CounterKey, List[int]]) -> None:
+        """Puts counts back after a failed exchange, so the next one adds them."""
+        for key, counts in pending.items():
+            current = self._pending.get(key)
+            if current is None:
+                self._pending[key] = counts
+            else:
+                current[REQUESTS] += counts[REQUESTS]
+                current[TOKENS] += counts[TOKENS]
+
+    def _evict(self, now: float) -> None:
+        """Forgets users with nothing counted in any window kept, so idle users take no memory."""
+        pending_users = {user_id for user_id, _, _ in self._pending}
+        for user_id in list(self.windows):
+            windows = self.windows[user_id]
+            if user_id in pending_users:
+                continue
+            for counter in windows.values():
+                counter.roll(now)
+            if all(counter.empty() for counter in windows.values()):
+                del self.windows[user_id]
+
+
+user_budgets = UserBudgets()
+
+
+async def enforce_budget(current_user: User = Depends(get_current_user)):
+    """
+    Route dependency turning away requests over the user's budgets with a 429, and counting the tokens the request used.
+
+    Listed before ``fair_share``, so requests over budget do not queue for a slot.
+    """
+    user_budgets.admit(current_user.id)
+    with count_tokens() as tally:
+        try:
+            yield
+        finally:
+            user_budgets.charge(current_user.id, tally.total_tokens)
@@ -0,0 +1,141 @@
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# The fast model tried first when a completion asks for cascade mode.
+OPENAI_CASCADE_MODEL = os.environ.get("OPENAI_CASCADE_MODEL", "text-curie-001")
+# Semicolon-separated acceptance checks, "name" or "name=value"; the fast model's answer
+# is returned only if every check passes. See ACCEPTANCE_CHECKS for the names.
+OPENAI_CASCADE_CHECKS = os.environ.get("OPENAI_CASCADE_CHECKS", "min_length=1")
+
+AcceptanceCheck = Callable[["Candidate"], bool]
+
+
+class Candidate:
+    """The fast model's completion, as seen by the acceptance checks."""
+
+    __slots__ = ("text", "finish_reason", "token_logprobs")
+
+    def __init__(self, text: str, finish_reason: Optional[str] = None, token_logprobs: Optional[List[float]] = None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.token_logprobs = token_logprobs
+
+    @classmethod
+    def from_choice(cls, choice: Any) -> "Candidate":
+        logprobs = getattr(choice, "logprobs", None)
+        token_logprobs = getattr(logprobs, "token_logprobs", None) if logprobs is not None else None
+        return cls(choice.text, getattr(choice, "finish_reason", None), token_logprobs)
+
+    @property
+    def mean_logprob(self) -> Optional[float]:
+        values = [value for value in self.token_logprobs or () if value is not None]
+        return sum(values) / len(values) if values else None
+
+
+# name -> (factory building the check from its configured value, whether it needs logprobs)
+ACCEPTANCE_CHECKS: Dict[str, Tuple[Callable[[Optional[str]], AcceptanceCheck], bool]] = {}
+
+
+def acceptance_check(name: str, logprobs: bool = False):
+    """
+    Registers an acceptance check factory under ``name`` for use in ``OPENAI_CASCADE_CHECKS``.
+
+    Args:
+        name (str): The name used in the setting.
+        logprobs (bool, optional): The check reads token logprobs, so the fast model is asked for them.
+    """
+
+    def register(factory: Callable[[Optional[str]], AcceptanceCheck]):
+        ACCEPTANCE_CHECKS[name] = (factory, logprobs)
+        return factory
+
+    return register
+
+
+@acceptance_check("min_length")
+def min_length(value: Optional[str]) -> AcceptanceCheck:
+    """Accepts answers of at least ``value`` characters, ignoring surrounding whitespace."""
+    length = int(value or 1)
+    return lambda candidate: len(candidate.text.strip()) >= length
+
+
+@acceptance_check("min_logprob", logprobs=True)
+def min_logprob(value: Optional[str]) -> AcceptanceCheck:
+    """Accepts answers whose mean token logprob is at least ``value``; answers without logprobs escalate."""
+    threshold = float(value)
+
+    def check(candidate: Candidate) -> bool:
+        mean = candidate.mean_logprob
+        return mean is not None and mean >= threshold
+
+    return check
+
+
+@acceptance_check("reject")
+def reject(value: Optional[str]) -> AcceptanceCheck:
+    """Escalates answers matching the regular expression ``value``, e.g. refusals or "I don't know"."""
+    pattern = re.compile(value)
+    return lambda candidate: pattern.search(candidate.text) is None
+
+
+@acceptance_check("require")
+def require(value: Optional[str]) -> AcceptanceCheck:
+    """Accepts only answers matching the regular expression ``value``."""
+    pattern = re.compile(value)
+    return lambda candidate: pattern.search(candidate.text) is not None
+
+
+@acceptance_check("complete")
+def complete(value: Optional[str]) -> AcceptanceCheck:
+    """Escalates answers cut off by ``max_tokens``."""
+    return lambda candidate: candidate.finish_reason != "length"
+
+
+class Cascade:
+    """
+    Tries a fast, cheap model first and escalates to the requested model only when needed.
+
+    The fast model's answer is kept if every acceptance check passes; otherwise the first
+    failing check is reported as the reason and the caller retries on the larger model.
+    """
+
+    def __init__(self, model: str, checks: List[Tuple[str, AcceptanceCheck]], logprobs: bool = False):
+        """
+        Args:
+            model (str): The fast model.
+            checks (List[Tuple[str, AcceptanceCheck]]): Named checks, evaluated in order.
+            logprobs (bool, optional): Ask the fast model for token logprobs.
+        """
+        self.model = model
+        self.checks = checks
+        self.logprobs = logprobs
+
+    @classmethod
+    def from_spec(cls, model: str, spec: str) -> "Cascade":
+        """
+        Builds a cascade from an ``OPENAI_CASCADE_CHECKS`` value such as ``"min_length=20;min_logprob=-1.5"``.
+
+        Raises:
+            ValueError: If a check name is unknown.
+        """
+        checks, logprobs = [], False
+        for entry in spec.split(";"):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, separator, value = entry.partition("=")
+            name = name.strip()
+            if name not in ACCEPTANCE_CHECKS:
+                raise ValueError(f"Unknown cascade check {name!r}. Choose from: {', '.join(sorted(ACCEPTANCE_CHECKS))}")
+            factory, needs_logprobs = ACCEPTANCE_CHECKS[name]
+            checks.append((name, factory(value if separator else None)))
+            logprobs = logprobs or needs_logprobs
+        return cls(model, checks, logprobs)
+
+    def evaluate(self, candidate: Candidate) -> Optional[str]:
+        """Returns the name of the first failing check, or None if the answer is accepted."""
+        for name, check in self.checks:
+            if not check(candidate):
+                return name
+        return None
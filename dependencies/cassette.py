@@ -0,0 +1,246 @@
+import asyncio
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# off: talk to upstream only. record: talk to upstream and save every exchange.
+# replay: serve saved exchanges only, failing on a miss. replay_or_record: replay
+# when a saved exchange exists, otherwise go upstream and record it.
+CASSETTE_MODES = ("off", "record", "replay", "replay_or_record")
+
+OPENAI_CASSETTE_MODE = os.environ.get("OPENAI_CASSETTE_MODE", "off")
+OPENAI_CASSETTE_PATH = os.environ.get("OPENAI_CASSETTE_PATH", "cassettes")
+OPENAI_CASSETTE_REALTIME = os.environ.get("OPENAI_CASSETTE_REALTIME", "false").lower() == "true"
+OPENAI_CASSETTE_TIMING_SCALE = float(os.environ.get("OPENAI_CASSETTE_TIMING_SCALE", "1.0"))
+
+# Request body fields that do not change the upstream answer and would make otherwise
+# identical requests hash differently.
+VOLATILE_BODY_FIELDS = frozenset({"user"})
+
+CASSETTE_SUFFIX = ".jsonl.gz"
+
+
+class CassetteMissError(httpx.TransportError):
+    """Raised in replay mode when no recorded exchange matches a request."""
+
+
+def request_key(method: str, path: str, query: bytes, body: bytes) -> str:
+    """
+    Returns the normalized hash identifying a request in a cassette.
+
+    Hosts, headers (including the API key) and JSON key order are ignored, so the same
+    call made against a different base URL or with a different key replays the same
+    recording.
+    """
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        payload = body.decode("latin-1")
+    if isinstance(payload, dict):
+        payload = {key: value for key, value in payload.items() if key not in VOLATILE_BODY_FIELDS}
+    canonical = json.dumps(
+        [method.upper(), path, sorted(httpx.QueryParams(query.decode("ascii")).multi_items()), payload],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    An on-disk set of recorded upstream exchanges, indexed by normalized request hash.
+
+    Exchanges are stored as gzip-compressed JSON lines. Each ``record`` appends a new
+    gzip member, which keeps files append-only and still readable as one gzip stream.
+    ``path`` may be a single file or a directory; a directory is loaded in full and
+    new recordings go to a per-process file inside it so gunicorn workers never append
+    to the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[dict]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self.load()
+
+    @property
+    def record_path(self) -> str:
+        if self.path.endswith(CASSETTE_SUFFIX):
+            return self.path
+        return os.path.join(self.path, f"recorded-{os.getpid()}{CASSETTE_SUFFIX}")
+
+    def load(self) -> None:
+        if self.path.endswith(CASSETTE_SUFFIX):
+            files = [self.path] if os.path.exists(self.path) else []
+        else:
+            files = sorted(glob.glob(os.path.join(self.path, f"*{CASSETTE_SUFFIX}")))
+        for file in files:
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self._index[exchange["key"]].append(exchange)
+        logger.info(f"Loaded {len(self)} recorded exchanges from {self.path}")
+
+    def __len__(self) -> int:
+        return sum(len(exchanges) for exchanges in self._index.values())
+
+    def find(self, key: str) -> Optional[dict]:
+        """
+        Returns the next recorded exchange for ``key`` in O(1).
+
+        Repeated identical requests replay their recordings in the order they were made
+        and wrap around once all have been served, so replays are deterministic.
+        """
+        with self._lock:
+            exchanges = self._index.get(key)
+            if not exchanges:
+                return None
+            cursor = self._cursors[key]
+            self._cursors[key] = cursor + 1
+            return exchanges[cursor % len(exchanges)]
+
+    def record(self, exchange: dict) -> None:
+        with self._lock:
+            self._index[exchange["key"]].append(exchange)
+            directory = os.path.dirname(self.record_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with gzip.open(self.record_path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(exchange, separators=(",", ":")) + "\n")
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes upstream chunks through while capturing them with their arrival offsets."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, exchange: dict, started: float, cassette: Cassette):
+        self._stream = stream
+        self._exchange = exchange
+        self._started = started
+        self._cassette = cassette
+        self._complete = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._exchange["chunks"].append(
+                [round(time.perf_counter() - self._started, 6), base64.b64encode(chunk).decode("ascii")]
+            )
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        # Partially read responses (e.g. a cancelled stream) are not worth replaying.
+        if self._complete:
+            self._cassette.record(self._exchange)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Yields recorded chunks, optionally waiting until each chunk's original offset."""
+
+    def __init__(self, chunks: List[list], realtime: bool, timing_scale: float, started: float):
+        self._chunks = chunks
+        self._realtime = realtime
+        self._timing_scale = timing_scale
+        self._started = started
+
+    async def __aiter__(self):
+        for offset, data in self._chunks:
+            if self._realtime:
+                delay = offset * self._timing_scale - (time.perf_counter() - self._started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield base64.b64decode(data)
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records upstream exchanges to, or replays them from, a cassette.
+
+    Sits underneath the OpenAI client, so everything above it (retries, streaming,
+    error mapping, metrics) behaves exactly as it does against the real API.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        mode: str = "replay",
+        wrapped: Optional[httpx.AsyncBaseTransport] = None,
+        realtime: bool = False,
+        timing_scale: float = 1.0,
+    ):
+        if mode not in CASSETTE_MODES or mode == "off":
+            raise ValueError(f"Invalid cassette mode {mode!r}. Choose from: record, replay, replay_or_record")
+        self.cassette = cassette
+        self.mode = mode
+        self.wrapped = wrapped or httpx.AsyncHTTPTransport()
+        self.realtime = realtime
+        self.timing_scale = timing_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        body = await request.aread()
+        key = request_key(request.method, request.url.path, request.url.query, body)
+
+        if self.mode in ("replay", "replay_or_record"):
+            exchange = self.cassette.find(key)
+            if exchange is not None:
+                if self.realtime:
+                    delay = exchange["headers_at"] * self.timing_scale
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                return httpx.Response(
+                    status_code=exchange["status"],
+                    headers=exchange["headers"],
+                    stream=_ReplayStream(exchange["chunks"], self.realtime, self.timing_scale, started),
+                    request=request,
+                )
+            if self.mode == "replay":
+                raise CassetteMissError(f"No recorded exchange for {request.method} {request.url.path} ({key[:12]})", request=request)
+
+        response = await self.wrapped.handle_async_request(request)
+        exchange = {
+            "key": key,
+            "method": request.method,
+            "path": request.url.path,
+            "request": body.decode("utf-8", errors="replace"),
+            "status": response.status_code,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in response.headers.raw],
+            "headers_at": round(time.perf_counter() - started, 6),
+            "chunks": [],
+        }
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, exchange, started, self.cassette),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
+
+
+def cassette_transport_from_env() -> Optional[CassetteTransport]:
+    """Builds the transport configured by ``OPENAI_CASSETTE_*``, or None when cassettes are off."""
+    if OPENAI_CASSETTE_MODE == "off":
+        return None
+    return CassetteTransport(
+        Cassette(OPENAI_CASSETTE_PATH),
+        mode=OPENAI_CASSETTE_MODE,
+        realtime=OPENAI_CASSETTE_REALTIME,
+        timing_scale=OPENAI_CASSETTE_TIMING_SCALE,
+    )
@@ -0,0 +1,18 @@
+import os
+
+
+class Settings:
+    """Settings read once from the environment (see .env.example)."""
+
+    def __init__(self):
+        # Key for the upstream calls made without a user's own API key.
+        self.openai_api_key = os.environ.get("OPENAI_API_KEY", "")
+        # Connection URL of the application database.
+        self.database_url = os.environ.get("DATABASE_URL")
+        # Signing key, algorithm and lifetime (minutes) of the JWT access tokens.
+        self.secret_key = os.environ.get("SECRET_KEY", "")
+        self.algorithm = os.environ.get("ALGORITHM", "HS256")
+        self.access_token_expire_minutes = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+
+settings = Settings()
@@ -0,0 +1,356 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Mapping, Optional
+
+from dependencies.metrics import CACHE_LOOKUPS, CREDENTIAL_EJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a key sits out after a 429 without a Retry-After header; doubled for each
+# consecutive 429 up to OPENAI_KEY_MAX_COOLDOWN.
+OPENAI_KEY_COOLDOWN = float(os.environ.get("OPENAI_KEY_COOLDOWN", "1"))
+OPENAI_KEY_MAX_COOLDOWN = float(os.environ.get("OPENAI_KEY_MAX_COOLDOWN", "60"))
+# Seconds a key sits out after the API rejects it (401/403).
+OPENAI_KEY_AUTH_COOLDOWN = float(os.environ.get("OPENAI_KEY_AUTH_COOLDOWN", "300"))
+
+# Bring-your-own-key clients kept per worker, and how long an unused one is kept.
+OPENAI_CLIENT_CACHE_SIZE = int(os.environ.get("OPENAI_CLIENT_CACHE_SIZE", "256"))
+OPENAI_CLIENT_IDLE_SECONDS = float(os.environ.get("OPENAI_CLIENT_IDLE_SECONDS", "600"))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Parses an ``x-ratelimit-reset-*`` duration such as ``"20ms"``, ``"1s"`` or ``"6m0s"``.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if the value is missing or malformed.
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value.strip():
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateBudget:
+    """
+    One upstream rate limit (requests or tokens per minute) as last reported by the API.
+
+    OpenAI refills limits continuously and ``x-ratelimit-reset-*`` is the time until the
+    budget is full again, so between responses the remaining budget is estimated by
+    refilling linearly towards the limit over that time.
+    """
+
+    __slots__ = ("limit", "remaining", "observed_at", "reset_after")
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.observed_at = 0.0
+        self.reset_after = 0.0
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str], now: float) -> None:
+        limit_value, remaining_value = _parse_int(limit), _parse_int(remaining)
+        if not limit_value or remaining_value is None:
+            return
+        self.limit = limit_value
+        self.remaining = remaining_value
+        self.observed_at = now
+        self.reset_after = parse_reset(reset) or 0.0
+
+    def available(self, now: float) -> Optional[float]:
+        """Estimated remaining budget, or None while no limit has been reported."""
+        if self.limit is None:
+            return None
+        elapsed = now - self.observed_at
+        if elapsed >= self.reset_after:
+            return float(self.limit)
+        return self.remaining + (self.limit - self.remaining) * (elapsed / self.reset_after)
+
+
+class Credential:
+    """
+    An OpenAI API key (and optional organization) with its live rate-limit headroom.
+
+    The OpenAI client for the key is attached by ``OpenAIService`` on first use.
+    """
+
+    def __init__(self, api_key: str, organization: Optional[str] = None):
+        self.api_key = api_key
+        self.organization = organization
+        self.requests = RateBudget()
+        self.tokens = RateBudget()
+        self.in_flight = 0
+        self.reserved_tokens = 0
+        self.ejected_until = 0.0
+        self.consecutive_rate_limits = 0
+        self.client: Any = None
+
+    @property
+    def label(self) -> str:
+        """A log- and metric-safe name for the key."""
+        api_key = self.api_key or ""
+        return f"...{api_key[-4:]}" if len(api_key) > 8 else "..."
+
+    def headroom(self, now: float) -> float:
+        """
+        Fraction (0-1) of the tighter of the request and token budgets still free.
+
+        Requests in flight have not been reflected in any response yet, so they (and
+        the tokens reserved for them) are subtracted from the estimate. A key whose
+        limits have not been reported yet counts as fully free.
+        """
+        fractions = []
+        requests = self.requests.available(now)
+        if requests is not None:
+            fractions.append(max(0.0, requests - self.in_flight) / self.requests.limit)
+        tokens = self.tokens.available(now)
+        if tokens is not None:
+            fractions.append(max(0.0, tokens - self.reserved_tokens) / self.tokens.limit)
+        return min(fractions) if fractions else 1.0
+
+    def observe(self, headers: Optional[Mapping[str, str]], now: float) -> None:
+        """Updates the budgets from the ``x-ratelimit-*`` headers of a response."""
+        if not headers:
+            return
+        self.requests.update(
+            headers.get("x-ratelimit-limit-requests"),
+            headers.get("x-ratelimit-remaining-requests"),
+            headers.get("x-ratelimit-reset-requests"),
+            now,
+        )
+        self.tokens.update(
+            headers.get("x-ratelimit-limit-tokens"),
+            headers.get("x-ratelimit-remaining-tokens"),
+            headers.get("x-ratelimit-reset-tokens"),
+            now,
+        )
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait according to ``retry-after-ms`` or ``retry-after``, if present."""
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            continue
+    return None
+
+
+class CredentialPool:
+    """
+    Routes upstream calls across several API keys by live rate-limit headroom.
+
+    ``acquire`` hands out the key with the most headroom, counting the call as in
+    flight until ``release``, which folds the response's rate-limit headers back in.
+    Keys answered with 429 are ejected until their ``Retry-After`` (or an exponential
+    cooldown) passes, and keys the API rejects as unauthorized for
+    ``OPENAI_KEY_AUTH_COOLDOWN`` seconds. Throughput therefore grows with the number
+    of keys instead of being capped by one key's limits.
+    """
+
+    def __init__(self, credentials: List[Credential], label: Optional[str] = None):
+        """
+        Args:
+            credentials (List[Credential]): The keys to route across.
+            label (str, optional): Metric label for all keys of the pool instead of each key's suffix,
+                to keep label cardinality bounded for per-user pools.
+        """
+        if not credentials:
+            raise ValueError("A credential pool needs at least one API key.")
+        self.credentials = credentials
+        self.label = label
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def acquire(self, tokens: int = 0, exclude: Optional[List[Credential]] = None) -> Credential:
+        """
+        Returns the available key with the most headroom and marks a call on it as in flight.
+
+        Args:
+            tokens (int, optional): Tokens the call is expected to consume (prompt plus ``max_tokens``).
+            exclude (List[Credential], optional): Keys already tried for this call; used only if nothing else is left.
+
+        Returns:
+            Credential: The chosen key. When every key is ejected, the one that returns soonest.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.last_used = now
+            candidates = [c for c in self.credentials if c.ejected_until <= now and not (exclude and c in exclude)]
+            if not candidates:
+                candidates = [c for c in self.credentials if c.ejected_until <= now] or [
+                    min(self.credentials, key=lambda c: c.ejected_until)
+                ]
+            credential = max(candidates, key=lambda c: (c.headroom(now), -c.in_flight))
+            credential.in_flight += 1
+            credential.reserved_tokens += tokens
+            return credential
+
+    def release(
+        self,
+        credential: Credential,
+        headers: Optional[Mapping[str, str]] = None,
+        tokens: int = 0,
+        rate_limited: bool = False,
+        unauthorized: bool = False,
+    ) -> None:
+        """
+        Ends a call started with ``acquire``.
+
+        Args:
+            credential (Credential): The key the call used.
+            headers (Mapping[str, str], optional): Response headers carrying ``x-ratelimit-*`` values.
+            tokens (int, optional): The ``tokens`` passed to ``acquire``.
+            rate_limited (bool, optional): The call was answered with 429; ejects the key.
+            unauthorized (bool, optional): The API rejected the key (401/403); ejects the key.
+        """
+        now = time.monotonic()
+        with self._lock:
+            credential.in_flight -= 1
+            credential.reserved_tokens -= tokens
+            credential.observe(headers, now)
+            if rate_limited:
+                credential.consecutive_rate_limits += 1
+                cooldown = retry_after(headers)
+                if cooldown is None:
+                    cooldown = min(
+                        OPENAI_KEY_COOLDOWN * 2 ** (credential.consecutive_rate_limits - 1), OPENAI_KEY_MAX_COOLDOWN
+                    )
+                self._eject(credential, now, cooldown, "rate_limited")
+            elif unauthorized:
+                self._eject(credential, now, OPENAI_KEY_AUTH_COOLDOWN, "unauthorized")
+            else:
+                credential.consecutive_rate_limits = 0
+
+    def _eject(self, credential: Credential, now: float, seconds: float, reason: str) -> None:
+        credential.ejected_until = max(credential.ejected_until, now + seconds)
+        CREDENTIAL_EJECTIONS.labels(self.label or credential.label, reason).inc()
+        if len(self.credentials) > 1:
+            logger.warning(f"Ejecting OpenAI key {credential.label} for {seconds:.1f}s ({reason})")
+
+    def available(self, now: float) -> bool:
+        """Whether any key is in rotation at ``now``."""
+        return any(credential.ejected_until <= now for credential in self.credentials)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(credential.in_flight for credential in self.credentials)
+
+
+def credential_id(api_key: str, organization: Optional[str] = None) -> str:
+    """Identifies a key (and organization) by hash, so cache keys and logs never hold the key itself."""
+    return hashlib.sha256(f"{organization or ''}:{api_key}".encode("utf-8")).hexdigest()
+
+
+class CredentialCache:
+    """
+    Single-key pools for users who bring their own OpenAI API key, keyed by key hash.
+
+    Each user key gets its own ``CredentialPool`` and therefore its own client and
+    connection pool, reused across that user's requests and never shared with another
+    key. Entries are kept in least-recently-used order: beyond ``max_size`` entries, or
+    once unused for ``idle_seconds``, they are evicted and ``on_evict`` closes their
+    client. A pool with calls in flight is never evicted.
+    """
+
+    def __init__(
+        self,
+        max_size: int = OPENAI_CLIENT_CACHE_SIZE,
+        idle_seconds: float = OPENAI_CLIENT_IDLE_SECONDS,
+        on_evict: Optional[Callable[[CredentialPool], None]] = None,
+    ):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, CredentialPool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+    def get(self, api_key: str, organization: Optional[str] = None) -> CredentialPool:
+        """Returns the pool for ``api_key``, creating it on first use."""
+        key = credential_id(api_key, organization)
+        now = time.monotonic()
+        with self._lock:
+            pool = self._entries.get(key)
+            if pool is None:
+                CACHE_LOOKUPS.labels("openai_clients", "miss").inc()
+                pool = CredentialPool([Credential(api_key, organization)], label="user")
+                self._entries[key] = pool
+            else:
+                CACHE_LOOKUPS.labels("openai_clients", "hit").inc()
+                self._entries.move_to_end(key)
+            pool.last_used = now
+            evicted = self._evict(now, keep=key)
+        for stale in evicted:
+            if self.on_evict is not None:
+                self.on_evict(stale)
+        return pool
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now: float, keep: str) -> List[CredentialPool]:
+        evicted = []
+        # Oldest first; stop at the first entry that is neither over capacity nor idle,
+        # since every later entry was used more recently.
+        for key, pool in list(self._entries.items()):
+            over_capacity = len(self._entries) > self.max_size
+            if not over_capacity and now - pool.last_used < self.idle_seconds:
+                break
+            if pool.in_flight or key == keep:
+                continue
+            del self._entries[key]
+            evicted.append(pool)
+        return evicted
+
+
+def parse_credentials(value: str, organization: Optional[str] = None) -> List[Credential]:
+    """
+    Parses ``OPENAI_API_KEYS``: comma-separated ``key`` or ``key:organization`` entries.
+
+    Args:
+        value (str): The setting's value.
+        organization (str, optional): Organization for entries that do not name one.
+
+    Returns:
+        List[Credential]: One credential per entry.
+    """
+    credentials = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        api_key, _, entry_organization = entry.partition(":")
+        credentials.append(Credential(api_key.strip(), entry_organization.strip() or organization))
+    return credentials
@@ -2,24 +2,27 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import as_declarative
-from sqlalchemy.ext.asyncio import AsyncSession
 
 import logging
 import os
-from typing import Any, Dict, Generator
+from typing import TYPE_CHECKING, Any, Dict, Generator, Optional
 from fastapi.responses import JSONResponse
 from fastapi import Depends, HTTPException, status
 
 from .config import settings
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# create_engine does not connect; the pool opens connections on first checkout, so
+# importing this module in a preloading gunicorn master opens none.
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, pool_pre_ping=True, connect_args={"check_same_thread": False}
 )
@@ -28,20 +31,47 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-async def get_async_session() -> Generator[AsyncSession, Any, None]:
-    async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+_async_engine: Optional["AsyncEngine"] = None
+
+def get_async_engine() -> "AsyncEngine":
+    """Returns the async engine, creating it (and importing SQLAlchemy's asyncio extension) on first use."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        _async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+    return _async_engine
+
+def dispose_engines() -> None:
+    """
+    Drops pooled connections inherited from a parent process.
+
+    Called in each gunicorn worker after fork so every worker opens its own
+    connections; ``close=False`` leaves the parent's sockets untouched.
+    """
+    global _async_engine
+    engine.dispose(close=False)
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+        _async_engine = None
+
+async def get_async_session() -> Generator["AsyncSession", Any, None]:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
     async_session = sessionmaker(
         autocommit=False,
         autoflush=False,
-        bind=async_engine,
+        bind=get_async_engine(),
         class_=AsyncSession,
     )
     async with async_session() as session:
         yield session
 
-async def get_db():
-    async with SessionLocal() as session:
-        try:
-            yield session
-        finally:
-            session.close()
\ No newline at end of file
+def get_db():
+    # A plain generator: FastAPI runs it in the threadpool, and the sync Session
+    # cannot be used with ``async with``.
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
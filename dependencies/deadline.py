@@ -0,0 +1,188 @@
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+from dependencies.metrics import DEADLINE_EXCEEDED, UPSTREAM_TIMEOUT
+
+# Request header a client sets to the seconds it will wait for the response, e.g. "X-Request-Timeout: 8.5".
+DEADLINE_HEADER = "x-request-timeout"
+# Longest any request may take, and the deadline of requests without one. Keep it under
+# gunicorn's timeout (60 s) so a stuck upstream call is cut short before the worker is killed.
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "50"))
+# Upstream timeouts per call kind: UPSTREAM_TIMEOUT_FACTOR times this percentile of the
+# kind's last UPSTREAM_TIMEOUT_SAMPLES latencies, no lower than UPSTREAM_TIMEOUT_MIN
+# seconds and no higher than OPENAI_TIMEOUT.
+UPSTREAM_TIMEOUT_PERCENTILE = float(os.environ.get("UPSTREAM_TIMEOUT_PERCENTILE", "0.99"))
+UPSTREAM_TIMEOUT_FACTOR = float(os.environ.get("UPSTREAM_TIMEOUT_FACTOR", "2"))
+UPSTREAM_TIMEOUT_MIN = float(os.environ.get("UPSTREAM_TIMEOUT_MIN", "5"))
+UPSTREAM_TIMEOUT_SAMPLES = int(os.environ.get("UPSTREAM_TIMEOUT_SAMPLES", "200"))
+
+# Latencies a call kind needs before its timeout is set from them.
+_MIN_SAMPLES = 20
+
+
+class Deadline:
+    """The time by which a request's caller needs its result, on the monotonic clock."""
+
+    __slots__ = ("expires",)
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Sets a deadline ``seconds`` from now for the enclosed block; None keeps the current one.
+
+    A deadline inside another never ends later than the outer one. Tasks started inside
+    the block share it, as they copy the context.
+    """
+    if seconds is None:
+        yield _current_deadline.get()
+        return
+    current = _current_deadline.get()
+    scoped = Deadline(seconds)
+    if current is not None and current.expires < scoped.expires:
+        scoped = current
+    token = _current_deadline.set(scoped)
+    try:
+        yield scoped
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, or None outside one."""
+    current = _current_deadline.get()
+    return None if current is None else current.remaining()
+
+
+def deadline_exceeded(stage: str) -> HTTPException:
+    """Counts work abandoned at ``stage`` because its deadline passed, and returns the 504 to raise."""
+    DEADLINE_EXCEEDED.labels(stage).inc()
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail=f"Deadline exceeded ({stage}). Please try again with a longer timeout.",
+    )
+
+
+def check_deadline(stage: str) -> None:
+    """
+    Stops work whose caller can no longer use the result.
+
+    Raises:
+        HTTPException: 504 if the current deadline has passed.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise deadline_exceeded(stage)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each HTTP request a deadline.
+
+    The deadline is ``X-Request-Timeout`` seconds after the request arrives, capped at
+    ``REQUEST_TIMEOUT``, which is also the deadline of requests without the header.
+    Authentication, waiting for an upstream slot and upstream calls read it with
+    ``remaining`` and give up with a 504 once it has passed, rather than finish work
+    nobody is waiting for.
+    """
+
+    def __init__(self, app, max_seconds: float = REQUEST_TIMEOUT):
+        self.app = app
+        self.max_seconds = max_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        seconds = self.max_seconds
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER.encode("latin-1"):
+                try:
+                    requested = float(value)
+                except ValueError:
+                    requested = math.nan
+                if not requested > 0:
+                    response = JSONResponse(
+                        {"detail": f"Invalid {DEADLINE_HEADER} header. Send the seconds you will wait, e.g. 10."},
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                    )
+                    await response(scope, receive, send)
+                    return
+                seconds = min(seconds, requested)
+                break
+        with deadline(seconds):
+            await self.app(scope, receive, send)
+
+
+class UpstreamTimeouts:
+    """
+    Upstream call timeouts per call kind (method and model), set from observed latencies.
+
+    A kind's timeout is ``factor`` times the ``percentile`` of its last ``samples``
+    latencies, between ``minimum`` and ``maximum``, so a call to a fast model is given up
+    on long before one to a slow model would be. Kinds with fewer than 20 latencies seen
+    get ``maximum``. The percentile is recomputed after every tenth of ``samples`` new
+    latencies rather than on each one.
+    """
+
+    def __init__(
+        self,
+        maximum: float,
+        minimum: float = UPSTREAM_TIMEOUT_MIN,
+        percentile: float = UPSTREAM_TIMEOUT_PERCENTILE,
+        factor: float = UPSTREAM_TIMEOUT_FACTOR,
+        samples: int = UPSTREAM_TIMEOUT_SAMPLES,
+    ):
+        """
+        Args:
+            maximum (float): Timeout of kinds without enough latencies, and the longest of any.
+            minimum (float, optional): Shortest timeout of any kind. Defaults to ``UPSTREAM_TIMEOUT_MIN``.
+            percentile (float, optional): Latency percentile the timeout is set from, in (0, 1].
+                Defaults to ``UPSTREAM_TIMEOUT_PERCENTILE``.
+            factor (float, optional): Multiple of that percentile allowed. Defaults to ``UPSTREAM_TIMEOUT_FACTOR``.
+            samples (int, optional): Latencies kept per kind. Defaults to ``UPSTREAM_TIMEOUT_SAMPLES``.
+        """
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.percentile = percentile
+        self.factor = factor
+        self.samples = max(samples, _MIN_SAMPLES)
+        self.timeouts: Dict[str, float] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._unsorted: Dict[str, int] = {}
+
+    def timeout(self, kind: str) -> float:
+        return self.timeouts.get(kind, self.maximum)
+
+    def observe(self, kind: str, seconds: float) -> None:
+        """Records the latency of a call that succeeded."""
+        latencies = self._latencies.get(kind)
+        if latencies is None:
+            latencies = self._latencies[kind] = deque(maxlen=self.samples)
+        latencies.append(seconds)
+        unsorted = self._unsorted.get(kind, 0) + 1
+        if len(latencies) >= _MIN_SAMPLES and (kind not in self.timeouts or unsorted >= self.samples // 10):
+            ordered = sorted(latencies)
+            value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+            timeout = self.timeouts[kind] = min(self.maximum, max(self.minimum, value * self.factor))
+            method, _, model = kind.partition(":")
+            UPSTREAM_TIMEOUT.labels(method, model).set(timeout)
+            unsorted = 0
+        self._unsorted[kind] = unsorted
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+from dependencies.metrics import UPSTREAM_CANCELLATIONS
+
+ResultT = TypeVar("ResultT")
+
+# Status logged for requests whose client went away before the response (nginx's "client closed request").
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[ResultT]) -> ResultT:
+    """
+    Awaits ``work``, cancelling it as soon as the client disconnects.
+
+    A handler keeps running after its client has gone, so an upstream generation nobody
+    will read would run to the end in its slot. Here the work runs in a task of its own,
+    sharing the request's context (deadline, token tally, timings), while the request's
+    receive channel is watched for ``http.disconnect``. On a disconnect the task is
+    cancelled, which aborts the upstream HTTP request and releases its slot, and a 499
+    is raised. Call it once the request body has been read.
+
+    Raises:
+        HTTPException: 499 if the client disconnected before ``work`` finished.
+    """
+    task = asyncio.ensure_future(work)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((task, disconnected), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnected.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if disconnected.done() and not disconnected.cancelled():
+                UPSTREAM_CANCELLATIONS.labels(request.url.path).inc()
+    if not task.cancelled():
+        return task.result()
+    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected.")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
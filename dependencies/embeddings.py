@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from dependencies.metrics import CACHE_LOOKUPS
+
+# Embeddings kept per worker (about 6 KB each at 1536 dimensions).
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+# Upstream limits per embeddings request: inputs, and total tokens across them.
+OPENAI_EMBEDDING_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", "2048"))
+OPENAI_EMBEDDING_BATCH_TOKENS = int(os.environ.get("OPENAI_EMBEDDING_BATCH_TOKENS", "300000"))
+
+
+def embedding_key(model: str, dimensions: Optional[int], text: str) -> str:
+    """Content hash identifying the embedding of ``text`` by ``model`` at ``dimensions``."""
+    return hashlib.sha256(f"{model}\0{dimensions or ''}\0{text}".encode("utf-8")).hexdigest()
+
+
+def decode_embedding(data: Any) -> np.ndarray:
+    """Returns an upstream embedding as float32, whether sent as base64 or as a list of floats."""
+    if isinstance(data, str):
+        return np.frombuffer(base64.b64decode(data), dtype="<f4")
+    return np.asarray(data, dtype=np.float32)
+
+
+def encode_embedding(vector: np.ndarray) -> str:
+    """Base64 of the little-endian float32 bytes, the format of OpenAI's ``encoding_format="base64"``."""
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def plan_batches(
+    texts: List[str],
+    estimate_tokens: Callable[[str], int],
+    max_inputs: int = OPENAI_EMBEDDING_BATCH_SIZE,
+    max_tokens: int = OPENAI_EMBEDDING_BATCH_TOKENS,
+) -> List[List[int]]:
+    """
+    Groups texts into as few upstream requests as the batch limits allow.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        estimate_tokens (Callable): Estimates a text's token count.
+        max_inputs (int, optional): Inputs per request. Defaults to ``OPENAI_EMBEDDING_BATCH_SIZE``.
+        max_tokens (int, optional): Tokens per request; a longer text still gets a request of its own.
+            Defaults to ``OPENAI_EMBEDDING_BATCH_TOKENS``.
+
+    Returns:
+        List[List[int]]: Indices into ``texts`` per request, in order.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    tokens = 0
+    for index, text in enumerate(texts):
+        text_tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_inputs or tokens + text_tokens > max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(index)
+        tokens += text_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingCache:
+    """
+    Float32 embeddings keyed by ``embedding_key``, evicting the least recently used.
+
+    An embedding depends only on the model and text, so entries are shared by all
+    users: a hit returns exactly what the upstream would.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Returns the cached embedding for each key, or None where there is none."""
+        vectors: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                vectors.append(vector)
+        hits = sum(vector is not None for vector in vectors)
+        if hits:
+            CACHE_LOOKUPS.labels("embeddings", "hit").inc(hits)
+        if len(keys) - hits:
+            CACHE_LOOKUPS.labels("embeddings", "miss").inc(len(keys) - hits)
+        return vectors
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        # Cached arrays are handed to every caller; make sure none can modify them.
+        vector.flags.writeable = False
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
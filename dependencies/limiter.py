@@ -0,0 +1,104 @@
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from dependencies.metrics import UPSTREAM_LIMIT
+
+# Starting limit on upstream calls in flight per worker, and the range it adapts within.
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "64"))
+UPSTREAM_CONCURRENCY_MIN = int(os.environ.get("UPSTREAM_CONCURRENCY_MIN", "4"))
+UPSTREAM_CONCURRENCY_MAX = int(os.environ.get("UPSTREAM_CONCURRENCY_MAX", "512"))
+# Fixed limit instead of adapting it (then UPSTREAM_CONCURRENCY is the limit).
+UPSTREAM_CONCURRENCY_ADAPTIVE = os.environ.get("UPSTREAM_CONCURRENCY_ADAPTIVE", "true").lower() == "true"
+# A call slower than this multiple of its usual latency counts as a sign of congestion.
+UPSTREAM_LATENCY_TOLERANCE = float(os.environ.get("UPSTREAM_LATENCY_TOLERANCE", "2.5"))
+# Factor the limit is multiplied by on congestion (429s, timeouts, slow calls).
+UPSTREAM_LIMIT_BACKOFF = float(os.environ.get("UPSTREAM_LIMIT_BACKOFF", "0.9"))
+
+# Weight of a new sample in a call kind's usual latency.
+_BASELINE_ALPHA = 0.05
+
+
+class AdaptiveLimit:
+    """
+    AIMD limit on upstream calls in flight, sized from what the upstream reports back.
+
+    Each call that returns within ``tolerance`` times the usual latency of its kind
+    (method and model) raises the limit by ``1 / limit``, i.e. by one per limit's worth
+    of calls, but only while at least half the limit is in use, so a quiet period does
+    not inflate it. A 429, a timeout or a call slower than that multiplies the limit by
+    ``backoff``, at most once per usual round trip: the calls already in flight when it
+    dropped report the same congestion and should not cut it again.
+    """
+
+    def __init__(
+        self,
+        initial: int = UPSTREAM_CONCURRENCY,
+        minimum: int = UPSTREAM_CONCURRENCY_MIN,
+        maximum: int = UPSTREAM_CONCURRENCY_MAX,
+        tolerance: float = UPSTREAM_LATENCY_TOLERANCE,
+        backoff: float = UPSTREAM_LIMIT_BACKOFF,
+        adaptive: bool = UPSTREAM_CONCURRENCY_ADAPTIVE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.baselines: Dict[str, float] = {}
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._decreased_at = -math.inf
+        self._clock = clock
+        self._lock = threading.Lock()
+        UPSTREAM_LIMIT.set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def start(self) -> None:
+        """Counts an upstream call as in flight; pair with ``observe``."""
+        with self._lock:
+            self.in_flight += 1
+
+    def observe(self, kind: str, seconds: Optional[float], congested: bool = False) -> None:
+        """
+        Adjusts the limit after an upstream call.
+
+        Args:
+            kind (str): The kind of call, e.g. ``"complete_text:text-davinci-003"``; latencies are
+                only compared with those of the same kind.
+            seconds (float, optional): How long the call took; None if it was cut short.
+            congested (bool, optional): The upstream signalled overload (429 or a timeout).
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if not self.adaptive:
+                return
+            if congested:
+                self._decrease(self.baselines.get(kind, 0.0))
+                return
+            if seconds is None:
+                return
+            baseline = self.baselines.get(kind)
+            self.baselines[kind] = seconds if baseline is None else baseline + _BASELINE_ALPHA * (seconds - baseline)
+            if baseline is not None and seconds > self.tolerance * baseline:
+                self._decrease(baseline)
+            elif 2 * self.in_flight >= self._limit and self._limit < self.maximum:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                UPSTREAM_LIMIT.set(self.limit)
+
+    def _decrease(self, round_trip: float) -> None:
+        now = self._clock()
+        if now - self._decreased_at < round_trip:
+            return
+        self._decreased_at = now
+        self._limit = max(float(self.minimum), self._limit * self.backoff)
+        UPSTREAM_LIMIT.set(self.limit)
+
+
+upstream_limit = AdaptiveLimit()
@@ -0,0 +1,265 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from dependencies.token_usage import add_tokens
+
+# When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every worker writes its
+# samples to that directory and the metrics endpoint merges them, so counters and
+# histograms aggregate across workers. Gauges use "livesum" so only live workers count.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent serving HTTP requests.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served.",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "openai_upstream_duration_seconds",
+    "Time spent waiting on the OpenAI API.",
+    ["model", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "openai_upstream_in_flight",
+    "OpenAI API calls currently in flight.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_ERRORS = Counter(
+    "openai_upstream_errors_total",
+    "OpenAI API calls that raised an error.",
+    ["model", "method", "error"],
+)
+CREDENTIAL_EJECTIONS = Counter(
+    "openai_credential_ejections_total",
+    "Times an API key was taken out of rotation, by key suffix and reason.",
+    ["credential", "reason"],
+)
+BACKEND_REQUESTS = Counter(
+    "openai_backend_requests_total",
+    "OpenAI API calls by backend and outcome (error: 5xx or unreachable).",
+    ["backend", "outcome"],
+)
+BACKEND_EJECTIONS = Counter(
+    "openai_backend_ejections_total",
+    "Times a backend was taken out of rotation for its error rate.",
+    ["backend"],
+)
+CASCADE_DECISIONS = Counter(
+    "openai_cascade_decisions_total",
+    "Cascade completions by fast model and decision; reason is the failing check when escalated.",
+    ["model", "decision", "reason"],
+)
+UPSTREAM_LIMIT = Gauge(
+    "upstream_concurrency_limit",
+    "Requests the workers let call the OpenAI API at once, as currently adapted.",
+    multiprocess_mode="livesum",
+)
+SCHEDULER_WAIT = Histogram(
+    "upstream_slot_wait_seconds",
+    "Time requests waited for an upstream concurrency slot, by priority.",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+SCHEDULER_QUEUED = Gauge(
+    "upstream_slot_queued",
+    "Requests waiting for an upstream concurrency slot, by priority.",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+SCHEDULER_REJECTIONS = Counter(
+    "upstream_slot_rejections_total",
+    "Requests refused an upstream slot, by priority and reason (user_queue_full, queue_full, shed, timeout, deadline).",
+    ["priority", "reason"],
+)
+BUDGET_REJECTIONS = Counter(
+    "user_budget_rejections_total",
+    "Requests refused for going over a user budget, by budget (requests_per_minute, tokens_per_day, ...).",
+    ["budget"],
+)
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "Requests given up on because their deadline passed, by stage (auth, queue, upstream).",
+    ["stage"],
+)
+UPSTREAM_TIMEOUT = Gauge(
+    "upstream_timeout_seconds",
+    "Timeout of upstream calls by method and model, set from their observed latencies.",
+    ["method", "model"],
+    multiprocess_mode="livemax",
+)
+UPSTREAM_CANCELLATIONS = Counter(
+    "upstream_cancellations_total",
+    "Upstream calls and generations cancelled because the client disconnected, by endpoint.",
+    ["endpoint"],
+)
+CHAT_STREAM_CONNECTIONS = Gauge(
+    "chat_stream_connections",
+    "Open chat WebSocket connections.",
+    multiprocess_mode="livesum",
+)
+CHAT_STREAM_GENERATIONS = Counter(
+    "chat_stream_generations_total",
+    "Generations streamed over chat WebSockets, by outcome (done, cancelled, error).",
+    ["outcome"],
+)
+JOBS = Counter(
+    "jobs_total",
+    "Asynchronous jobs by kind and outcome (queued, succeeded, failed, retried).",
+    ["kind", "outcome"],
+)
+TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens reported by the OpenAI API.",
+    ["model", "kind"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups by cache and result; hit ratio is hit / (hit + miss).",
+    ["cache", "result"],
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured size of the database connection pool.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Database connections currently checked out of the pool.",
+    multiprocess_mode="livesum",
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency by route template and status.
+
+    Written as a plain ASGI callable rather than ``BaseHTTPMiddleware`` so it adds no
+    extra task or response copy per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # FastAPI stores the matched route in the scope; using its template keeps
+            # the label cardinality bounded.
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                getattr(route, "path", "<unmatched>"), scope["method"], str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def observe_upstream(method: str, model: str):
+    """
+    Times an OpenAI API call and counts it as in flight while it runs.
+
+    Args:
+        method (str): The ``OpenAIService`` method making the call.
+        model (str): The model the call targets.
+    """
+    in_flight = UPSTREAM_IN_FLIGHT.labels(method)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(model, method, type(e).__name__).inc()
+        raise
+    finally:
+        in_flight.dec()
+        UPSTREAM_LATENCY.labels(model, method).observe(time.perf_counter() - start)
+
+
+def record_tokens(model: str, usage: Optional[Any]) -> None:
+    """
+    Adds the prompt and completion token counts of an upstream ``usage`` block.
+
+    They are also counted in the current ``TokenTally`` (see dependencies/token_usage.py),
+    which is how they reach the caller's response and the usage records.
+    """
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt_tokens, int):
+        TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if isinstance(completion_tokens, int):
+        TOKENS.labels(model, "completion").inc(completion_tokens)
+    add_tokens(
+        model,
+        prompt_tokens if isinstance(prompt_tokens, int) else 0,
+        completion_tokens if isinstance(completion_tokens, int) else 0,
+    )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Tracks pool size and checked-out connections of a SQLAlchemy engine."""
+    size = getattr(engine.pool, "size", None)
+
+    # Recorded when a connection is opened rather than here, so the value is written
+    # by the worker that owns the pool and not by a preloading master before fork.
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        if callable(size):
+            DB_POOL_SIZE.set(size())
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+
+def metrics_response() -> Response:
+    """Renders all metrics, merged across workers when running in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -2,26 +2,491 @@ from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
-import openai
-from openai.error import APIError, AuthenticationError, RateLimitError, InvalidRequestError, TimeoutError, APIConnectionError
-from typing import Optional, List
+import asyncio
+import os
+import time
 
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Optional, List, Tuple, get_args
+
+from api.schemas.openai import ChatModel, CompletionModel, EmbeddingModel
 from dependencies.database import get_db
 from dependencies.auth import get_current_user
-from schemas.openai import OpenAIRequest, OpenAIResponse, OpenAIChoice, OpenAIUsage, OpenAIModel
+from dependencies.backends import OPENAI_BACKENDS, Backend, BackendPool, parse_backends
+from dependencies.cascade import OPENAI_CASCADE_CHECKS, OPENAI_CASCADE_MODEL, Candidate, Cascade
+from dependencies.credentials import Credential, CredentialCache, CredentialPool, parse_credentials
+from dependencies.deadline import UpstreamTimeouts, deadline_exceeded, remaining
+from dependencies.limiter import AdaptiveLimit, upstream_limit
+from dependencies.metrics import CACHE_LOOKUPS, CASCADE_DECISIONS, observe_upstream, record_tokens
+from dependencies.token_usage import count_tokens
+from api.schemas.openai import OpenAIRequest, OpenAIResponse, OpenAIChoice, OpenAIUsage, OpenAIModel
 
 # Load environment variables
 from .config import settings
 
+if TYPE_CHECKING:
+    import httpx
+    import numpy as np
+    from openai import AsyncOpenAI
+
+    from dependencies.embeddings import EmbeddingCache
+    from dependencies.semantic_cache import SemanticCache
+
 OPENAI_API_KEY = settings.openai_api_key
-openai.api_key = OPENAI_API_KEY
+# Models the request schemas accept. Other ids looked up with get_model are labelled
+# "other" in metrics and upstream timeouts, keeping their label sets bounded.
+KNOWN_MODELS = frozenset(get_args(CompletionModel) + get_args(ChatModel) + get_args(EmbeddingModel))
+# Comma-separated "key" or "key:organization" entries to balance across; takes
+# precedence over OPENAI_API_KEY.
+OPENAI_API_KEYS = os.environ.get("OPENAI_API_KEYS", "")
+OPENAI_ORGANIZATION = os.environ.get("OPENAI_ORGANIZATION") or None
+# Any OpenAI-compatible server, e.g. the local stand-in in tests/fake_openai.py.
+# Unset means the public OpenAI API.
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+# Serve completions and summaries of prompts similar to earlier ones from a semantic
+# cache (see dependencies/semantic_cache.py). numpy is only imported when enabled.
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+
+def default_credentials(organization: Optional[str] = OPENAI_ORGANIZATION) -> List[Credential]:
+    """The shared keys: ``OPENAI_API_KEYS``, or ``OPENAI_API_KEY`` when that is unset."""
+    return parse_credentials(OPENAI_API_KEYS, organization) or [Credential(OPENAI_API_KEY, organization)]
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token count (about four characters per token) used to reserve rate-limit budget."""
+    return len(text) // 4 + 1
+
+def upstream_http_error(e: Exception) -> Exception:
+    """
+    Maps an ``openai`` client error to the HTTPException returned to the caller.
+
+    Args:
+        e (Exception): The exception raised by an OpenAI API call.
+
+    Returns:
+        Exception: The HTTPException for ``openai`` errors; any other exception unchanged.
+    """
+    # Imported here rather than at module level so ``openai`` is only loaded once a
+    # client exists, at which point this import is a dictionary lookup.
+    from openai import APIError, AuthenticationError, RateLimitError, BadRequestError, APITimeoutError, APIConnectionError
+
+    if isinstance(e, AuthenticationError):
+        return HTTPException(
+            status_code=401,
+            detail="Invalid OpenAI API key. Please check your API key.",
+        )
+    if isinstance(e, RateLimitError):
+        return HTTPException(
+            status_code=429,
+            detail="OpenAI API rate limit exceeded. Please try again later.",
+        )
+    if isinstance(e, BadRequestError):
+        return HTTPException(
+            status_code=400,
+            detail="Invalid request to OpenAI API. Please check your input parameters.",
+        )
+    if isinstance(e, APITimeoutError):
+        return HTTPException(
+            status_code=504,
+            detail="Request to OpenAI API timed out. Please try again later.",
+        )
+    if isinstance(e, APIConnectionError):
+        return HTTPException(
+            status_code=500,
+            detail="Error connecting to OpenAI API. Please check your internet connection.",
+        )
+    if isinstance(e, APIError):
+        return HTTPException(
+            status_code=500,
+            detail=f"Error calling OpenAI API: {str(e)}",
+        )
+    return e
 
 class OpenAIService:
     """
     Service class for interacting with the OpenAI API.
     """
 
-    async def complete_text(self, text: str, model: str = "text-davinci-003", temperature: float = 0.7, max_tokens: int = 256) -> OpenAIResponse:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+        timeout: float = OPENAI_TIMEOUT,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        transport: Optional["httpx.AsyncBaseTransport"] = None,
+        organization: Optional[str] = OPENAI_ORGANIZATION,
+        credentials: Optional[List[Credential]] = None,
+        backends: Optional[List[Backend]] = None,
+        cascade: Optional[Cascade] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        limit: Optional[AdaptiveLimit] = None,
+        timeouts: Optional[UpstreamTimeouts] = None,
+    ):
+        """
+        Args:
+            api_key (str, optional): A single OpenAI API key. Defaults to the keys in ``OPENAI_API_KEYS``,
+                or ``OPENAI_API_KEY`` when that is unset.
+            base_url (str, optional): Base URL of the OpenAI-compatible API. Defaults to ``OPENAI_BASE_URL``.
+            timeout (float, optional): Longest timeout of an upstream call, in seconds, and the timeout of
+                calls to models without enough latencies observed yet. Defaults to ``OPENAI_TIMEOUT``.
+            max_retries (int, optional): Retries on connection errors, 429s and 5xx. Defaults to ``OPENAI_MAX_RETRIES``.
+            transport (httpx.AsyncBaseTransport, optional): Transport under the HTTP client. Defaults to the
+                record/replay cassette transport when ``OPENAI_CASSETTE_MODE`` is set, else a plain connection pool.
+            organization (str, optional): Organization for keys that do not name one. Defaults to ``OPENAI_ORGANIZATION``.
+            credentials (List[Credential], optional): The keys to balance across; overrides ``api_key``.
+            backends (List[Backend], optional): Several OpenAI-compatible backends to route across, each with
+                its own keys; overrides ``base_url``, ``api_key`` and ``credentials``. The first is the primary.
+            cascade (Cascade, optional): Fast model and acceptance checks for cascade completions. Defaults to
+                ``OPENAI_CASCADE_MODEL`` with ``OPENAI_CASCADE_CHECKS``.
+            semantic_cache (SemanticCache, optional): Cache for completions and summaries. Defaults to one
+                configured by ``SEMANTIC_CACHE_*`` when ``SEMANTIC_CACHE_ENABLED`` is set, else no caching.
+            limit (AdaptiveLimit, optional): Told the latency and outcome of every shared-key call, to size
+                how many requests the scheduler lets through. Defaults to the worker's ``upstream_limit``.
+            timeouts (UpstreamTimeouts, optional): Sets each call's timeout from the latencies of its method
+                and model. Defaults to one capped at ``timeout``.
+        """
+        if backends is None:
+            if credentials is None:
+                credentials = [Credential(api_key, organization)] if api_key is not None else default_credentials(organization)
+            backends = [Backend("default", base_url, CredentialPool(credentials))]
+        self.backends = BackendPool(backends)
+        self.pool = self.backends.primary.pool
+        # Keys across all backends; with more than one, _call retries elsewhere instead of
+        # letting the client retry a rate-limited key or a failing backend.
+        self._shared_keys = sum(len(backend.pool) for backend in backends)
+        # Users' own keys (User.api_key) get their own clients on the primary backend; see CredentialCache.
+        self.user_pools = CredentialCache(on_evict=self._close_clients)
+        self.base_url = self.backends.primary.base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limit = limit or upstream_limit
+        self.timeouts = timeouts or UpstreamTimeouts(timeout)
+        self.cascade = cascade or Cascade.from_spec(OPENAI_CASCADE_MODEL, OPENAI_CASCADE_CHECKS)
+        if semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+            from dependencies.semantic_cache import SemanticCache
+
+            semantic_cache = SemanticCache()
+        self.semantic_cache = semantic_cache
+        # Created on first use, so numpy is only imported once embeddings are requested.
+        self._embedding_cache: Optional["EmbeddingCache"] = None
+        self._transport = transport
+        self._closing: set = set()
+
+    def _client_for(self, credential: Credential, base_url: Optional[str], max_retries: int) -> "AsyncOpenAI":
+        """
+        Returns the OpenAI client of ``credential``, creating it for ``base_url`` on first use.
+
+        Importing ``openai`` and building its HTTP client is the largest part of the
+        app's import time, and a client built before gunicorn forks would share its
+        connection pool between workers. Deferring both to the first call avoids that.
+        """
+        if credential.client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            from dependencies.cassette import cassette_transport_from_env
+
+            if self._transport is None:
+                self._transport = cassette_transport_from_env()
+            http_client = DefaultAsyncHttpxClient(transport=self._transport) if self._transport is not None else None
+            credential.client = AsyncOpenAI(
+                api_key=credential.api_key,
+                organization=credential.organization,
+                base_url=base_url,
+                timeout=self.timeout,
+                max_retries=max_retries,
+                http_client=http_client,
+            )
+        return credential.client
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """The client of the primary backend's first key."""
+        return self._client_for(self.pool.credentials[0], self.base_url, self.max_retries if self._shared_keys == 1 else 0)
+
+    def reset(self) -> None:
+        """Drops all clients so the next calls build new ones, e.g. in a freshly forked worker."""
+        for backend in self.backends.backends:
+            for credential in backend.pool.credentials:
+                credential.client = None
+        self.user_pools.clear()
+
+    def _close_clients(self, pool: CredentialPool) -> None:
+        """Closes the connection pools of an evicted user's clients."""
+        for credential in pool.credentials:
+            client, credential.client = credential.client, None
+            if client is None:
+                continue
+            try:
+                task = asyncio.get_running_loop().create_task(client.close())
+            except RuntimeError:
+                # No running loop: nothing can be in flight, let garbage collection close it.
+                continue
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _call(
+        self,
+        method: str,
+        model: str,
+        tokens: int,
+        request: Callable[["AsyncOpenAI"], Awaitable[Any]],
+        api_key: Optional[str] = None,
+    ) -> Any:
+        """
+        Runs an upstream call on the best backend and the key there with the most rate-limit headroom.
+
+        Args:
+            method (str): The calling method, for metrics.
+            model (str): The model the call targets, for metrics.
+            tokens (int): Tokens the call is expected to consume, reserved on the key while it runs.
+            request (Callable): Makes the call through the given client's ``with_raw_response`` API,
+                so the ``x-ratelimit-*`` headers of every response reach the pool.
+            api_key (str, optional): A user's own API key to call with instead of the shared keys.
+                Such calls always go to the primary backend.
+
+        Returns:
+            Any: The parsed response.
+
+        Raises:
+            openai.APIError: The error of the last attempt. With several keys or backends, 429s and rejected
+                keys are retried on the next best key, and 5xx and connection errors on another backend,
+                up to ``max_retries`` times.
+            HTTPException: 504 when the caller's deadline passes before or during the call; it is not retried.
+        """
+        from openai import APIConnectionError, APIStatusError, APITimeoutError, AuthenticationError, InternalServerError, PermissionDeniedError, RateLimitError
+
+        user_pool = self.user_pools.get(api_key) if api_key is not None else None
+        options = 1 if api_key is not None else self._shared_keys
+        attempts, client_retries = (1, self.max_retries) if options == 1 else (self.max_retries + 1, 0)
+        tried: List[Credential] = []
+        failed_backends: List[Backend] = []
+        kind = f"{method}:{model}"
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 == attempts
+            left = remaining()
+            if left is not None and left <= 0:
+                raise deadline_exceeded("upstream")
+            # The model's usual timeout, unless the caller's deadline comes sooner.
+            timeout = self.timeouts.timeout(kind)
+            bounded = left is not None and left < timeout
+            if bounded:
+                timeout = left
+            backend = self.backends.acquire(exclude=failed_backends) if api_key is None else self.backends.primary
+            pool = backend.pool if api_key is None else user_pool
+            credential = pool.acquire(tokens, exclude=tried)
+            tried.append(credential)
+            client = self._client_for(credential, backend.base_url, client_retries)
+            if timeout != self.timeout:
+                client = client.with_options(timeout=timeout)
+            if api_key is None:
+                self.limit.start()
+            started = time.perf_counter()
+            try:
+                with observe_upstream(method, model):
+                    call = request(client)
+                    # Bounds the client's own retries as well.
+                    raw = await (call if left is None else asyncio.wait_for(call, left))
+            except asyncio.TimeoutError:
+                self._release(backend, None, False, api_key, kind)
+                pool.release(credential, tokens=tokens)
+                raise deadline_exceeded("upstream")
+            except APIStatusError as e:
+                backend_failed = isinstance(e, InternalServerError)
+                self._release(backend, started, backend_failed, api_key, kind, congested=isinstance(e, RateLimitError))
+                pool.release(
+                    credential,
+                    e.response.headers,
+                    tokens,
+                    rate_limited=isinstance(e, RateLimitError),
+                    unauthorized=isinstance(e, (AuthenticationError, PermissionDeniedError)),
+                )
+                if backend_failed:
+                    failed_backends.append(backend)
+                if last_attempt or not isinstance(e, (RateLimitError, AuthenticationError, PermissionDeniedError, InternalServerError)):
+                    raise
+            except APIConnectionError as e:
+                if bounded and isinstance(e, APITimeoutError):
+                    # Cut short by the caller's deadline rather than the model's timeout: no sign of a failing backend.
+                    self._release(backend, None, False, api_key, kind)
+                    pool.release(credential, tokens=tokens)
+                    raise deadline_exceeded("upstream") from e
+                self._release(backend, started, True, api_key, kind, congested=isinstance(e, APITimeoutError))
+                pool.release(credential, tokens=tokens)
+                failed_backends.append(backend)
+                if last_attempt:
+                    raise
+            except BaseException:
+                self._release(backend, None, False, api_key, kind)
+                pool.release(credential, tokens=tokens)
+                raise
+            else:
+                self._release(backend, started, False, api_key, kind)
+                self.timeouts.observe(kind, time.perf_counter() - started)
+                pool.release(credential, raw.headers, tokens)
+                return raw.parse()
+
+    def _release(
+        self,
+        backend: Backend,
+        started: Optional[float],
+        failed: bool,
+        api_key: Optional[str],
+        kind: str,
+        congested: bool = False,
+    ) -> None:
+        """Reports a shared-key call's latency and outcome to the backend pool and the concurrency limit."""
+        if api_key is None:
+            seconds = None if started is None else time.perf_counter() - started
+            self.backends.release(backend, seconds, failed)
+            self.limit.observe(kind, seconds, congested)
+
+    async def _cached(self, scope: str, text: str, api_key: Optional[str]) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        Looks ``text`` up in the semantic cache.
+
+        Calls made with a user's own key are neither served from nor added to the cache,
+        keeping them isolated from other users.
+
+        Returns:
+            Tuple: The cached response or None, and the prompt's embedding when it was computed,
+                for ``_remember`` to store the new response under.
+        """
+        cache = self.semantic_cache
+        if cache is None or api_key is not None:
+            return None, None
+        vector = None
+        response = cache.get_exact(scope, text)
+        if response is None:
+            try:
+                vector = await self._embed(text)
+            except Exception:
+                # The cache is an optimization; an embedding failure only costs the lookup.
+                CACHE_LOOKUPS.labels("semantic", "miss").inc()
+                return None, None
+            response = cache.get(scope, vector)
+            if response is not None:
+                # Keep the new wording too, so exact repeats of it skip the embedding call.
+                cache.put(scope, text, vector, response)
+        CACHE_LOOKUPS.labels("semantic", "miss" if response is None else "hit").inc()
+        return response, vector
+
+    def _remember(self, scope: str, text: str, vector: Optional[List[float]], response: str) -> None:
+        if vector is not None:
+            self.semantic_cache.put(scope, text, vector, response)
+
+    async def _embed(self, text: str) -> "np.ndarray":
+        """Embeds a prompt for the semantic cache."""
+        cache = self.semantic_cache
+        vectors, _, _ = await self.embed_texts([text], cache.embedding_model, cache.dimensions)
+        return vectors[0]
+
+    async def embed_texts(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-3-small",
+        dimensions: Optional[int] = None,
+        api_key: Optional[str] = None,
+    ) -> Tuple["np.ndarray", int, int]:
+        """
+        Embeds many texts with as few upstream calls as possible.
+
+        Repeated texts are embedded once, texts embedded before are served from the
+        embedding cache, and the rest are sent in batches as large as the upstream
+        accepts (see ``plan_batches``), concurrently. Vectors are requested as base64
+        and kept as float32 throughout.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            model (str, optional): The embedding model. Defaults to "text-embedding-3-small".
+            dimensions (int, optional): Shorten the embeddings to this size. Defaults to the model's size.
+            api_key (str, optional): The user's own OpenAI API key. Such calls neither use nor fill the
+                shared cache. Defaults to the shared keys.
+
+        Returns:
+            Tuple: A float32 array with one row per text, in order; the prompt tokens billed upstream;
+                and how many of the distinct texts came from the cache.
+
+        Raises:
+            HTTPException: If an upstream call fails.
+        """
+        import numpy as np
+
+        from dependencies.embeddings import EmbeddingCache, decode_embedding, embedding_key, plan_batches
+
+        if self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache()
+        unique = list(dict.fromkeys(texts))
+        keys = [embedding_key(model, dimensions, text) for text in unique]
+        if api_key is None:
+            vectors = self._embedding_cache.get_many(keys)
+        else:
+            vectors = [None] * len(unique)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        options = {} if dimensions is None else {"dimensions": dimensions}
+
+        async def embed_batch(batch: List[int]) -> int:
+            inputs = [unique[missing[i]] for i in batch]
+            response = await self._call(
+                "embed",
+                model,
+                sum(estimate_tokens(text) for text in inputs),
+                lambda client: client.embeddings.with_raw_response.create(
+                    model=model, input=inputs, encoding_format="base64", **options
+                ),
+                api_key=api_key,
+            )
+            usage = getattr(response, "usage", None)
+            record_tokens(model, usage)
+            for item in response.data:
+                position = missing[batch[item.index]]
+                vectors[position] = decode_embedding(item.embedding)
+                if api_key is None:
+                    self._embedding_cache.put(keys[position], vectors[position])
+            return getattr(usage, "prompt_tokens", 0) or 0
+
+        batches = plan_batches([unique[i] for i in missing], estimate_tokens)
+        try:
+            prompt_tokens = sum(await asyncio.gather(*(embed_batch(batch) for batch in batches)))
+        except Exception as e:
+            raise upstream_http_error(e)
+        rows = {text: vector for text, vector in zip(unique, vectors)}
+        return np.stack([rows[text] for text in texts]), prompt_tokens, len(unique) - len(missing)
+
+    async def _complete(
+        self,
+        text: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        api_key: Optional[str],
+        logprobs: Optional[int] = None,
+    ) -> Any:
+        """Runs one text completion and records its token usage; returns the parsed upstream response."""
+        options = {} if logprobs is None else {"logprobs": logprobs}
+        response = await self._call(
+            "complete_text",
+            model,
+            estimate_tokens(text) + max_tokens,
+            lambda client: client.completions.with_raw_response.create(
+                model=model,
+                prompt=text,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **options,
+            ),
+            api_key=api_key,
+        )
+        record_tokens(model, getattr(response, "usage", None))
+        return response
+
+    async def complete_text(
+        self,
+        text: str,
+        model: str = "text-davinci-003",
+        temperature: float = 0.7,
+        max_tokens: int = 256,
+        api_key: Optional[str] = None,
+        cascade: bool = False,
+    ) -> OpenAIResponse:
         """
         Completes a given text using OpenAI's text completion API.
 
@@ -30,6 +495,9 @@ class OpenAIService:
             model (str, optional): The OpenAI model to use. Defaults to "text-davinci-003".
             temperature (float, optional): The temperature parameter for controlling the randomness of the generated text. Defaults to 0.7.
             max_tokens (int, optional): The maximum number of tokens to generate. Defaults to 256.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
+            cascade (bool, optional): Try the cascade's fast model first and use ``model`` only if its answer
+                fails an acceptance check. Defaults to False.
 
         Returns:
             OpenAIResponse: The OpenAI API response containing the completed text.
@@ -39,46 +507,44 @@ class OpenAIService:
         """
 
         try:
-            response = openai.Completion.create(
-                engine=model,
-                prompt=text,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return OpenAIResponse(response=response.choices[0].text)
+            scope = f"complete_text:{model}:{temperature}:{max_tokens}:{cascade}"
+            cached, vector = await self._cached(scope, text, api_key)
+            if cached is not None:
+                return OpenAIResponse(response=cached)
+            with count_tokens() as tally:
+                answer = None
+                if cascade and model != self.cascade.model:
+                    answer = await self._complete_fast(text, temperature, max_tokens, api_key)
+                if answer is None:
+                    response = await self._complete(text, model, temperature, max_tokens, api_key)
+                    answer = response.choices[0].text
+            self._remember(scope, text, vector, answer)
+            # A rejected fast answer still used tokens; they are included.
+            return OpenAIResponse(response=answer, usage=tally.usage())
 
-        except AuthenticationError:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid OpenAI API key. Please check your API key.",
-            )
-        except RateLimitError:
-            raise HTTPException(
-                status_code=429,
-                detail="OpenAI API rate limit exceeded. Please try again later.",
-            )
-        except InvalidRequestError:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid request to OpenAI API. Please check your input parameters.",
-            )
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail="Request to OpenAI API timed out. Please try again later.",
-            )
-        except APIConnectionError:
-            raise HTTPException(
-                status_code=500,
-                detail="Error connecting to OpenAI API. Please check your internet connection.",
-            )
-        except APIError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error calling OpenAI API: {str(e)}",
+        except Exception as e:
+            raise upstream_http_error(e)
+
+    async def _complete_fast(self, text: str, temperature: float, max_tokens: int, api_key: Optional[str]) -> Optional[str]:
+        """Returns the cascade's fast model's answer if it passes every acceptance check, else None."""
+        fast_model = self.cascade.model
+        try:
+            response = await self._complete(
+                text, fast_model, temperature, max_tokens, api_key, logprobs=1 if self.cascade.logprobs else None
             )
+        except Exception:
+            # The larger model may still answer, e.g. when only the fast model is overloaded.
+            CASCADE_DECISIONS.labels(fast_model, "escalated", "error").inc()
+            return None
+        choice = response.choices[0]
+        reason = self.cascade.evaluate(Candidate.from_choice(choice))
+        if reason is not None:
+            CASCADE_DECISIONS.labels(fast_model, "escalated", reason).inc()
+            return None
+        CASCADE_DECISIONS.labels(fast_model, "accepted", "").inc()
+        return choice.text
 
-    async def translate_text(self, text: str, source_language: str, target_language: str) -> OpenAIResponse:
+    async def translate_text(self, text: str, source_language: str, target_language: str, api_key: Optional[str] = None) -> OpenAIResponse:
         """
         Translates a given text using OpenAI's translation API.
 
@@ -86,6 +552,7 @@ class OpenAIService:
             text (str): The text to be translated.
             source_language (str): The source language of the text.
             target_language (str): The target language to translate to.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
 
         Returns:
             OpenAIResponse: The OpenAI API response containing the translated text.
@@ -95,52 +562,38 @@ class OpenAIService:
         """
 
         try:
-            response = openai.Translation.create(
-                model="gpt-3.5-turbo",
-                from_language=source_language,
-                to_language=target_language,
-                text=text,
-            )
-            return OpenAIResponse(response=response.choices[0].text)
+            with count_tokens() as tally:
+                response = await self._call(
+                    "translate_text",
+                    "gpt-3.5-turbo",
+                    # The translation is about as long as the input.
+                    2 * estimate_tokens(text),
+                    lambda client: client.chat.completions.with_raw_response.create(
+                        model="gpt-3.5-turbo",
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": f"Translate the user's text from {source_language} to {target_language}. Reply with the translation only.",
+                            },
+                            {"role": "user", "content": text},
+                        ],
+                    ),
+                    api_key=api_key,
+                )
+                record_tokens("gpt-3.5-turbo", getattr(response, "usage", None))
+            return OpenAIResponse(response=response.choices[0].message.content, usage=tally.usage())
 
-        except AuthenticationError:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid OpenAI API key. Please check your API key.",
-            )
-        except RateLimitError:
-            raise HTTPException(
-                status_code=429,
-                detail="OpenAI API rate limit exceeded. Please try again later.",
-            )
-        except InvalidRequestError:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid request to OpenAI API. Please check your input parameters.",
-            )
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail="Request to OpenAI API timed out. Please try again later.",
-            )
-        except APIConnectionError:
-            raise HTTPException(
-                status_code=500,
-                detail="Error connecting to OpenAI API. Please check your internet connection.",
-            )
-        except APIError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error calling OpenAI API: {str(e)}",
-            )
+        except Exception as e:
+            raise upstream_http_error(e)
 
-    async def summarize_text(self, text: str, model: str = "text-davinci-003") -> OpenAIResponse:
+    async def summarize_text(self, text: str, model: str = "text-davinci-003", api_key: Optional[str] = None) -> OpenAIResponse:
         """
         Summarizes a given text using OpenAI's summarization API.
 
         Args:
             text (str): The text to be summarized.
             model (str, optional): The OpenAI model to use. Defaults to "text-davinci-003".
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
 
         Returns:
             OpenAIResponse: The OpenAI API response containing the summarized text.
@@ -150,51 +603,161 @@ class OpenAIService:
         """
 
         try:
-            response = openai.Completion.create(
-                engine=model,
-                prompt=f"Summarize the following text:\n\n{text}",
-                temperature=0.7,
-                max_tokens=256,
-            )
-            return OpenAIResponse(response=response.choices[0].text)
+            scope = f"summarize_text:{model}"
+            cached, vector = await self._cached(scope, text, api_key)
+            if cached is not None:
+                return OpenAIResponse(response=cached)
+            with count_tokens() as tally:
+                response = await self._call(
+                    "summarize_text",
+                    model,
+                    estimate_tokens(text) + 256,
+                    lambda client: client.completions.with_raw_response.create(
+                        model=model,
+                        prompt=f"Summarize the following text:\n\n{text}",
+                        temperature=0.7,
+                        max_tokens=256,
+                    ),
+                    api_key=api_key,
+                )
+                record_tokens(model, getattr(response, "usage", None))
+            self._remember(scope, text, vector, response.choices[0].text)
+            return OpenAIResponse(response=response.choices[0].text, usage=tally.usage())
 
-        except AuthenticationError:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid OpenAI API key. Please check your API key.",
-            )
-        except RateLimitError:
-            raise HTTPException(
-                status_code=429,
-                detail="OpenAI API rate limit exceeded. Please try again later.",
-            )
-        except InvalidRequestError:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid request to OpenAI API. Please check your input parameters.",
-            )
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail="Request to OpenAI API timed out. Please try again later.",
-            )
-        except APIConnectionError:
-            raise HTTPException(
-                status_code=500,
-                detail="Error connecting to OpenAI API. Please check your internet connection.",
-            )
-        except APIError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error calling OpenAI API: {str(e)}",
+        except Exception as e:
+            raise upstream_http_error(e)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 256,
+        api_key: Optional[str] = None,
+    ) -> OpenAIResponse:
+        """
+        Answers a conversation using OpenAI's chat completion API.
+
+        Args:
+            messages (List[Dict[str, str]]): The conversation, as ``role`` and ``content`` pairs.
+            model (str, optional): The chat model to use. Defaults to "gpt-3.5-turbo".
+            temperature (float, optional): Sampling temperature. Defaults to 0.7.
+            max_tokens (int, optional): The maximum number of tokens to generate. Defaults to 256.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
+
+        Returns:
+            OpenAIResponse: The OpenAI API response containing the assistant's reply.
+
+        Raises:
+            HTTPException: If an error occurs during the API call.
+        """
+        try:
+            with count_tokens() as tally:
+                response = await self._call(
+                    "chat",
+                    model,
+                    sum(estimate_tokens(message["content"]) for message in messages) + max_tokens,
+                    lambda client: client.chat.completions.with_raw_response.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                    ),
+                    api_key=api_key,
+                )
+                record_tokens(model, getattr(response, "usage", None))
+            return OpenAIResponse(response=response.choices[0].message.content or "", usage=tally.usage())
+
+        except Exception as e:
+            raise upstream_http_error(e)
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 256,
+        api_key: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streams a chat completion, yielding each piece of text as the upstream produces it.
+
+        Stopping the iteration early (``aclose``, or cancelling the task iterating it) closes
+        the upstream stream, so the generation stops there rather than running to the end.
+        So does the deadline of the iterating task passing, even while waiting for a chunk.
+
+        The stream's usage, sent in its last chunk, is counted in the iterating task's
+        ``TokenTally``; a stream stopped before then is counted from estimates instead.
+
+        Args:
+            messages (List[Dict[str, str]]): The conversation, as ``role`` and ``content`` pairs.
+            model (str, optional): The chat model to use. Defaults to "gpt-3.5-turbo".
+            temperature (float, optional): Sampling temperature. Defaults to 0.7.
+            max_tokens (int, optional): The maximum number of tokens to generate. Defaults to 256.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
+
+        Yields:
+            str: The text of each streamed chunk.
+
+        Raises:
+            HTTPException: If the call fails, before or during the stream.
+        """
+        try:
+            stream = await self._call(
+                "stream_chat",
+                model,
+                sum(estimate_tokens(message["content"]) for message in messages) + max_tokens,
+                lambda client: client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                api_key=api_key,
             )
+        except Exception as e:
+            raise upstream_http_error(e)
+        usage = None
+        generated = 0
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                left = remaining()
+                if left is not None and left <= 0:
+                    raise deadline_exceeded("upstream")
+                # Each read is bounded by the deadline, so a stalled stream is stopped on time.
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), left)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise deadline_exceeded("upstream")
+                # The last chunk carries the usage of the whole stream and no choices.
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                    record_tokens(model, usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    generated += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise upstream_http_error(e)
+        finally:
+            await stream.close()
+            if usage is None:
+                # Stopped early: the upstream still charged for the prompt and what it generated.
+                prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+                completion_tokens = generated // 4
+                record_tokens(model, OpenAIUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens))
 
-    async def get_model(self, model_id: str) -> OpenAIModel:
+    async def get_model(self, model_id: str, api_key: Optional[str] = None) -> OpenAIModel:
         """
         Retrieves information about a specific OpenAI model.
 
         Args:
             model_id (str): The ID of the OpenAI model to retrieve.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
 
         Returns:
             OpenAIModel: The OpenAI model information.
@@ -203,38 +766,13 @@ class OpenAIService:
             HTTPException: If an error occurs during the API call.
         """
         try:
-            response = openai.Model.retrieve(model_id)
-            return OpenAIModel(**response)
-        except AuthenticationError:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid OpenAI API key. Please check your API key.",
-            )
-        except RateLimitError:
-            raise HTTPException(
-                status_code=429,
-                detail="OpenAI API rate limit exceeded. Please try again later.",
-            )
-        except InvalidRequestError:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid request to OpenAI API. Please check your input parameters.",
-            )
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail="Request to OpenAI API timed out. Please try again later.",
-            )
-        except APIConnectionError:
-            raise HTTPException(
-                status_code=500,
-                detail="Error connecting to OpenAI API. Please check your internet connection.",
-            )
-        except APIError as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error calling OpenAI API: {str(e)}",
+            label = model_id if model_id in KNOWN_MODELS else "other"
+            response = await self._call(
+                "get_model", label, 0, lambda client: client.models.with_raw_response.retrieve(model_id), api_key=api_key
             )
+            return OpenAIModel(**response.model_dump())
+        except Exception as e:
+            raise upstream_http_error(e)
 
 
-openai_service = OpenAIService()
\ No newline at end of file
+openai_service = OpenAIService(backends=parse_backends(OPENAI_BACKENDS, default_credentials, OPENAI_ORGANIZATION) or None)
\ No newline at end of file
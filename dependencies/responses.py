@@ -0,0 +1,22 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered in a single C/Rust pass.
+
+    Pydantic models are serialized straight to bytes by pydantic-core and everything
+    else (dicts, lists, datetimes, NumPy arrays) by orjson. Routes return this instead
+    of running ``jsonable_encoder`` and ``JSONResponse``, and because a ``Response`` is
+    returned FastAPI also skips re-validating it against ``response_model``, which then
+    only documents the schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
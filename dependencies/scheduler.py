@@ -0,0 +1,282 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from dependencies.auth import get_current_user
+from dependencies.deadline import deadline_exceeded, remaining
+from dependencies.limiter import AdaptiveLimit, upstream_limit
+from dependencies.metrics import SCHEDULER_QUEUED, SCHEDULER_REJECTIONS, SCHEDULER_WAIT
+from models.user import User
+
+# Priority tiers as "name=weight". Under contention each user's requests of a tier get
+# slots in proportion to the tier's weight.
+SCHEDULER_PRIORITIES = os.environ.get("SCHEDULER_PRIORITIES", "interactive=4,batch=1")
+# Tier of users without one of their own (User.priority).
+SCHEDULER_DEFAULT_PRIORITY = os.environ.get("SCHEDULER_DEFAULT_PRIORITY", "interactive")
+# Longest a request waits for a slot, per tier ("name=seconds"), before a 503. Requests
+# expected to wait longer get the 503 at once. Keep wait plus OPENAI_TIMEOUT under
+# gunicorn's timeout.
+SCHEDULER_QUEUE_TIMEOUTS = os.environ.get("SCHEDULER_QUEUE_TIMEOUTS", "interactive=10,batch=30")
+# Requests one user may have waiting (429 beyond), and all users together (503 beyond).
+SCHEDULER_MAX_QUEUE_PER_USER = int(os.environ.get("SCHEDULER_MAX_QUEUE_PER_USER", "32"))
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "1024"))
+
+FlowKey = Tuple[int, str]
+
+# Weight of a new sample in the average time a request holds its slot.
+_HOLD_ALPHA = 0.1
+
+
+def parse_tiers(value: str, cast=float) -> Dict[str, float]:
+    """Parses ``"name=value,..."`` into a dict, e.g. ``SCHEDULER_PRIORITIES``."""
+    tiers = {}
+    for entry in value.split(","):
+        name, _, number = entry.strip().partition("=")
+        if name:
+            tiers[name.strip()] = cast(number)
+    return tiers
+
+
+class Flow:
+    """The requests of one user at one priority: how many hold a slot and which are waiting."""
+
+    __slots__ = ("weight", "in_flight", "waiters", "served")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # When the flow was last granted a slot; breaks ties in favour of the longest unserved.
+        self.served = 0
+
+
+class FairScheduler:
+    """
+    Shares a worker's upstream concurrency slots fairly between users.
+
+    While slots are free every request gets one at once. Once they are all taken,
+    requests queue per user and priority (a flow), and each freed slot goes to the
+    waiting flow holding the fewest slots relative to its weight. A user with a
+    long batch job therefore keeps at most their share once others are waiting,
+    and interactive requests get ``weight`` times the share of batch ones.
+
+    The number of slots follows an ``AdaptiveLimit``. A request whose expected wait
+    (the requests it would queue behind, times the average time a slot is held,
+    over the slots) exceeds its tier's timeout is turned away at once rather than
+    left to time out in the queue.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[AdaptiveLimit] = None,
+        priorities: Optional[Dict[str, float]] = None,
+        default_priority: str = SCHEDULER_DEFAULT_PRIORITY,
+        timeouts: Optional[Dict[str, float]] = None,
+        max_queue_per_user: int = SCHEDULER_MAX_QUEUE_PER_USER,
+        max_queue: int = SCHEDULER_MAX_QUEUE,
+    ):
+        """
+        Args:
+            limit (AdaptiveLimit, optional): Sets the number of slots. Defaults to the worker's ``upstream_limit``.
+            priorities (Dict[str, float], optional): Weight per tier. Defaults to ``SCHEDULER_PRIORITIES``.
+            default_priority (str, optional): Tier of users without one. Defaults to ``SCHEDULER_DEFAULT_PRIORITY``.
+            timeouts (Dict[str, float], optional): Longest wait per tier, in seconds. Defaults to
+                ``SCHEDULER_QUEUE_TIMEOUTS``; tiers without one wait indefinitely.
+            max_queue_per_user (int, optional): Waiting requests per user. Defaults to ``SCHEDULER_MAX_QUEUE_PER_USER``.
+            max_queue (int, optional): Waiting requests in total. Defaults to ``SCHEDULER_MAX_QUEUE``.
+        """
+        self.limit = limit or upstream_limit
+        self.priorities = priorities or parse_tiers(SCHEDULER_PRIORITIES)
+        self.default_priority = default_priority
+        self.timeouts = parse_tiers(SCHEDULER_QUEUE_TIMEOUTS) if timeouts is None else timeouts
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue = max_queue
+        self.in_use = 0
+        self.flows: Dict[FlowKey, Flow] = {}
+        self._queued_by_user: Counter = Counter()
+        self._queued = 0
+        self._clock = itertools.count(1)
+        # Average seconds a request holds its slot, once one has finished.
+        self.hold_seconds: Optional[float] = None
+
+    @property
+    def slots(self) -> int:
+        return self.limit.limit
+
+    def expected_wait(self, priority: str) -> Optional[float]:
+        """
+        Seconds a request of ``priority`` queued now would likely wait, or None before any request finished.
+
+        Waiters of lower-weight tiers count for the fraction of a slot they compete for.
+        """
+        if self.hold_seconds is None:
+            return None
+        weight = self.priorities.get(priority, 1.0)
+        ahead = sum(len(flow.waiters) * min(1.0, flow.weight / weight) for flow in self.flows.values())
+        return (ahead + 1) * self.hold_seconds / max(self.slots, 1)
+
+    def priority_for(self, user_priority: Optional[str], requested: Optional[str] = None) -> str:
+        """
+        The tier a request runs at: ``requested`` if given, but never above the user's own tier.
+
+        Raises:
+            HTTPException: If ``requested`` is not a configured tier.
+        """
+        priority = user_priority if user_priority in self.priorities else self.default_priority
+        if requested is None:
+            return priority
+        if requested not in self.priorities:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown priority {requested!r}. Choose from: {', '.join(self.priorities)}",
+            )
+        return min(priority, requested, key=lambda tier: self.priorities[tier])
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, priority: str):
+        """Holds a slot for the enclosed block; see ``acquire``."""
+        await self.acquire(user_id, priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(user_id, priority, time.perf_counter() - started)
+
+    async def acquire(self, user_id: int, priority: str) -> None:
+        """
+        Waits for a slot.
+
+        Raises:
+            HTTPException: 429 when the user already has ``max_queue_per_user`` requests waiting;
+                503 when ``max_queue`` requests are waiting, the expected wait exceeds the tier's timeout,
+                or no slot frees up within it; 504 when the request's deadline passes, or is expected
+                to, before it gets a slot.
+        """
+        key = (user_id, priority)
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = Flow(self.priorities.get(priority, 1.0))
+        if self.in_use < self.slots and not self._queued:
+            self._grant(flow)
+            return
+        if self._queued_by_user[user_id] >= self.max_queue_per_user:
+            self._reject(key, "user_queue_full", status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests waiting. Please slow down.")
+        if self._queued >= self.max_queue:
+            self._reject(key, "queue_full", status.HTTP_503_SERVICE_UNAVAILABLE, "Server busy. Please try again later.")
+        timeout = self.timeouts.get(priority)
+        expected = self.expected_wait(priority)
+        if timeout is not None and expected is not None and expected > timeout:
+            self._reject(key, "shed", status.HTTP_503_SERVICE_UNAVAILABLE, "Server busy. Please try again later.", expected)
+        left = remaining()
+        bounded = left is not None and (timeout is None or left < timeout)
+        if bounded:
+            # The caller stops waiting sooner than the tier would: queue no longer than that.
+            timeout = left
+            if left <= 0 or (expected is not None and expected > left):
+                self._abandon(key)
+
+        waiter = asyncio.get_running_loop().create_future()
+        flow.waiters.append(waiter)
+        self._queued += 1
+        self._queued_by_user[user_id] += 1
+        SCHEDULER_QUEUED.labels(priority).inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the wait ended; hand the slot on.
+                self.release(user_id, priority)
+            else:
+                self._dequeue(key, flow, waiter)
+            if isinstance(e, asyncio.TimeoutError) and bounded:
+                self._abandon(key)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(
+                    key,
+                    "timeout",
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "Timed out waiting for capacity. Please try again later.",
+                    self.expected_wait(priority) or 1,
+                )
+            raise
+        finally:
+            SCHEDULER_WAIT.labels(priority).observe(time.perf_counter() - started)
+
+    def release(self, user_id: int, priority: str, seconds: Optional[float] = None) -> None:
+        """Returns a slot held for ``seconds`` and hands it to the next waiting flow."""
+        if seconds is not None:
+            self.hold_seconds = seconds if self.hold_seconds is None else self.hold_seconds + _HOLD_ALPHA * (seconds - self.hold_seconds)
+        key = (user_id, priority)
+        flow = self.flows[key]
+        flow.in_flight -= 1
+        self.in_use -= 1
+        self._forget(key, flow)
+        self._dispatch()
+
+    def _grant(self, flow: Flow) -> None:
+        flow.in_flight += 1
+        flow.served = next(self._clock)
+        self.in_use += 1
+
+    def _dispatch(self) -> None:
+        while self.in_use < self.slots and self._queued:
+            key, flow = min(
+                ((key, flow) for key, flow in self.flows.items() if flow.waiters),
+                key=lambda item: (item[1].in_flight / item[1].weight, item[1].served),
+            )
+            waiter = flow.waiters.popleft()
+            self._queued -= 1
+            self._queued_by_user[key[0]] -= 1
+            SCHEDULER_QUEUED.labels(key[1]).dec()
+            self._grant(flow)
+            waiter.set_result(None)
+
+    def _dequeue(self, key: FlowKey, flow: Flow, waiter: asyncio.Future) -> None:
+        flow.waiters.remove(waiter)
+        self._queued -= 1
+        self._queued_by_user[key[0]] -= 1
+        SCHEDULER_QUEUED.labels(key[1]).dec()
+        self._forget(key, flow)
+
+    def _forget(self, key: FlowKey, flow: Flow) -> None:
+        if not flow.in_flight and not flow.waiters:
+            del self.flows[key]
+        if not self._queued_by_user[key[0]]:
+            del self._queued_by_user[key[0]]
+
+    def _abandon(self, key: FlowKey):
+        """Turns away a request whose deadline passes, or would, before it gets a slot."""
+        SCHEDULER_REJECTIONS.labels(key[1], "deadline").inc()
+        flow = self.flows.get(key)
+        if flow is not None:
+            self._forget(key, flow)
+        raise deadline_exceeded("queue")
+
+    def _reject(self, key: FlowKey, reason: str, status_code: int, detail: str, retry_after: float = 1):
+        SCHEDULER_REJECTIONS.labels(key[1], reason).inc()
+        flow = self.flows.get(key)
+        if flow is not None:
+            self._forget(key, flow)
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+scheduler = FairScheduler()
+
+
+async def fair_share(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Route dependency holding one of the worker's upstream slots while the request is handled.
+
+    The tier is the user's (``User.priority``), or a lower one chosen with an ``X-Priority`` header.
+    """
+    priority = scheduler.priority_for(current_user.priority, request.headers.get("x-priority"))
+    async with scheduler.slot(current_user.id, priority):
+        yield
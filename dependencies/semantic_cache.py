@@ -0,0 +1,307 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which a cached prompt counts as the same question.
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Entries kept per worker; beyond this the least recently used entry is replaced.
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+# Directory the index is loaded from at startup (memory-mapped) and saved to when a worker exits.
+SEMANTIC_CACHE_PATH = os.environ.get("SEMANTIC_CACHE_PATH") or None
+SEMANTIC_CACHE_EMBEDDING_MODEL = os.environ.get("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+# Embedding size requested from the API; text-embedding-3 models shorten vectors on request.
+SEMANTIC_CACHE_DIMENSIONS = int(os.environ.get("SEMANTIC_CACHE_DIMENSIONS", "256"))
+
+SIGNATURE_BITS = 256
+_SIGNATURE_WORDS = SIGNATURE_BITS // 64
+_INITIAL_CAPACITY = 1024
+
+
+def normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Unit vectors with a nearest-neighbour search by cosine similarity.
+
+    A brute-force search over 100k vectors of 256 floats reads 100 MB per query, which
+    takes milliseconds. Each vector therefore also gets a 256-bit random-hyperplane
+    signature (SimHash). The Hamming distance between two signatures estimates the
+    angle between the vectors, so a search first XORs and popcounts the signatures
+    (3 MB, stored word-major so every step is one contiguous vectorized pass), keeps
+    the slots within the distance a neighbour above ``threshold`` can have, and
+    computes exact dot products for those only.
+
+    Slots are filled in order and reused once ``max_size`` is reached, replacing the
+    least recently used entry. Every slot carries an integer label, and searches only
+    match slots with the same label.
+    """
+
+    def __init__(self, dimensions: int, max_size: int, threshold: float, capacity: int = _INITIAL_CAPACITY):
+        self.dimensions = dimensions
+        self.max_size = max_size
+        self.threshold = threshold
+        self.count = 0
+        # Fixed seed, so signatures stay comparable across processes and saved indexes.
+        self._planes = np.random.default_rng(0).standard_normal((dimensions, SIGNATURE_BITS)).astype(np.float32)
+        # Hamming distance a neighbour at exactly ``threshold`` stays within, with four
+        # standard deviations of margin, so true neighbours are practically never missed.
+        p = math.acos(max(-1.0, min(1.0, threshold))) / math.pi
+        self.max_distance = math.ceil(SIGNATURE_BITS * p + 4 * math.sqrt(SIGNATURE_BITS * p * (1 - p))) + 1
+        self._allocate(min(capacity, max_size))
+
+    def _allocate(self, capacity: int) -> None:
+        self.vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        self.signatures = np.zeros((_SIGNATURE_WORDS, capacity), dtype=np.uint64)
+        self.labels = np.zeros(capacity, dtype=np.int32)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self._scratch(capacity)
+
+    def _scratch(self, capacity: int) -> None:
+        self._xor = np.empty(capacity, dtype=np.uint64)
+        self._bits = np.empty(capacity, dtype=np.uint8)
+        self._distance = np.empty(capacity, dtype=np.uint16)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.labels)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def signature(self, vector: np.ndarray) -> np.ndarray:
+        return np.packbits((vector @ self._planes) > 0).view(np.uint64)
+
+    def search(self, vector: np.ndarray, label: int = 0) -> Tuple[Optional[int], float]:
+        """
+        Finds the most similar vector with ``label``.
+
+        Args:
+            vector (np.ndarray): A unit vector.
+            label (int, optional): Only slots with this label match.
+
+        Returns:
+            Tuple[Optional[int], float]: The slot and its similarity, or None and the best similarity
+                seen when nothing reaches ``threshold``.
+        """
+        count = self.count
+        if not count:
+            return None, 0.0
+        signature = self.signature(vector)
+        distance, xor, bits = self._distance[:count], self._xor[:count], self._bits[:count]
+        for word in range(_SIGNATURE_WORDS):
+            np.bitwise_xor(self.signatures[word, :count], signature[word], out=xor)
+            np.bitwise_count(xor, out=bits)
+            if word:
+                np.add(distance, bits, out=distance)
+            else:
+                distance[:] = bits
+        candidates = np.flatnonzero(distance <= self.max_distance)
+        candidates = candidates[self.labels[candidates] == label]
+        if not candidates.size:
+            return None, 0.0
+        scores = self.vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < self.threshold:
+            return None, score
+        slot = int(candidates[best])
+        self.last_used[slot] = time.monotonic()
+        return slot, score
+
+    def add(self, vector: np.ndarray, label: int = 0) -> Tuple[int, bool]:
+        """
+        Stores a unit vector.
+
+        Returns:
+            Tuple[int, bool]: The slot used, and whether it replaced an existing entry.
+        """
+        replaced = False
+        if self.count < self.capacity:
+            slot = self.count
+            self.count += 1
+        elif self.count < self.max_size:
+            self._grow(min(self.capacity * 2, self.max_size))
+            slot = self.count
+            self.count += 1
+        else:
+            slot = int(np.argmin(self.last_used[: self.count]))
+            replaced = True
+        self.vectors[slot] = vector
+        self.signatures[:, slot] = self.signature(vector)
+        self.labels[slot] = label
+        self.last_used[slot] = time.monotonic()
+        return slot, replaced
+
+    def _grow(self, capacity: int) -> None:
+        vectors, signatures, labels, last_used = self.vectors, self.signatures, self.labels, self.last_used
+        self._allocate(capacity)
+        count = self.count
+        self.vectors[:count] = vectors[:count]
+        self.signatures[:, :count] = signatures[:, :count]
+        self.labels[:count] = labels[:count]
+        self.last_used[:count] = last_used[:count]
+
+    def save(self, path: str) -> None:
+        """Writes the arrays to ``path`` at their full capacity, each replaced atomically."""
+        for name, array in (("vectors", self.vectors), ("signatures", self.signatures), ("labels", self.labels)):
+            temporary = os.path.join(path, f".{name}.{os.getpid()}.npy")
+            np.save(temporary, array)
+            os.replace(temporary, os.path.join(path, f"{name}.npy"))
+
+    def load(self, path: str, count: int, mmap: bool = True) -> None:
+        """
+        Reads arrays written by ``save``.
+
+        With ``mmap`` the arrays are memory-mapped copy-on-write: processes that load the
+        same index share its pages, and inserts change only the writing process's copy.
+        """
+        mode = "c" if mmap else None
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        signatures = np.load(os.path.join(path, "signatures.npy"), mmap_mode=mode)
+        labels = np.load(os.path.join(path, "labels.npy"), mmap_mode=mode)
+        capacity = len(labels)
+        if vectors.shape != (capacity, self.dimensions) or signatures.shape != (_SIGNATURE_WORDS, capacity) or not count <= min(capacity, self.max_size):
+            raise ValueError(f"The index in {path} does not match {self.dimensions} dimensions.")
+        self.vectors, self.signatures, self.labels = vectors, signatures, labels
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        # Oldest first until used again.
+        self.last_used[:count] = np.arange(count)
+        self.count = count
+        self._scratch(capacity)
+
+
+class SemanticCache:
+    """
+    Responses keyed by prompt meaning rather than exact text.
+
+    Prompts are embedded and stored in a ``VectorIndex``; a new prompt whose embedding is
+    at least ``threshold`` similar to a cached one within the same scope (the endpoint,
+    model and generation parameters) gets the cached response. Exact repeats are found
+    by hash first, without embedding the prompt again.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = SEMANTIC_CACHE_DIMENSIONS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        embedding_model: str = SEMANTIC_CACHE_EMBEDDING_MODEL,
+        path: Optional[str] = SEMANTIC_CACHE_PATH,
+    ):
+        """
+        Args:
+            dimensions (int, optional): Embedding size. Defaults to ``SEMANTIC_CACHE_DIMENSIONS``.
+            max_entries (int, optional): Entries kept. Defaults to ``SEMANTIC_CACHE_MAX_ENTRIES``.
+            threshold (float, optional): Minimum cosine similarity for a hit. Defaults to ``SEMANTIC_CACHE_THRESHOLD``.
+            embedding_model (str, optional): Model embedding the prompts. Defaults to ``SEMANTIC_CACHE_EMBEDDING_MODEL``.
+            path (str, optional): Directory to load the index from, if it exists, and to ``save`` to.
+                Defaults to ``SEMANTIC_CACHE_PATH``.
+        """
+        self.embedding_model = embedding_model
+        self.dimensions = dimensions
+        self.path = path
+        self.index = VectorIndex(dimensions, max_entries, threshold)
+        self.responses: List[Optional[str]] = []
+        self.keys: List[Optional[str]] = []
+        self.exact: Dict[str, int] = {}
+        self.scopes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(os.path.join(path, "entries.json")):
+            try:
+                self.load(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring the semantic cache in {path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @staticmethod
+    def _key(scope: str, text: str) -> str:
+        return hashlib.sha256(f"{scope}\0{text}".encode("utf-8")).hexdigest()
+
+    def _label(self, scope: str) -> int:
+        return self.scopes.setdefault(scope, len(self.scopes))
+
+    def get_exact(self, scope: str, text: str) -> Optional[str]:
+        """Returns the response cached for exactly this prompt, if any."""
+        with self._lock:
+            slot = self.exact.get(self._key(scope, text))
+            if slot is None:
+                return None
+            self.index.last_used[slot] = time.monotonic()
+            return self.responses[slot]
+
+    def get(self, scope: str, vector) -> Optional[str]:
+        """Returns the response cached for the most similar prompt in ``scope``, if similar enough."""
+        with self._lock:
+            label = self.scopes.get(scope)
+            if label is None:
+                return None
+            slot, _ = self.index.search(normalize(vector), label)
+            return None if slot is None else self.responses[slot]
+
+    def put(self, scope: str, text: str, vector, response: str) -> None:
+        """Caches ``response`` for the prompt ``text`` with embedding ``vector``."""
+        key = self._key(scope, text)
+        with self._lock:
+            if key in self.exact:
+                return
+            slot, replaced = self.index.add(normalize(vector), self._label(scope))
+            if replaced:
+                self.exact.pop(self.keys[slot], None)
+                self.responses[slot], self.keys[slot] = response, key
+            else:
+                self.responses.append(response)
+                self.keys.append(key)
+            self.exact[key] = slot
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Writes the index to ``path`` (default: the configured path); ``entries.json`` is written last."""
+        path = path or self.path
+        if path is None:
+            return
+        os.makedirs(path, exist_ok=True)
+        # Workers save when they exit; the file lock keeps two of them from interleaving files.
+        with self._lock, open(os.path.join(path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.index.save(path)
+            entries = {
+                "dimensions": self.dimensions,
+                "count": len(self.index),
+                "scopes": list(self.scopes),
+                "keys": self.keys,
+                "responses": self.responses,
+            }
+            temporary = os.path.join(path, f".entries.{os.getpid()}.json")
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(temporary, os.path.join(path, "entries.json"))
+
+    def load(self, path: str, mmap: bool = True) -> None:
+        """Replaces the cache with the one saved in ``path``; see ``VectorIndex.load``."""
+        with open(os.path.join(path, "entries.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+        count = entries["count"]
+        if entries["dimensions"] != self.dimensions or len(entries["keys"]) != count or len(entries["responses"]) != count:
+            raise ValueError("entries.json does not match the index configuration.")
+        with self._lock:
+            self.index.load(path, count, mmap=mmap)
+            self.scopes = {scope: label for label, scope in enumerate(entries["scopes"])}
+            self.keys = entries["keys"]
+            self.responses = entries["responses"]
+            self.exact = {key: slot for slot, key in enumerate(self.keys)}
+        logger.info(f"Loaded {count} semantic cache entries from {path}")
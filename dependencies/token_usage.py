@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+
+class TokenTally:
+    """
+    Adds up the token usage the upstream reports for the calls made in a scope, per model.
+
+    Scopes nest: usage counted in one is also counted in the scopes around it, so the
+    tally a request opens includes every upstream call made for it, by whichever method
+    (cascades, summaries, embedding batches and streams alike).
+    """
+
+    __slots__ = ("models", "parent")
+
+    def __init__(self, parent: Optional["TokenTally"] = None):
+        # Calls, prompt tokens and completion tokens per model.
+        self.models: Dict[str, List[int]] = {}
+        self.parent = parent
+
+    def add(self, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        tally = self
+        while tally is not None:
+            counts = tally.models.get(model)
+            if counts is None:
+                counts = tally.models[model] = [0, 0, 0]
+            counts[0] += 1
+            counts[1] += prompt_tokens
+            counts[2] += completion_tokens
+            tally = tally.parent
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(counts[1] for counts in self.models.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(counts[2] for counts in self.models.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(counts[1] + counts[2] for counts in self.models.values())
+
+    def usage(self) -> Optional[Dict[str, int]]:
+        """The totals as an ``OpenAIUsage``, or None when no upstream call reported usage (e.g. a cache hit)."""
+        if not self.models:
+            return None
+        prompt_tokens, completion_tokens = self.prompt_tokens, self.completion_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+_current_tally: ContextVar[Optional[TokenTally]] = ContextVar("token_tally", default=None)
+
+
+@contextmanager
+def count_tokens():
+    """
+    Opens a ``TokenTally`` for the enclosed block, nested in the current one if any.
+
+    Tasks started inside the block share the tally, as they copy the context.
+    """
+    tally = TokenTally(_current_tally.get())
+    token = _current_tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _current_tally.reset(token)
+
+
+def add_tokens(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """Counts an upstream call's usage in the current tally; does nothing outside ``count_tokens``."""
+    tally = _current_tally.get()
+    if tally is not None:
+        tally.add(model, prompt_tokens, completion_tokens)
@@ -1,17 +1,27 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Type, TypeVar
 import logging
 import os
+import time
 from datetime import datetime, timedelta
 
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
 
+from .auth import get_current_user
 from .config import settings
 from .database import get_db
-from .models import User
-from .schemas.openai import OpenAIRequest, OpenAIResponse, OpenAIModel
+from models.user import User
+from .openai import openai_service
+from .timing import stage
+from .token_usage import TokenTally, count_tokens
+from api.schemas.openai import OpenAIRequest, OpenAIResponse, OpenAIModel
+from services.usage import usage_service
 
 logger = logging.getLogger(__name__)
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
 # --- Constants ---
 
 # ... (Constants specific to this file if any)
@@ -33,29 +43,92 @@ def generate_api_key():
     """Generates a random API key."""
     # ... (Implementation for generating a random API key)
 
-def log_api_usage(user: User, endpoint: str, response_time: float) -> None:
-    """Logs API usage statistics."""
-    db = get_db()
+def log_api_usage(
+    user: User,
+    endpoint: str,
+    response_time: float,
+    status_code: int = status.HTTP_200_OK,
+    tokens: Optional[TokenTally] = None,
+) -> None:
+    """
+    Logs API usage statistics (``response_time`` in milliseconds) and folds them into the usage rollups.
+
+    ``tokens`` is the upstream token usage of the call, as counted by ``count_tokens``.
+    """
     try:
-        # ... (Implementation for logging API usage)
+        usage_service.record(
+            user.id,
+            endpoint,
+            status_code,
+            int(response_time),
+            prompt_tokens=tokens.prompt_tokens if tokens else 0,
+            completion_tokens=tokens.completion_tokens if tokens else 0,
+            models=tokens.models if tokens else None,
+        )
     except Exception as e:
         logger.error(f"Error logging API usage: {e}")
 
+def track_api_usage(endpoint: str):
+    """
+    Returns a route dependency that logs usage of ``endpoint`` once the request has been handled,
+    with the tokens of every upstream call made for it.
+    """
+    async def dependency(current_user: User = Depends(get_current_user)):
+        start = time.perf_counter()
+        status_code = status.HTTP_200_OK
+        with count_tokens() as tally:
+            try:
+                yield
+            except HTTPException as e:
+                status_code = e.status_code
+                raise
+            except Exception:
+                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                raise
+            finally:
+                log_api_usage(current_user, endpoint, (time.perf_counter() - start) * 1000, status_code, tally)
+    return dependency
+
+def json_body(model: Type[ModelT]):
+    """
+    Returns a route dependency that parses the request body into ``model``.
+
+    The raw bytes are handed to ``model_validate_json``, so parsing and validation
+    happen in one pass in pydantic-core instead of decoding to Python objects first.
+    Errors are raised as ``RequestValidationError`` and render as FastAPI's usual 422.
+    Pair it with ``json_body_openapi`` so the body still appears in the OpenAPI schema.
+    """
+    async def dependency(request: Request) -> ModelT:
+        body = await request.body()
+        with stage("validate"):
+            try:
+                return model.model_validate_json(body)
+            except ValidationError as e:
+                errors = [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+                raise RequestValidationError(errors, body=body)
+    return dependency
+
+def json_body_openapi(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Returns the ``openapi_extra`` documenting ``model`` as a route's JSON request body."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
+
 def format_openai_response(response: Dict[str, Any]) -> OpenAIResponse:
     """Formats the OpenAI API response into a structured OpenAIResponse object."""
     # ... (Implementation for formatting the OpenAI API response)
 
 async def get_openai_model(model_id: str, user: User) -> OpenAIModel:
-    """Retrieves information about a specific OpenAI model."""
+    """Retrieves information about a specific OpenAI model using the user's own API key."""
     api_key = get_api_key(user)
     if not api_key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API key not found.")
-    openai.api_key = api_key
-    try:
-        model = openai.Model.retrieve(model_id)
-        return OpenAIModel(**model)
-    except openai.error.APIError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error retrieving model: {e}")
+    # The key is passed per call and served by a client of its own, never set on the
+    # openai module, so concurrent requests cannot pick up each other's keys.
+    return await openai_service.get_model(model_id, api_key=api_key)
 
 # --- Classes ---
 
@@ -0,0 +1,316 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+# Directory holding one sub-directory per user and collection.
+VECTOR_STORE_PATH = os.environ.get("VECTOR_STORE_PATH", "vector_store")
+# Rows per segment file. Full segments are never written again, so each worker maps them once.
+VECTOR_STORE_SEGMENT_ROWS = int(os.environ.get("VECTOR_STORE_SEGMENT_ROWS", "65536"))
+
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def filter_values(expected: Any) -> List[bytes]:
+    """
+    The JSON encodings of the metadata values a filter entry accepts.
+
+    A value matches itself; a list also matches any of its items, e.g. ``{"lang": ["en", "fr"]}``.
+    """
+    values = [orjson.dumps(expected, option=orjson.OPT_SORT_KEYS)]
+    if isinstance(expected, list):
+        values.extend(orjson.dumps(item, option=orjson.OPT_SORT_KEYS) for item in expected)
+    return values
+
+
+class Segment:
+    """
+    One append-only pair of files: ``<n>.f32`` holds unit vectors as raw float32 rows,
+    ``<n>.jsonl`` one ``{"id", "text", "metadata"}`` line per row.
+
+    The vectors are mapped read-only, so the pages live once in the OS page cache and are
+    shared by every worker mapping them. A row exists once its sidecar line is complete:
+    writers append the vectors first, and ``repair`` drops anything written past the last
+    complete line by a writer that died.
+    """
+
+    def __init__(self, prefix: str, dimensions: int):
+        self.vectors_path = prefix + ".f32"
+        self.sidecar_path = prefix + ".jsonl"
+        self.dimensions = dimensions
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self._offset = 0
+        # Metadata key -> (rows indexed, JSON-encoded value -> rows), built on the first filter by that key.
+        self._postings: Dict[str, Tuple[int, Dict[bytes, List[int]]]] = {}
+        self._postings_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return 0 if self.matrix is None else len(self.matrix)
+
+    def refresh(self) -> None:
+        """Loads the rows appended since the last refresh, by this or any other process."""
+        try:
+            size = os.path.getsize(self.sidecar_path)
+        except FileNotFoundError:
+            return
+        if size <= self._offset:
+            return
+        with open(self.sidecar_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            entry = orjson.loads(line)
+            self.ids.append(entry["id"])
+            self.texts.append(entry["text"])
+            self.metadata.append(entry["metadata"])
+        self._offset += complete
+        rows = min(len(self.ids), os.path.getsize(self.vectors_path) // (4 * self.dimensions))
+        if rows and rows != len(self):
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimensions))
+
+    def repair(self) -> None:
+        """Truncates both files to the rows loaded by ``refresh``. Only call with the collection locked."""
+        for path, size in ((self.vectors_path, len(self.ids) * 4 * self.dimensions), (self.sidecar_path, self._offset)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def append(self, vectors: np.ndarray, ids: List[str], texts: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """Appends rows. Only call with the collection locked, after ``refresh`` and ``repair``."""
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        lines = b"".join(
+            orjson.dumps({"id": id, "text": text, "metadata": meta}) + b"\n" for id, text, meta in zip(ids, texts, metadata)
+        )
+        with open(self.sidecar_path, "ab") as f:
+            f.write(lines)
+
+    def mask(self, filter: Dict[str, Any], rows: int) -> np.ndarray:
+        """
+        Marks the first ``rows`` rows whose metadata has, for every key of ``filter``, one of the
+        values in ``filter_values``. A missing key counts as ``null``.
+        """
+        mask = np.ones(rows, dtype=bool)
+        for key, expected in filter.items():
+            postings = self._index(key)
+            matching = np.zeros(len(self.metadata), dtype=bool)
+            for value in filter_values(expected):
+                if value in postings:
+                    matching[postings[value]] = True
+            mask &= matching[:rows]
+        return mask
+
+    def _index(self, key: str) -> Dict[bytes, List[int]]:
+        """Rows by JSON-encoded value of ``key``, extended to rows loaded since the last call."""
+        with self._postings_lock:
+            indexed, postings = self._postings.get(key, (0, {}))
+            metadata = self.metadata
+            for row in range(indexed, len(metadata)):
+                value = orjson.dumps(metadata[row].get(key), option=orjson.OPT_SORT_KEYS)
+                postings.setdefault(value, []).append(row)
+            self._postings[key] = (len(metadata), postings)
+            return postings
+
+    def top_k(self, query: np.ndarray, k: int, filter: Optional[Dict[str, Any]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the scores and rows of the ``k`` best matches of ``query``, unsorted.
+
+        One matrix-vector product scores every row; ``argpartition`` then picks the best
+        ``k`` without sorting the rest.
+        """
+        matrix = self.matrix
+        if matrix is None:
+            return np.empty(0, np.float32), np.empty(0, np.intp)
+        scores = matrix @ query
+        if filter:
+            scores[~self.mask(filter, len(matrix))] = -np.inf
+        if k < len(scores):
+            rows = np.argpartition(scores, -k)[-k:]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.isfinite(scores[rows])]
+        return scores[rows], rows
+
+
+class Collection:
+    """
+    Documents with their embeddings, searchable by cosine similarity.
+
+    ``collection.json`` records the embedding model and size; the rows are spread over
+    segments of at most ``segment_rows``. Appends from any worker are serialized by a
+    file lock, and every worker picks them up on its next search.
+    """
+
+    def __init__(self, path: str, model: str, dimensions: int, segment_rows: int = VECTOR_STORE_SEGMENT_ROWS):
+        self.path = path
+        self.model = model
+        self.dimensions = dimensions
+        self.segment_rows = segment_rows
+        self.segments: List[Segment] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    @classmethod
+    def open(cls, path: str, segment_rows: int = VECTOR_STORE_SEGMENT_ROWS) -> "Collection":
+        """
+        Opens the collection saved in ``path``.
+
+        Raises:
+            FileNotFoundError: If there is no collection in ``path``.
+        """
+        with open(os.path.join(path, "collection.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        collection = cls(path, config["model"], config["dimensions"], segment_rows)
+        collection.refresh()
+        return collection
+
+    @classmethod
+    def create(cls, path: str, model: str, dimensions: int, segment_rows: int = VECTOR_STORE_SEGMENT_ROWS) -> "Collection":
+        """Creates a collection in ``path``, or opens the one another worker created there first."""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(os.path.join(path, "collection.json")):
+                temporary = os.path.join(path, f".collection.{os.getpid()}.json")
+                with open(temporary, "w", encoding="utf-8") as f:
+                    json.dump({"model": model, "dimensions": dimensions}, f)
+                os.replace(temporary, os.path.join(path, "collection.json"))
+        return cls.open(path, segment_rows)
+
+    def _segment(self, number: int) -> Segment:
+        return Segment(os.path.join(self.path, f"{number:06d}"), self.dimensions)
+
+    def refresh(self) -> List[Segment]:
+        """Picks up segments and rows added since the last call; returns the current segments."""
+        with self._lock:
+            while os.path.exists(self._segment(len(self.segments)).sidecar_path):
+                self.segments.append(self._segment(len(self.segments)))
+            for segment in self.segments:
+                # Full segments never change again.
+                if len(segment.ids) < self.segment_rows:
+                    segment.refresh()
+            return list(self.segments)
+
+    def add(self, vectors: np.ndarray, ids: List[str], texts: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """
+        Appends documents, normalizing their vectors.
+
+        Raises:
+            ValueError: If the vectors are not of the collection's size.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected vectors of {self.dimensions} dimensions, got {vectors.shape[-1]}.")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = (vectors / np.where(norms == 0, 1, norms)).astype("<f4")
+        with open(os.path.join(self.path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            segments = self.refresh()
+            number, count = (len(segments) - 1, len(segments[-1].ids)) if segments else (-1, self.segment_rows)
+            segment = segments[-1] if segments else None
+            start = 0
+            while start < len(vectors):
+                if count >= self.segment_rows:
+                    number, count = number + 1, 0
+                    segment = self._segment(number)
+                segment.repair()
+                end = min(len(vectors), start + self.segment_rows - count)
+                segment.append(vectors[start:end], ids[start:end], texts[start:end], metadata[start:end])
+                count += end - start
+                start = end
+            self.refresh()
+
+    def search(self, vector, k: int = 10, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Finds the documents most similar to ``vector``.
+
+        Args:
+            vector: The query embedding.
+            k (int, optional): How many documents to return. Defaults to 10.
+            filter (Dict[str, Any], optional): Only consider documents whose metadata matches; see ``Segment.mask``.
+
+        Returns:
+            List[Dict[str, Any]]: ``id``, ``score`` (cosine similarity), ``text`` and ``metadata``, best first.
+
+        Raises:
+            ValueError: If the vector is not of the collection's size.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (self.dimensions,):
+            raise ValueError(f"Expected a vector of {self.dimensions} dimensions, got {query.shape[-1]}.")
+        norm = float(np.linalg.norm(query))
+        if norm:
+            query = query / norm
+        segments = self.refresh()
+        found = [segment.top_k(query, k, filter) for segment in segments]
+        if not found:
+            return []
+        scores = np.concatenate([scores for scores, _ in found])
+        owners = np.concatenate([np.full(len(rows), i) for i, (_, rows) in enumerate(found)])
+        rows = np.concatenate([rows for _, rows in found])
+        best = np.argsort(-scores, kind="stable")[:k]
+        results = []
+        for i in best:
+            segment, row = segments[owners[i]], rows[i]
+            results.append(
+                {"id": segment.ids[row], "score": float(scores[i]), "text": segment.texts[row], "metadata": segment.metadata[row]}
+            )
+        return results
+
+
+class VectorStore:
+    """The collections under ``path``, each user's in their own directory."""
+
+    def __init__(self, path: str = VECTOR_STORE_PATH, segment_rows: int = VECTOR_STORE_SEGMENT_ROWS):
+        self.path = path
+        self.segment_rows = segment_rows
+        self._collections: Dict[Tuple[str, str], Collection] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, owner: str, name: str) -> str:
+        if not COLLECTION_NAME.match(name):
+            raise ValueError("Collection names are 1 to 64 letters, digits, '-' or '_'.")
+        return os.path.join(self.path, str(owner), name)
+
+    def get(self, owner: str, name: str) -> Collection:
+        """
+        Returns the collection ``name`` of ``owner``.
+
+        Raises:
+            KeyError: If it does not exist.
+        """
+        with self._lock:
+            collection = self._collections.get((owner, name))
+            if collection is None:
+                try:
+                    collection = Collection.open(self._path(owner, name), self.segment_rows)
+                except FileNotFoundError:
+                    raise KeyError(name) from None
+                self._collections[(owner, name)] = collection
+            return collection
+
+    def get_or_create(self, owner: str, name: str, model: str, dimensions: int) -> Collection:
+        """Returns the collection ``name`` of ``owner``, creating it for ``model`` embeddings of ``dimensions``."""
+        try:
+            return self.get(owner, name)
+        except KeyError:
+            pass
+        with self._lock:
+            collection = self._collections.get((owner, name))
+            if collection is None:
+                collection = Collection.create(self._path(owner, name), model, dimensions, self.segment_rows)
+                self._collections[(owner, name)] = collection
+            return collection
+
+
+vector_store = VectorStore()
@@ -1,13 +1,24 @@
 from dotenv import load_dotenv
+import importlib
 import os
+import shutil
 import multiprocessing
 
 load_dotenv()
 
+# Prometheus multiprocess mode: workers write samples to this directory and the
+# metrics endpoint merges them. It must be set before the app (and prometheus_client)
+# is imported, which with preload_app happens in the master after this file loads.
+prometheus_multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+# Start from an empty directory so samples of a previous run are not merged in. This has
+# to happen here rather than in a server hook: the preloaded app opens its metric files
+# in this directory before on_starting runs.
+shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
 bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
 workers = multiprocessing.cpu_count() * 2 + 1
 worker_class = 'uvicorn.workers.UvicornWorker'
-reload = True
 
 loglevel = os.environ.get('LOG_LEVEL', 'info')
 accesslog = '-'
@@ -28,4 +39,41 @@ proc_name = 'openai_api_client'
 raw_env = ["OPENAI_API_KEY=" + os.environ["OPENAI_API_KEY"],
            "DATABASE_URL=" + os.environ["DATABASE_URL"],
            "SECRET_KEY=" + os.environ["SECRET_KEY"],
-           "LOG_LEVEL=" + os.environ["LOG_LEVEL"]]
\ No newline at end of file
+           "LOG_LEVEL=" + os.environ["LOG_LEVEL"]]
+
+
+# The app imports these lazily so single-process starts (uvicorn, tests, alembic)
+# stay fast. Under gunicorn they are imported once in the preloaded master instead,
+# so new and recycled workers inherit them rather than paying on their first request.
+preload_modules = ('openai', 'jose.jwt', 'passlib.context', 'sqlalchemy.ext.asyncio')
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    for module in preload_modules:
+        importlib.import_module(module)
+
+
+def post_fork(server, worker):
+    # Everything preloaded in the master is shared by the forked workers. Drop any
+    # pooled connections and HTTP clients so each worker creates its own.
+    from dependencies.database import dispose_engines
+    from dependencies.openai import openai_service
+
+    dispose_engines()
+    openai_service.reset()
+
+
+def worker_exit(server, worker):
+    # Persist the worker's semantic cache so the next workers start warm (SEMANTIC_CACHE_PATH).
+    from dependencies.openai import openai_service
+    from services.usage import usage_service
+
+    if openai_service.semantic_cache is not None:
+        openai_service.semantic_cache.save()
+    # Usage still pending when the worker stops, e.g. when it is recycled after max_requests.
+    usage_service.flush()
@@ -0,0 +1,64 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from api.routes.admin import router as admin_router
+from api.routes.collections import router as collections_router
+from api.routes.conversations import router as conversations_router
+from api.routes.jobs import router as jobs_router
+from api.routes.openai import router as openai_router
+from api.routes.user import router as user_router
+from dependencies.budget import user_budgets
+from dependencies.database import engine
+from dependencies.deadline import DeadlineMiddleware
+from dependencies.responses import FastJSONResponse
+from dependencies.metrics import MetricsMiddleware, instrument_engine, metrics_response
+from dependencies.timing import ServerTimingMiddleware
+from services.jobs import JOB_WORKER_IN_PROCESS, job_service
+from services.usage import usage_service
+
+PROMETHEUS_METRICS_ENDPOINT = os.environ.get("PROMETHEUS_METRICS_ENDPOINT", "/metrics")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Writes recorded usage even while no requests come in to trigger a flush.
+    tasks = [asyncio.create_task(usage_service.run())]
+    # Each worker process runs queued jobs alongside requests unless separate job workers do.
+    if JOB_WORKER_IN_PROCESS:
+        tasks.append(asyncio.create_task(job_service.run()))
+    # Keeps the worker's per-user budget counts in step with the other workers'.
+    if user_budgets.enabled:
+        tasks.append(asyncio.create_task(user_budgets.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Usage recorded since the last flush, including that of the jobs just cancelled.
+    await run_in_threadpool(usage_service.flush)
+
+
+app = FastAPI(title="OpenAI-API-Python-Client", default_response_class=FastJSONResponse, lifespan=lifespan)
+
+app.include_router(user_router)
+app.include_router(openai_router)
+app.include_router(admin_router)
+app.include_router(collections_router)
+app.include_router(jobs_router)
+app.include_router(conversations_router)
+
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+
+@app.get(PROMETHEUS_METRICS_ENDPOINT, include_in_schema=False)
+def metrics():
+    """
+    Exposes Prometheus metrics.
+    """
+    return metrics_response()
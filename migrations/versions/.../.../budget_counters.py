@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = 'e4c27a9d1f58'
+down_revision = 'd81f6b3a9e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add the budget_counters table, sharded per-user request and token counts per window
+    op.create_table(
+        'budget_counters',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('window', sa.String(8), nullable=False),
+        sa.Column('window_start', sa.BigInteger(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('requests', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+        sa.UniqueConstraint('user_id', 'window', 'window_start', 'shard', name='uq_budget_counters_shard'),
+    )
+    op.create_index('ix_budget_counters_window_start', 'budget_counters', ['window_start'])
+
+
+def downgrade():
+    # Drop the budget_counters table
+    op.drop_index('ix_budget_counters_window_start', table_name='budget_counters')
+    op.drop_table('budget_counters')
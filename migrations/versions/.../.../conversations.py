@@ -0,0 +1,45 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = 'c5a9f3e1d284'
+down_revision = 'b7e41c9a2d53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add server-side chat conversations and their messages, with token counts cached per message
+    op.create_table(
+        'conversations',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False, index=True),
+        sa.Column('model', sa.String(32), nullable=False),
+        sa.Column('system', sa.String(), nullable=True),
+        sa.Column('system_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('summary', sa.LargeBinary(), nullable=True),
+        sa.Column('summary_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('context_start', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('context_tokens', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+    )
+    op.create_table(
+        'conversation_messages',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('conversation_id', sa.Integer(), sa.ForeignKey('conversations.id'), nullable=False),
+        sa.Column('role', sa.String(16), nullable=False),
+        sa.Column('content', sa.LargeBinary(), nullable=False),
+        sa.Column('tokens', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+    )
+    op.create_index('ix_conversation_messages_conversation_id_id', 'conversation_messages', ['conversation_id', 'id'])
+
+
+def downgrade():
+    # Drop the conversation tables
+    op.drop_index('ix_conversation_messages_conversation_id_id', table_name='conversation_messages')
+    op.drop_table('conversation_messages')
+    op.drop_table('conversations')
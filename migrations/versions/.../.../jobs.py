@@ -0,0 +1,37 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = 'b7e41c9a2d53'
+down_revision = '8d2e5b0c4f61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add the jobs table, the durable queue of asynchronous summarize/translate work
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False, index=True),
+        sa.Column('kind', sa.String(16), nullable=False),
+        sa.Column('status', sa.String(16), nullable=False),
+        sa.Column('params', sa.LargeBinary(), nullable=False),
+        sa.Column('result', sa.LargeBinary(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('run_after', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('worker', sa.String(128), nullable=True),
+        sa.Column('lease_expires', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+    )
+    op.create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'])
+
+
+def downgrade():
+    # Drop the jobs table
+    op.drop_index('ix_jobs_status_run_after', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,44 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = 'd81f6b3a9e07'
+down_revision = 'c5a9f3e1d284'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Upstream token usage of each request
+    op.add_column('api_usage', sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('api_usage', sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('api_usage', sa.Column('total_tokens', sa.Integer(), nullable=False, server_default='0'))
+
+    # Add the token_usage_rollups table, token totals per user and model
+    op.create_table(
+        'token_usage_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('model', sa.String(64), nullable=False),
+        sa.Column('granularity', sa.String(8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('call_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('prompt_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('total_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+        sa.UniqueConstraint('user_id', 'granularity', 'bucket_start', 'model', name='uq_token_usage_rollups_bucket'),
+    )
+    op.create_index('ix_token_usage_rollups_granularity_bucket_start', 'token_usage_rollups', ['granularity', 'bucket_start'])
+
+
+def downgrade():
+    # Drop the token_usage_rollups table
+    op.drop_index('ix_token_usage_rollups_granularity_bucket_start', table_name='token_usage_rollups')
+    op.drop_table('token_usage_rollups')
+
+    # Drop the per-request token usage
+    op.drop_column('api_usage', 'total_tokens')
+    op.drop_column('api_usage', 'completion_tokens')
+    op.drop_column('api_usage', 'prompt_tokens')
@@ -0,0 +1,50 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = '3f1c2a9d7b10'
+down_revision = 'YOUR_REVISION_ID'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Flag administrators allowed to read everyone's usage
+    op.add_column('users', sa.Column('is_admin', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # Add the usage_rollups table
+    op.create_table(
+        'usage_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('endpoint', sa.String(), nullable=False),
+        sa.Column('granularity', sa.String(8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('request_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_sum_ms', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('latency_le_100', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_250', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_500', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_1000', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_2500', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_5000', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_le_10000', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('latency_gt_10000', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('prompt_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('completion_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('total_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(timezone=True), onupdate=sa.func.now()),
+        sa.UniqueConstraint('user_id', 'granularity', 'bucket_start', 'endpoint', name='uq_usage_rollups_bucket'),
+    )
+    op.create_index('ix_usage_rollups_granularity_bucket_start', 'usage_rollups', ['granularity', 'bucket_start'])
+
+
+def downgrade():
+    # Drop the usage_rollups table
+    op.drop_index('ix_usage_rollups_granularity_bucket_start', table_name='usage_rollups')
+    op.drop_table('usage_rollups')
+
+    # Drop the is_admin flag
+    op.drop_column('users', 'is_admin')
@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+# Revision Identifier
+revision = '8d2e5b0c4f61'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Scheduling tier for upstream slots; NULL means SCHEDULER_DEFAULT_PRIORITY
+    op.add_column('users', sa.Column('priority', sa.String(16), nullable=True))
+
+
+def downgrade():
+    # Drop the scheduling tier
+    op.drop_column('users', 'priority')
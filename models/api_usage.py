@@ -15,6 +15,10 @@ class ApiUsage(BaseModel):
     status_code = Column(Integer, nullable=False)
     request_data = Column(String, nullable=True)
     response_data = Column(String, nullable=True)
+    # Reported by the upstream for every call made to serve the request (see dependencies/token_usage.py).
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
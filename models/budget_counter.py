@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index, UniqueConstraint, func
+
+from .base import BaseModel
+
+
+class BudgetCounter(BaseModel):
+    """
+    One worker shard of a user's request and token count in a minute or day window.
+
+    Workers add their counts to the shard they own, so concurrent flushes for a busy
+    user update different rows; a window's total is the sum over its shards.
+    """
+    __tablename__ = "budget_counters"
+    __table_args__ = (
+        UniqueConstraint("user_id", "window", "window_start", "shard", name="uq_budget_counters_shard"),
+        Index("ix_budget_counters_window_start", "window_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    window = Column(String(8), nullable=False)
+    # Unix seconds, a multiple of the window's length, so every worker and database computes the same value.
+    window_start = Column(BigInteger, nullable=False)
+    shard = Column(Integer, nullable=False)
+    requests = Column(BigInteger, nullable=False, default=0)
+    tokens = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BudgetCounter user_id={self.user_id}, window={self.window}, window_start={self.window_start}, shard={self.shard}, requests={self.requests}, tokens={self.tokens}>"
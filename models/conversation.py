@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, ForeignKey, Index, func
+
+from .base import BaseModel
+
+
+class Conversation(BaseModel):
+    """Database model of a chat conversation kept server-side, and of the context window its turns are sent with."""
+    __tablename__ = "conversations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    model = Column(String(32), nullable=False)
+    system = Column(String, nullable=True)
+    system_tokens = Column(Integer, nullable=False, default=0)
+    # zlib-compressed summary of the turns trimmed from the context window, if they were summarized.
+    summary = Column(LargeBinary, nullable=True)
+    summary_tokens = Column(Integer, nullable=False, default=0)
+    # First message still in the context window, and the tokens of the messages from there on.
+    context_start = Column(Integer, nullable=False, default=0)
+    context_tokens = Column(Integer, nullable=False, default=0)
+    # Also guards against two turns of one conversation being stored at once (see services/conversations.py).
+    message_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<Conversation id={self.id}, user_id={self.user_id}, model={self.model}>"
+
+
+class ConversationMessage(BaseModel):
+    """Database model of one message of a conversation, with its token count worked out once when stored."""
+    __tablename__ = "conversation_messages"
+    __table_args__ = (
+        # Each turn reads a conversation's messages from its context_start on.
+        Index("ix_conversation_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
+    role = Column(String(16), nullable=False)
+    # zlib-compressed text.
+    content = Column(LargeBinary, nullable=False)
+    tokens = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<ConversationMessage id={self.id}, conversation_id={self.conversation_id}, role={self.role}>"
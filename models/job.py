@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, ForeignKey, Index, func
+
+from .base import BaseModel
+
+
+class Job(BaseModel):
+    """Database model of a queued summarize or translate job; the ``jobs`` table is the queue."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers claim the oldest runnable job of a status (see services/jobs.py).
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String(16), nullable=False)
+    status = Column(String(16), nullable=False)
+    # zlib-compressed JSON of the request, and of the result once it succeeded.
+    params = Column(LargeBinary, nullable=False)
+    result = Column(LargeBinary, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Not claimed before this time; pushed back when a job is retried.
+    run_after = Column(DateTime(timezone=True), nullable=False)
+    # The worker running the job and until when; another worker may take it over after that.
+    worker = Column(String(128), nullable=True)
+    lease_expires = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<Job id={self.id}, user_id={self.user_id}, kind={self.kind}, status={self.status}>"
@@ -0,0 +1,67 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index, UniqueConstraint, func
+
+from .base import BaseModel
+
+# Upper bounds (inclusive, in milliseconds) of the latency histogram columns below.
+# Anything slower lands in ``latency_gt_10000``.
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class UsageRollup(BaseModel):
+    """Pre-aggregated API usage per user, endpoint and hourly/daily bucket."""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "granularity", "bucket_start", "endpoint", name="uq_usage_rollups_bucket"),
+        Index("ix_usage_rollups_granularity_bucket_start", "granularity", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    endpoint = Column(String, nullable=False)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    request_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    latency_sum_ms = Column(BigInteger, nullable=False, default=0)
+    latency_le_100 = Column(Integer, nullable=False, default=0)
+    latency_le_250 = Column(Integer, nullable=False, default=0)
+    latency_le_500 = Column(Integer, nullable=False, default=0)
+    latency_le_1000 = Column(Integer, nullable=False, default=0)
+    latency_le_2500 = Column(Integer, nullable=False, default=0)
+    latency_le_5000 = Column(Integer, nullable=False, default=0)
+    latency_le_10000 = Column(Integer, nullable=False, default=0)
+    latency_gt_10000 = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<UsageRollup user_id={self.user_id}, endpoint={self.endpoint}, granularity={self.granularity}, bucket_start={self.bucket_start}, request_count={self.request_count}>"
+
+
+
+class TokenUsageRollup(BaseModel):
+    """Pre-aggregated upstream token usage per user, model and hourly/daily bucket."""
+    __tablename__ = "token_usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "granularity", "bucket_start", "model", name="uq_token_usage_rollups_bucket"),
+        Index("ix_token_usage_rollups_granularity_bucket_start", "granularity", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    model = Column(String(64), nullable=False)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    # Upstream calls, not requests: a cascade or a summarized conversation turn makes several.
+    call_count = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<TokenUsageRollup user_id={self.user_id}, model={self.model}, granularity={self.granularity}, bucket_start={self.bucket_start}, total_tokens={self.total_tokens}>"
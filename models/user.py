@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, false, func
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -12,8 +12,13 @@ class User(BaseModel):
     email = Column(String, unique=True, index=True, nullable=False)
     password = Column(String, nullable=False)
     api_key = Column(String, unique=True, nullable=True)
+    is_admin = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Scheduling tier for upstream slots (see dependencies/scheduler.py); NULL means the default tier.
+    priority = Column(String(16), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    api_usages = relationship("ApiUsage", back_populates="user")
+
     def __repr__(self):
         return f"<User {self.username}>"
\ No newline at end of file
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+
+from api.schemas.openai import ChatStreamGenerate
+from dependencies.budget import UserBudgets, user_budgets
+from dependencies.deadline import deadline
+from dependencies.metrics import CHAT_STREAM_CONNECTIONS, CHAT_STREAM_GENERATIONS, UPSTREAM_CANCELLATIONS
+from dependencies.openai import OpenAIService, openai_service
+from dependencies.scheduler import FairScheduler, scheduler
+from dependencies.token_usage import TokenTally, count_tokens
+from dependencies.utils import log_api_usage
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+CHAT_STREAM_ENDPOINT = "/api/v1/openai/chat/ws"
+
+# Generations one WebSocket connection may run at once; further "generate" frames get an error.
+CHAT_STREAM_MAX_GENERATIONS = int(os.environ.get("CHAT_STREAM_MAX_GENERATIONS", "8"))
+
+
+class ChatStreamSession:
+    """
+    Runs the generations of one authenticated chat WebSocket connection.
+
+    The client sends JSON frames: ``{"type": "generate", "id": ..., "messages": [...]}``
+    starts a generation, ``{"type": "cancel", "id": ...}`` stops one. Each generation
+    runs in its own task, holding an upstream slot like a request would, and streams
+    ``{"type": "token", "id": ..., "text": ...}`` frames back, ending with ``done`` (with
+    the generation's token ``usage``) or ``error``. Several generations share the
+    connection at once; cancelling one, or the client disconnecting, closes its
+    upstream stream. A ``timeout`` in the frame gives the generation a deadline, as
+    the ``X-Request-Timeout`` header does a request.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: User,
+        openai: OpenAIService = openai_service,
+        scheduler: FairScheduler = scheduler,
+        max_generations: int = CHAT_STREAM_MAX_GENERATIONS,
+        budgets: UserBudgets = user_budgets,
+    ):
+        """
+        Args:
+            websocket (WebSocket): The accepted connection.
+            user (User): The user the connection was authenticated as.
+            openai (OpenAIService, optional): Streams the completions. Defaults to the shared service.
+            scheduler (FairScheduler, optional): Hands out upstream slots. Defaults to the worker's scheduler.
+            max_generations (int, optional): Generations at once. Defaults to ``CHAT_STREAM_MAX_GENERATIONS``.
+            budgets (UserBudgets, optional): Holds generations to the user's budgets. Defaults to the worker's budgets.
+        """
+        self.websocket = websocket
+        self.user = user
+        self.openai = openai
+        self.scheduler = scheduler
+        self.max_generations = max_generations
+        self.budgets = budgets
+        self.generations: Dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        # Generations send from their own tasks; one frame at a time on the socket.
+        async with self._send_lock:
+            await self.websocket.send_text(orjson.dumps(frame).decode())
+
+    async def run(self) -> None:
+        """Serves frames until the client disconnects, then cancels what is still generating."""
+        CHAT_STREAM_CONNECTIONS.inc()
+        try:
+            while True:
+                await self.handle(await self.websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            CHAT_STREAM_CONNECTIONS.dec()
+            tasks = list(self.generations.values())
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                # Cancelling a generation closes its upstream stream and frees its slot.
+                UPSTREAM_CANCELLATIONS.labels(CHAT_STREAM_ENDPOINT).inc(len(tasks))
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle(self, text: str) -> None:
+        """Starts or cancels a generation; malformed frames get an ``error`` frame back."""
+        try:
+            frame = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            await self.error(None, status.HTTP_400_BAD_REQUEST, "Frames must be JSON objects.")
+            return
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        if kind == "cancel":
+            await self.cancel(frame.get("id"))
+        elif kind == "generate":
+            try:
+                request = ChatStreamGenerate.model_validate(frame)
+            except ValidationError as e:
+                await self.error(frame.get("id"), status.HTTP_422_UNPROCESSABLE_ENTITY, e.errors(include_url=False, include_context=False))
+                return
+            await self.start(request)
+        else:
+            await self.error(None, status.HTTP_400_BAD_REQUEST, "Unknown frame type. Send \"generate\" or \"cancel\".")
+
+    async def start(self, request: ChatStreamGenerate) -> None:
+        if request.id in self.generations:
+            await self.error(request.id, status.HTTP_409_CONFLICT, f"Generation {request.id!r} is already running.")
+            return
+        if len(self.generations) >= self.max_generations:
+            await self.error(request.id, status.HTTP_429_TOO_MANY_REQUESTS, f"At most {self.max_generations} generations at once.")
+            return
+        task = asyncio.create_task(self.generate(request))
+        self.generations[request.id] = task
+        task.add_done_callback(lambda _: self.generations.pop(request.id, None))
+
+    async def cancel(self, generation_id: Optional[str]) -> None:
+        task = self.generations.get(generation_id)
+        if task is None:
+            await self.error(generation_id, status.HTTP_404_NOT_FOUND, f"No generation {generation_id!r} is running.")
+            return
+        if task.cancel():
+            await asyncio.gather(task, return_exceptions=True)
+            await self.send({"type": "done", "id": generation_id, "reason": "cancelled"})
+
+    async def generate(self, request: ChatStreamGenerate) -> None:
+        """Streams one generation in an upstream slot, logging it like a request to ``CHAT_STREAM_ENDPOINT``."""
+        start = time.perf_counter()
+        status_code = status.HTTP_200_OK
+        outcome = "done"
+        tally = TokenTally()
+        try:
+            self.budgets.admit(self.user.id)
+            priority = self.scheduler.priority_for(self.user.priority, request.priority)
+            with deadline(request.timeout):
+                async with self.scheduler.slot(self.user.id, priority):
+                    with count_tokens() as tally:
+                        stream = self.openai.stream_chat(
+                            [message.model_dump() for message in request.messages],
+                            model=request.model,
+                            temperature=request.temperature,
+                            max_tokens=request.max_tokens,
+                            api_key=self.user.api_key,
+                        )
+                        try:
+                            async for text in stream:
+                                await self.send({"type": "token", "id": request.id, "text": text})
+                        finally:
+                            # Close the upstream stream here, in the slot and the tally, rather than
+                            # leave it to the garbage collector when sending fails or is cancelled.
+                            await stream.aclose()
+            await self.send({"type": "done", "id": request.id, "reason": "stop", "usage": tally.usage()})
+        except asyncio.CancelledError:
+            # 499: the client went away or cancelled before the generation finished.
+            status_code, outcome = 499, "cancelled"
+            raise
+        except HTTPException as e:
+            status_code, outcome = e.status_code, "error"
+            await self.error(request.id, e.status_code, e.detail)
+        except WebSocketDisconnect:
+            status_code, outcome = 499, "cancelled"
+        except Exception as e:
+            logger.exception(f"Chat stream generation {request.id!r} failed")
+            status_code, outcome = status.HTTP_500_INTERNAL_SERVER_ERROR, "error"
+            await self.error(request.id, status_code, f"Error generating: {e}")
+        finally:
+            CHAT_STREAM_GENERATIONS.labels(outcome).inc()
+            self.budgets.charge(self.user.id, tally.total_tokens)
+            log_api_usage(self.user, CHAT_STREAM_ENDPOINT, (time.perf_counter() - start) * 1000, status_code, tally)
+
+    async def error(self, generation_id: Optional[str], status_code: int, detail: Any) -> None:
+        try:
+            await self.send({"type": "error", "id": generation_id, "status": status_code, "detail": detail})
+        except Exception:
+            # The connection is gone; run() notices on its next receive.
+            pass
@@ -0,0 +1,147 @@
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from dependencies.openai import OpenAIService, openai_service
+
+if TYPE_CHECKING:
+    from dependencies.vector_store import Collection, VectorStore
+
+
+class CollectionService:
+    """
+    Stores documents with their embeddings in per-user collections and searches them.
+
+    The store (and numpy) is loaded on first use. Opening and creating collections, file
+    writes and searches run in the thread pool so a large collection does not hold up the
+    event loop.
+    """
+
+    def __init__(self, store: Optional["VectorStore"] = None, openai: OpenAIService = openai_service):
+        """
+        Args:
+            store (VectorStore, optional): Where collections are kept. Defaults to one under ``VECTOR_STORE_PATH``.
+            openai (OpenAIService, optional): Embeds documents and queries. Defaults to the shared service.
+        """
+        self._store = store
+        self.openai = openai
+
+    @property
+    def store(self) -> "VectorStore":
+        if self._store is None:
+            from dependencies.vector_store import vector_store
+
+            self._store = vector_store
+        return self._store
+
+    async def _get(self, owner: str, name: str) -> "Collection":
+        try:
+            return await run_in_threadpool(self.store.get, owner, name)
+        except KeyError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Collection {name!r} not found")
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    @staticmethod
+    def _dimensions(model: str, dimensions: Optional[int]) -> Optional[int]:
+        # Only text-embedding-3 models accept a size; others always return their native one.
+        return dimensions if model.startswith("text-embedding-3") else None
+
+    async def add_documents(
+        self,
+        owner: str,
+        name: str,
+        documents: List[Dict[str, Any]],
+        model: str = "text-embedding-3-small",
+        dimensions: Optional[int] = None,
+        api_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Embeds documents and appends them to a collection, creating it on first use.
+
+        Args:
+            owner (str): The user the collection belongs to.
+            name (str): The collection name.
+            documents (List[Dict[str, Any]]): ``text``, and optionally ``id`` and ``metadata``, per document.
+            model (str, optional): Embedding model of a new collection. Defaults to "text-embedding-3-small".
+            dimensions (int, optional): Embedding size of a new collection. Defaults to the model's size.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
+
+        Returns:
+            Dict[str, Any]: The collection name, its document count and the ids of the added documents.
+
+        Raises:
+            HTTPException: If the name is invalid, the model or size differ from the existing collection's,
+                or embedding fails.
+        """
+        try:
+            collection = await run_in_threadpool(self.store.get, owner, name)
+        except KeyError:
+            collection = None
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if collection is not None:
+            if model != collection.model or dimensions not in (None, collection.dimensions):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Collection {name!r} holds {collection.model} embeddings of {collection.dimensions} dimensions",
+                )
+            dimensions = collection.dimensions
+
+        texts = [document["text"] for document in documents]
+        vectors, _, _ = await self.openai.embed_texts(texts, model, self._dimensions(model, dimensions), api_key=api_key)
+        if collection is None:
+            collection = await run_in_threadpool(self.store.get_or_create, owner, name, model, vectors.shape[1])
+        ids = [document.get("id") or uuid.uuid4().hex for document in documents]
+        metadata = [document.get("metadata") or {} for document in documents]
+        try:
+            await run_in_threadpool(collection.add, vectors, ids, texts, metadata)
+        except ValueError as e:
+            # Created meanwhile by another request, with embeddings of another size.
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {"collection": name, "count": len(collection), "ids": ids}
+
+    async def search(
+        self,
+        owner: str,
+        name: str,
+        text: Optional[str] = None,
+        vector: Optional[List[float]] = None,
+        k: int = 10,
+        filter: Optional[Dict[str, Any]] = None,
+        api_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Finds the documents of a collection most similar to a text or an embedding.
+
+        Args:
+            owner (str): The user the collection belongs to.
+            name (str): The collection name.
+            text (str, optional): Query text, embedded with the collection's model.
+            vector (List[float], optional): Query embedding, used instead of ``text``.
+            k (int, optional): How many documents to return. Defaults to 10.
+            filter (Dict[str, Any], optional): Metadata every returned document must match.
+            api_key (str, optional): The user's own OpenAI API key. Defaults to the shared keys.
+
+        Returns:
+            Dict[str, Any]: ``results``, best first, each with ``id``, ``score``, ``text`` and ``metadata``.
+
+        Raises:
+            HTTPException: If the collection does not exist, the vector has the wrong size, or embedding fails.
+        """
+        collection = await self._get(owner, name)
+        if vector is None:
+            vectors, _, _ = await self.openai.embed_texts(
+                [text], collection.model, self._dimensions(collection.model, collection.dimensions), api_key=api_key
+            )
+            vector = vectors[0]
+        try:
+            results = await run_in_threadpool(collection.search, vector, k, filter)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {"results": results}
+
+
+collection_service = CollectionService()
@@ -0,0 +1,341 @@
+import logging
+import os
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from dependencies.openai import OpenAIService, estimate_tokens, openai_service
+from dependencies.token_usage import count_tokens
+from models.api_usage import ApiUsage  # noqa: F401  (maps User.api_usages wherever conversations are used)
+from models.conversation import Conversation, ConversationMessage
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZE = "summarize"
+TRIM = "trim"
+
+# Most tokens a turn is sent upstream with (system prompt, summary, kept messages, the new
+# message and the reply), whatever the model's own window; keeps long conversations' cost flat.
+CONVERSATION_CONTEXT_TOKENS = int(os.environ.get("CONVERSATION_CONTEXT_TOKENS", "4096"))
+# Once a turn would overflow, old messages leave the window until it is down to this share
+# of it, so the next several turns fit without trimming again.
+CONVERSATION_TRIM_TARGET = float(os.environ.get("CONVERSATION_TRIM_TARGET", "0.75"))
+# "summarize" folds the messages leaving the window into a running summary sent in their
+# place (one extra upstream call per trim); "trim" just drops them.
+CONVERSATION_TRIM_MODE = os.environ.get("CONVERSATION_TRIM_MODE", SUMMARIZE)
+# Longest running summary, in tokens.
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", "256"))
+
+# Context window of each chat model, in tokens.
+CONTEXT_WINDOWS = {"gpt-3.5-turbo": 16385, "gpt-4": 8192, "gpt-4o": 128000, "gpt-4o-mini": 128000}
+# Tokens the chat format adds to each message (role and separators).
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+SUMMARY_INSTRUCTIONS = (
+    "Update the summary of a conversation with the messages that follow it. Keep names, facts, "
+    "decisions and open questions the assistant will need to continue. Reply with the summary only."
+)
+
+
+def message_tokens(content: str) -> int:
+    """Tokens one chat message counts for in the context window."""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD
+
+
+def pack_text(text: Optional[str]) -> Optional[bytes]:
+    """Compresses stored message text; None stays None."""
+    return None if text is None else zlib.compress(text.encode())
+
+
+def unpack_text(data: Optional[bytes]) -> Optional[str]:
+    """Decodes what ``pack_text`` stored; None stays None."""
+    return None if data is None else zlib.decompress(data).decode()
+
+
+class WindowMessage(NamedTuple):
+    """A stored message as the context window needs it."""
+
+    id: int
+    role: str
+    content: str
+    tokens: int
+
+
+class ConversationService:
+    """
+    Keeps chat conversations server-side and sends each turn with a bounded context window.
+
+    Clients send only the new message. Every stored message carries its token count,
+    worked out once when it is stored, and the conversation keeps the total of the
+    messages still in its window, so a turn reads just those messages and never
+    re-counts the history. When a turn would overflow the window, the oldest messages
+    leave it, down to ``trim_target`` of the budget, and are either folded into a
+    running summary sent in their place or dropped.
+    """
+
+    def __init__(
+        self,
+        openai: OpenAIService = openai_service,
+        context_tokens: int = CONVERSATION_CONTEXT_TOKENS,
+        trim_target: float = CONVERSATION_TRIM_TARGET,
+        trim_mode: str = CONVERSATION_TRIM_MODE,
+        summary_tokens: int = CONVERSATION_SUMMARY_TOKENS,
+    ):
+        """
+        Args:
+            openai (OpenAIService, optional): Answers the turns and writes the summaries. Defaults to the shared service.
+            context_tokens (int, optional): Most tokens a turn is sent with. Defaults to ``CONVERSATION_CONTEXT_TOKENS``.
+            trim_target (float, optional): Share of the budget a trim leaves in use. Defaults to ``CONVERSATION_TRIM_TARGET``.
+            trim_mode (str, optional): ``"summarize"`` or ``"trim"``. Defaults to ``CONVERSATION_TRIM_MODE``.
+            summary_tokens (int, optional): Longest running summary. Defaults to ``CONVERSATION_SUMMARY_TOKENS``.
+        """
+        self.openai = openai
+        self.context_tokens = context_tokens
+        self.trim_target = trim_target
+        self.trim_mode = trim_mode
+        self.summary_tokens = summary_tokens
+
+    def budget(self, model: str, max_tokens: int) -> int:
+        """Prompt tokens a turn of ``model`` may use, leaving ``max_tokens`` for the reply."""
+        return min(self.context_tokens, CONTEXT_WINDOWS.get(model, self.context_tokens)) - max_tokens
+
+    def create(self, db: Session, user_id: int, model: str, system: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Starts a conversation.
+
+        Args:
+            db (Session): The database session.
+            user_id (int): The user the conversation belongs to.
+            model (str): The chat model every turn uses.
+            system (str, optional): A system prompt sent with every turn.
+
+        Returns:
+            Dict[str, Any]: The conversation, as returned by ``get``.
+        """
+        conversation = Conversation(
+            user_id=user_id,
+            model=model,
+            system=system,
+            system_tokens=message_tokens(system) if system else 0,
+            summary_tokens=0,
+            context_start=0,
+            context_tokens=0,
+            message_count=0,
+        )
+        db.add(conversation)
+        db.commit()
+        db.refresh(conversation)
+        return self.describe(conversation, [])
+
+    def get(self, db: Session, user_id: int, conversation_id: int, limit: int = 50, before: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Returns one of a user's conversations with its latest ``limit`` messages, or those before message ``before``.
+
+        Raises:
+            HTTPException: If the conversation does not exist or belongs to another user.
+        """
+        conversation = self._owned(db, user_id, conversation_id)
+        query = select(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id)
+        if before is not None:
+            query = query.where(ConversationMessage.id < before)
+        messages = db.scalars(query.order_by(ConversationMessage.id.desc()).limit(limit)).all()
+        return self.describe(conversation, reversed(messages))
+
+    def delete(self, db: Session, user_id: int, conversation_id: int) -> None:
+        """
+        Deletes one of a user's conversations and its messages.
+
+        Raises:
+            HTTPException: If the conversation does not exist or belongs to another user.
+        """
+        conversation = self._owned(db, user_id, conversation_id)
+        db.execute(delete(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id))
+        db.delete(conversation)
+        db.commit()
+
+    @staticmethod
+    def describe(conversation: Conversation, messages) -> Dict[str, Any]:
+        return {
+            "id": conversation.id,
+            "model": conversation.model,
+            "system": conversation.system,
+            "summary": unpack_text(conversation.summary),
+            "message_count": conversation.message_count,
+            "context_tokens": conversation.context_tokens,
+            "created_at": conversation.created_at,
+            "updated_at": conversation.updated_at,
+            "messages": [
+                {
+                    "id": message.id,
+                    "role": message.role,
+                    "content": unpack_text(message.content),
+                    "tokens": message.tokens,
+                    "created_at": message.created_at,
+                }
+                for message in messages
+            ],
+        }
+
+    async def reply(
+        self,
+        db: Session,
+        user: User,
+        conversation_id: int,
+        content: str,
+        temperature: float = 0.7,
+        max_tokens: int = 256,
+    ) -> Dict[str, Any]:
+        """
+        Adds a user message to a conversation and answers it.
+
+        The turn is sent with the system prompt, the summary, the messages still in the
+        window and the new message; the window is trimmed first if they would not fit.
+        Both messages and the new window are stored only once the answer has arrived.
+
+        Args:
+            db (Session): The database session.
+            user (User): The user the conversation belongs to; their own API key is used if they have one.
+            conversation_id (int): The conversation.
+            content (str): The user's message.
+            temperature (float, optional): Sampling temperature. Defaults to 0.7.
+            max_tokens (int, optional): The maximum number of tokens to generate. Defaults to 256.
+
+        Returns:
+            Dict[str, Any]: The reply, what it was sent with and its token usage, as in ``ConversationReply``.
+
+        Raises:
+            HTTPException: 404 if the conversation does not exist or belongs to another user; 400 if the
+                message does not fit the window even on its own; 409 if another turn of the conversation
+                was stored meanwhile; or the upstream error.
+        """
+        conversation = self._owned(db, user.id, conversation_id)
+        model, system, message_count = conversation.model, conversation.system, conversation.message_count
+        context_start = conversation.context_start
+        window_tokens = conversation.context_tokens
+        summary, summary_tokens = unpack_text(conversation.summary), conversation.summary_tokens
+
+        budget = self.budget(model, max_tokens)
+        turn_tokens = message_tokens(content)
+        fixed = conversation.system_tokens + turn_tokens
+        if fixed > budget:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Message too long: about {turn_tokens} tokens, and {budget - conversation.system_tokens} fit with max_tokens={max_tokens}.",
+            )
+
+        window: Deque[WindowMessage] = deque(self._window(db, conversation_id, context_start))
+        trimmed: List[WindowMessage] = []
+        if fixed + summary_tokens + window_tokens > budget:
+            target = int(budget * self.trim_target)
+            # Leave room for the summary the trimmed messages are about to become.
+            reserve = message_tokens(SUMMARY_PREFIX) + self.summary_tokens if self.trim_mode == SUMMARIZE else summary_tokens
+            while window and fixed + reserve + window_tokens > target:
+                trimmed.append(window.popleft())
+                window_tokens -= trimmed[-1].tokens
+        api_key = user.api_key
+        # Give the connection back to the pool for the upstream calls, which may take up to the
+        # request's deadline; the guarded UPDATE below notices turns stored in the meantime.
+        db.rollback()
+        # Both calls' tokens, the summary's included, are returned with the reply.
+        with count_tokens() as tally:
+            summarized = False
+            if trimmed and self.trim_mode == SUMMARIZE:
+                try:
+                    summary = await self.summarize(model, summary, trimmed, api_key)
+                    summary_tokens = message_tokens(SUMMARY_PREFIX + summary)
+                    summarized = True
+                except HTTPException as e:
+                    # The turn can still be answered; the trimmed messages are just dropped.
+                    logger.warning(f"Could not summarize conversation {conversation_id}: {e.detail}")
+            # Summaries are estimated before they are written; make sure this one fits.
+            while window and fixed + summary_tokens + window_tokens > budget:
+                trimmed.append(window.popleft())
+                window_tokens -= trimmed[-1].tokens
+            if fixed + summary_tokens + window_tokens > budget:
+                summary, summary_tokens = None, 0
+
+            messages = []
+            if system:
+                messages.append({"role": "system", "content": system})
+            if summary:
+                messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+            messages.extend({"role": message.role, "content": message.content} for message in window)
+            messages.append({"role": "user", "content": content})
+            answer = await self.openai.chat(messages, model=model, temperature=temperature, max_tokens=max_tokens, api_key=api_key)
+
+        reply_tokens = message_tokens(answer.response)
+        stored = db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.message_count == message_count)
+            .values(
+                summary=pack_text(summary),
+                summary_tokens=summary_tokens,
+                context_start=trimmed[-1].id + 1 if trimmed else context_start,
+                context_tokens=window_tokens + turn_tokens + reply_tokens,
+                message_count=message_count + 2,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if stored.rowcount != 1:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another message was added to the conversation meanwhile. Send one turn at a time.",
+            )
+        db.add_all(
+            [
+                ConversationMessage(conversation_id=conversation_id, role="user", content=pack_text(content), tokens=turn_tokens),
+                ConversationMessage(conversation_id=conversation_id, role="assistant", content=pack_text(answer.response), tokens=reply_tokens),
+            ]
+        )
+        db.commit()
+        return {
+            "conversation_id": conversation_id,
+            "response": answer.response,
+            "context": {
+                "messages": len(messages),
+                "tokens": fixed + summary_tokens + window_tokens,
+                "trimmed": len(trimmed),
+                "summarized": summarized,
+            },
+            "usage": tally.usage(),
+        }
+
+    async def summarize(self, model: str, summary: Optional[str], trimmed: List[WindowMessage], api_key: Optional[str]) -> str:
+        """Folds ``trimmed`` messages into the running ``summary``."""
+        transcript = "\n".join(f"{message.role}: {message.content}" for message in trimmed)
+        if summary:
+            transcript = f"{SUMMARY_PREFIX}{summary}\n\nMessages:\n{transcript}"
+        answer = await self.openai.chat(
+            [{"role": "system", "content": SUMMARY_INSTRUCTIONS}, {"role": "user", "content": transcript}],
+            model=model,
+            temperature=0,
+            max_tokens=self.summary_tokens,
+            api_key=api_key,
+        )
+        return answer.response
+
+    @staticmethod
+    def _window(db: Session, conversation_id: int, context_start: int) -> List[WindowMessage]:
+        rows = db.execute(
+            select(ConversationMessage.id, ConversationMessage.role, ConversationMessage.content, ConversationMessage.tokens)
+            .where(ConversationMessage.conversation_id == conversation_id, ConversationMessage.id >= context_start)
+            .order_by(ConversationMessage.id)
+        )
+        return [WindowMessage(id, role, unpack_text(content), tokens) for id, role, content, tokens in rows]
+
+    @staticmethod
+    def _owned(db: Session, user_id: int, conversation_id: int) -> Conversation:
+        conversation = db.get(Conversation, conversation_id)
+        if conversation is None or conversation.user_id != user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Conversation {conversation_id} not found")
+        return conversation
+
+
+conversation_service = ConversationService()
@@ -0,0 +1,467 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from dependencies.budget import UserBudgets, user_budgets
+from dependencies.database import SessionLocal
+from dependencies.metrics import JOBS
+from dependencies.openai import OpenAIService, openai_service
+from dependencies.scheduler import FairScheduler, scheduler
+from dependencies.token_usage import TokenTally, count_tokens
+from models.api_usage import ApiUsage  # noqa: F401  (maps User.api_usages in a worker started on its own)
+from models.job import Job
+from models.user import User
+from services.usage import UsageService, usage_service
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZE = "summarize"
+TRANSLATE = "translate"
+JOB_KINDS = (SUMMARIZE, TRANSLATE)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# Run queued jobs in each app worker; set to false when separate workers (python -m services.jobs) run them.
+JOB_WORKER_IN_PROCESS = os.environ.get("JOB_WORKER_IN_PROCESS", "true").lower() == "true"
+# Jobs each worker process runs at once.
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", "4"))
+# Seconds an idle worker waits before looking for jobs again (enqueuing in the same process wakes it sooner).
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+# Seconds a worker may hold a job before another worker takes it over, e.g. after a crash.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+# Runs of a job failing with a 429, 5xx or timeout before it is marked failed.
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Unfinished jobs one user may have (429 beyond).
+JOB_MAX_PENDING_PER_USER = int(os.environ.get("JOB_MAX_PENDING_PER_USER", "100"))
+# Scheduling tier jobs run at; never above the user's own (see dependencies/scheduler.py).
+JOB_PRIORITY = os.environ.get("JOB_PRIORITY", "batch")
+
+# Endpoint job runs are recorded under in the usage records, with their upstream tokens.
+JOB_USAGE_ENDPOINT = "job:{kind}"
+
+# Upstream statuses worth running a job again for.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def pack(value: Any) -> bytes:
+    """Encodes a job's request or result as zlib-compressed JSON."""
+    return zlib.compress(orjson.dumps(value))
+
+
+def unpack(data: Optional[bytes]) -> Any:
+    """Decodes what ``pack`` stored; None stays None."""
+    return None if data is None else orjson.loads(zlib.decompress(data))
+
+
+class ClaimedJob(NamedTuple):
+    """What a worker needs to run a job it has claimed."""
+
+    id: int
+    user_id: int
+    kind: str
+    params: Dict[str, Any]
+    attempts: int
+    api_key: Optional[str]
+    priority: Optional[str]
+
+
+class JobService:
+    """
+    Queues summarize and translate jobs in the ``jobs`` table and runs them.
+
+    The table is the queue: workers, in the app processes or started on their own,
+    claim the oldest runnable job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any
+    number of them share it without handing a job to two at once, and lease it for
+    ``JOB_LEASE_SECONDS`` so a job whose worker died is picked up again. Requests and
+    results are stored as zlib-compressed JSON.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        openai: OpenAIService = openai_service,
+        scheduler: FairScheduler = scheduler,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        max_pending_per_user: int = JOB_MAX_PENDING_PER_USER,
+        usage: UsageService = usage_service,
+        budgets: UserBudgets = user_budgets,
+    ):
+        """
+        Args:
+            session_factory (sessionmaker, optional): Opens the worker's sessions. Defaults to ``SessionLocal``.
+            openai (OpenAIService, optional): Runs the jobs. Defaults to the shared service.
+            scheduler (FairScheduler, optional): Shares upstream slots with requests. Defaults to the worker's scheduler.
+            concurrency (int, optional): Jobs run at once. Defaults to ``JOB_WORKER_CONCURRENCY``.
+            poll_interval (float, optional): Idle wait between claims. Defaults to ``JOB_POLL_INTERVAL``.
+            lease_seconds (float, optional): How long a claim holds. Defaults to ``JOB_LEASE_SECONDS``.
+            max_attempts (int, optional): Runs before a job fails for good. Defaults to ``JOB_MAX_ATTEMPTS``.
+            max_pending_per_user (int, optional): Unfinished jobs per user. Defaults to ``JOB_MAX_PENDING_PER_USER``.
+            usage (UsageService, optional): Records each run and its tokens. Defaults to the shared service.
+            budgets (UserBudgets, optional): Holds runs to their user's budgets. Defaults to the worker's budgets.
+        """
+        self.session_factory = session_factory
+        self.openai = openai
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_pending_per_user = max_pending_per_user
+        self.usage = usage
+        self.budgets = budgets
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake: Optional[asyncio.Event] = None
+
+    def enqueue(self, db: Session, user_id: int, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queues a job.
+
+        Args:
+            db (Session): The database session.
+            user_id (int): The user the job belongs to.
+            kind (str): ``"summarize"`` or ``"translate"``.
+            params (Dict[str, Any]): The request, as taken by ``OpenAIService.summarize_text`` or ``translate_text``.
+
+        Returns:
+            Dict[str, Any]: The job, as returned by ``get``.
+
+        Raises:
+            HTTPException: If the user already has ``max_pending_per_user`` unfinished jobs.
+        """
+        pending = db.scalar(select(func.count(Job.id)).where(Job.user_id == user_id, Job.status.in_((QUEUED, RUNNING))))
+        if pending >= self.max_pending_per_user:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many unfinished jobs ({pending}). Wait for some to finish.",
+                headers={"Retry-After": "10"},
+            )
+        job = Job(user_id=user_id, kind=kind, status=QUEUED, params=pack(params), attempts=0, run_after=utcnow())
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        JOBS.labels(kind, "queued").inc()
+        if self._wake is not None:
+            self._wake.set()
+        return self.describe(job)
+
+    @staticmethod
+    def describe(job: Job) -> Dict[str, Any]:
+        result = unpack(job.result)
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "result": result,
+            "error": job.error,
+        }
+
+    def get(self, db: Session, user_id: int, job_id: int) -> Dict[str, Any]:
+        """
+        Returns one of a user's jobs, with its result once it has succeeded.
+
+        Raises:
+            HTTPException: If the job does not exist or belongs to another user.
+        """
+        job = db.get(Job, job_id)
+        if job is None or job.user_id != user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+        return self.describe(job)
+
+    async def events(self, user_id: int, job_id: int, interval: float = 1.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields the job each time its status changes, ending once it has finished.
+
+        Each poll opens its own short session, so a long wait holds no connection.
+
+        Raises:
+            HTTPException: If the job does not exist or belongs to another user.
+        """
+        last = None
+        while True:
+            job = await run_in_threadpool(self._get_in_session, user_id, job_id)
+            if (job["status"], job["attempts"]) != last:
+                last = (job["status"], job["attempts"])
+                yield job
+            if job["status"] in FINISHED:
+                return
+            await asyncio.sleep(interval)
+
+    def _get_in_session(self, user_id: int, job_id: int) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            return self.get(db, user_id, job_id)
+        finally:
+            db.close()
+
+    def claim(self) -> Optional[ClaimedJob]:
+        """
+        Takes the oldest runnable job: a queued one that is due, or a running one whose lease ran out.
+
+        A job whose lease ran out on its last attempt is marked failed instead, so a job
+        that keeps taking its worker down is not run forever.
+
+        Returns:
+            ClaimedJob: The job, now running under this worker's lease; None if there is none.
+        """
+        now = utcnow()
+        db = self.session_factory()
+        try:
+            while True:
+                job = db.execute(
+                    select(Job)
+                    .where(
+                        or_(
+                            and_(Job.status == QUEUED, Job.run_after <= now),
+                            and_(Job.status == RUNNING, Job.lease_expires < now),
+                        )
+                    )
+                    .order_by(Job.run_after, Job.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).scalar_one_or_none()
+                if job is None:
+                    db.rollback()
+                    return None
+                if job.status == QUEUED or job.attempts < self.max_attempts:
+                    break
+                kind, attempts = job.kind, job.attempts
+                failed = db.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.status == RUNNING, Job.attempts == attempts)
+                    .values(
+                        status=FAILED,
+                        error=f"The job's lease ran out on each of its {attempts} attempts.",
+                        worker=None,
+                        lease_expires=None,
+                        finished_at=now,
+                    )
+                ).rowcount
+                db.commit()
+                if failed:
+                    JOBS.labels(kind, "failed").inc()
+            claimed = ClaimedJob(job.id, job.user_id, job.kind, unpack(job.params), job.attempts + 1, None, None)
+            # Guarded on what was read, so on databases without row locks (SQLite) only one claimant wins.
+            won = db.execute(
+                update(Job)
+                .where(Job.id == claimed.id, Job.status == job.status, Job.attempts == job.attempts)
+                .values(
+                    status=RUNNING,
+                    attempts=claimed.attempts,
+                    worker=self.worker_id,
+                    lease_expires=now + timedelta(seconds=self.lease_seconds),
+                    started_at=now,
+                )
+            ).rowcount
+            db.commit()
+            if not won:
+                return None
+            user = db.execute(select(User.api_key, User.priority).where(User.id == claimed.user_id)).first()
+            if user is None:
+                return claimed
+            return claimed._replace(api_key=user.api_key, priority=user.priority)
+        finally:
+            db.close()
+
+    def finish(self, job: ClaimedJob, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None, retry_in: Optional[float] = None) -> bool:
+        """
+        Records how a claimed job ended: its result, a retry at a later time, or an error.
+
+        Returns:
+            bool: False if the job was no longer this worker's (its lease ran out and another took it).
+        """
+        now = utcnow()
+        if retry_in is not None:
+            values = {"status": QUEUED, "run_after": now + timedelta(seconds=retry_in), "error": error}
+            outcome = "retried"
+        elif error is not None:
+            values = {"status": FAILED, "error": error, "finished_at": now}
+            outcome = "failed"
+        else:
+            values = {"status": SUCCEEDED, "result": pack(result), "error": None, "finished_at": now}
+            outcome = "succeeded"
+        db = self.session_factory()
+        try:
+            updated = db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == RUNNING, Job.worker == self.worker_id)
+                .values(worker=None, lease_expires=None, **values)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if updated:
+            JOBS.labels(job.kind, outcome).inc()
+        return bool(updated)
+
+    async def execute(self, job: ClaimedJob) -> None:
+        """Runs a claimed job in an upstream slot of the job's tier and records the outcome."""
+        params = job.params
+        try:
+            priority = self.scheduler.priority_for(job.priority, JOB_PRIORITY)
+        except HTTPException as e:
+            # JOB_PRIORITY is not a configured tier. Fail the job rather than leave it
+            # running until its lease runs out, to be claimed again.
+            logger.error(f"Cannot run job {job.id}: {e.detail}")
+            await run_in_threadpool(self.finish, job, None, e.detail)
+            return
+        try:
+            await self.scheduler.acquire(job.user_id, priority)
+        except HTTPException as e:
+            # The worker is busy serving requests; try again later without using up an attempt.
+            await run_in_threadpool(self._requeue, job, float(e.headers.get("Retry-After", "1")))
+            return
+        except asyncio.CancelledError:
+            await asyncio.shield(run_in_threadpool(self._requeue, job, 0.0))
+            raise
+        try:
+            self.budgets.admit(job.user_id)
+        except HTTPException as e:
+            # The user's budget is used up; run it once there is room again, without using up an attempt.
+            self.scheduler.release(job.user_id, priority)
+            await run_in_threadpool(self._requeue, job, float(e.headers.get("Retry-After", "1")))
+            return
+        started = time.perf_counter()
+        status_code = status.HTTP_200_OK
+        with count_tokens() as tally:
+            try:
+                if job.kind == SUMMARIZE:
+                    response = await self.openai.summarize_text(text=params["text"], model=params["model"], api_key=job.api_key)
+                else:
+                    response = await self.openai.translate_text(
+                        text=params["text"],
+                        source_language=params["source_language"],
+                        target_language=params["target_language"],
+                        api_key=job.api_key,
+                    )
+            except HTTPException as e:
+                status_code = e.status_code
+                retry = e.status_code in RETRY_STATUSES and job.attempts < self.max_attempts
+                await run_in_threadpool(self.finish, job, None, e.detail, min(60.0, 2.0 ** job.attempts) if retry else None)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back to the queue rather than waiting out its lease.
+                status_code = 499
+                await asyncio.shield(run_in_threadpool(self._requeue, job, 0.0))
+                raise
+            except Exception as e:
+                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                logger.exception(f"Job {job.id} failed")
+                await run_in_threadpool(self.finish, job, None, f"Error running job: {e}")
+            else:
+                await run_in_threadpool(self.finish, job, response.model_dump(exclude_none=True))
+            finally:
+                seconds = time.perf_counter() - started
+                self.scheduler.release(job.user_id, priority, seconds)
+                self.budgets.charge(job.user_id, tally.total_tokens)
+                self._record_usage(job, status_code, seconds, tally)
+
+    def _record_usage(self, job: ClaimedJob, status_code: int, seconds: float, tally: TokenTally) -> None:
+        try:
+            self.usage.record(
+                job.user_id,
+                JOB_USAGE_ENDPOINT.format(kind=job.kind),
+                status_code,
+                int(seconds * 1000),
+                prompt_tokens=tally.prompt_tokens,
+                completion_tokens=tally.completion_tokens,
+                models=tally.models,
+            )
+        except Exception as e:
+            logger.error(f"Error logging job usage: {e}")
+
+    def _requeue(self, job: ClaimedJob, retry_in: float) -> None:
+        """Returns a claimed job to the queue without counting the attempt."""
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == RUNNING, Job.worker == self.worker_id)
+                .values(
+                    status=QUEUED,
+                    attempts=job.attempts - 1,
+                    run_after=utcnow() + timedelta(seconds=retry_in),
+                    worker=None,
+                    lease_expires=None,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def run(self) -> None:
+        """
+        Claims and runs jobs, up to ``concurrency`` at once, until cancelled.
+
+        Jobs still running when it is cancelled go back to the queue.
+        """
+        self._wake = asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    job = await run_in_threadpool(self.claim)
+                except Exception as e:
+                    logger.error(f"Error claiming a job: {e}")
+                    job = None
+                if job is None:
+                    slots.release()
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self.execute(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: slots.release())
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            self._wake = None
+
+
+job_service = JobService()
+
+
+if __name__ == "__main__":
+    # A worker without the web app: python -m services.jobs
+    async def main():
+        tasks = [job_service.run(), usage_service.run()]
+        if user_budgets.enabled:
+            tasks.append(user_budgets.run())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            usage_service.flush()
+
+    asyncio.run(main())
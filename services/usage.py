@@ -0,0 +1,473 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from dependencies.database import SessionLocal
+from models.api_usage import ApiUsage
+from models.usage_rollup import TokenUsageRollup, UsageRollup, LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+
+# Longest window a single report may span, per granularity.
+MAX_REPORT_SPAN = {HOUR: timedelta(days=31), DAY: timedelta(days=366)}
+
+USAGE_FLUSH_INTERVAL = float(os.environ.get("USAGE_FLUSH_INTERVAL", "5"))
+USAGE_FLUSH_MAX_PENDING = int(os.environ.get("USAGE_FLUSH_MAX_PENDING", "500"))
+
+LATENCY_COLUMNS = tuple(f"latency_le_{bound}" for bound in LATENCY_BUCKETS_MS) + (f"latency_gt_{LATENCY_BUCKETS_MS[-1]}",)
+COUNTER_COLUMNS = (
+    "request_count",
+    "error_count",
+    "latency_sum_ms",
+) + LATENCY_COLUMNS + (
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+)
+MODEL_COUNTER_COLUMNS = ("call_count", "prompt_tokens", "completion_tokens", "total_tokens")
+
+RollupKey = Tuple[int, str, str, datetime]
+
+
+def as_utc(when: datetime) -> datetime:
+    """Converts a timestamp to UTC, taking a naive one to be in UTC already."""
+    return when.astimezone(timezone.utc) if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def bucket_start(when: datetime, granularity: str) -> datetime:
+    """Truncates a timestamp to the start of its UTC hour or day."""
+    when = as_utc(when)
+    if granularity == HOUR:
+        return when.replace(minute=0, second=0, microsecond=0)
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_bucket_index(response_time_ms: int) -> int:
+    """Returns the index of the histogram column a latency falls into."""
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if response_time_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+class UsageRollupAggregator:
+    """
+    Folds individual usage events into hourly and daily rollup deltas in memory.
+
+    Each event touches exactly two counter rows (its hour and its day), so the
+    cost of recording is constant regardless of how much history exists. The
+    pending deltas are drained by ``UsageService.flush`` and added onto the
+    stored rollups with an upsert, which keeps the totals correct when several
+    workers flush the same bucket.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas: Dict[RollupKey, List[int]] = {}
+        self._raw: List[dict] = []
+
+    def add(
+        self,
+        user_id: int,
+        endpoint: str,
+        status_code: int,
+        response_time_ms: int,
+        when: datetime,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ) -> int:
+        """
+        Records a single usage event.
+
+        Returns:
+            int: The number of raw events waiting to be flushed.
+        """
+        is_error = 1 if status_code >= 400 else 0
+        histogram_offset = 3 + latency_bucket_index(response_time_ms)
+        with self._lock:
+            for granularity in GRANULARITIES:
+                key = (user_id, endpoint, granularity, bucket_start(when, granularity))
+                delta = self._deltas.get(key)
+                if delta is None:
+                    delta = self._deltas[key] = [0] * len(COUNTER_COLUMNS)
+                delta[0] += 1
+                delta[1] += is_error
+                delta[2] += response_time_ms
+                delta[histogram_offset] += 1
+                delta[-3] += prompt_tokens
+                delta[-2] += completion_tokens
+                delta[-1] += prompt_tokens + completion_tokens
+            self._raw.append(
+                {
+                    "user_id": user_id,
+                    "endpoint": endpoint,
+                    "request_time": when,
+                    "response_time": response_time_ms,
+                    "status_code": status_code,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+            )
+            return len(self._raw)
+
+    def drain(self) -> Tuple[List[dict], List[dict]]:
+        """
+        Takes all pending deltas and raw events, leaving the aggregator empty.
+
+        Returns:
+            Tuple[List[dict], List[dict]]: Rollup rows and raw ``ApiUsage`` rows.
+        """
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            raw, self._raw = self._raw, []
+        rollups = [
+            dict(
+                zip(("user_id", "endpoint", "granularity", "bucket_start"), key),
+                **dict(zip(COUNTER_COLUMNS, values)),
+            )
+            for key, values in deltas.items()
+        ]
+        return rollups, raw
+
+    def restore(self, rollups: List[dict], raw: List[dict]) -> None:
+        """Puts drained rows back after a failed flush so they are retried."""
+        with self._lock:
+            for row in rollups:
+                key = (row["user_id"], row["endpoint"], row["granularity"], row["bucket_start"])
+                delta = self._deltas.setdefault(key, [0] * len(COUNTER_COLUMNS))
+                for index, column in enumerate(COUNTER_COLUMNS):
+                    delta[index] += row[column]
+            self._raw[:0] = raw
+
+
+class TokenUsageAggregator:
+    """
+    Folds the upstream token usage of requests into hourly and daily per-model deltas in memory.
+
+    Works like ``UsageRollupAggregator``, keyed by model instead of endpoint, so a
+    request that called several models (a cascade, a summarized conversation turn)
+    adds to each of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas: Dict[RollupKey, List[int]] = {}
+
+    def add(self, user_id: int, models: Dict[str, Sequence[int]], when: datetime) -> None:
+        """Records the calls, prompt tokens and completion tokens per model of one request."""
+        with self._lock:
+            for model, (calls, prompt_tokens, completion_tokens) in models.items():
+                for granularity in GRANULARITIES:
+                    key = (user_id, model, granularity, bucket_start(when, granularity))
+                    delta = self._deltas.get(key)
+                    if delta is None:
+                        delta = self._deltas[key] = [0] * len(MODEL_COUNTER_COLUMNS)
+                    delta[0] += calls
+                    delta[1] += prompt_tokens
+                    delta[2] += completion_tokens
+                    delta[3] += prompt_tokens + completion_tokens
+
+    def drain(self) -> List[dict]:
+        """Takes all pending deltas as ``TokenUsageRollup`` rows, leaving the aggregator empty."""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        return [
+            dict(
+                zip(("user_id", "model", "granularity", "bucket_start"), key),
+                **dict(zip(MODEL_COUNTER_COLUMNS, values)),
+            )
+            for key, values in deltas.items()
+        ]
+
+    def restore(self, rows: List[dict]) -> None:
+        """Puts drained rows back after a failed flush so they are retried."""
+        with self._lock:
+            for row in rows:
+                key = (row["user_id"], row["model"], row["granularity"], row["bucket_start"])
+                delta = self._deltas.setdefault(key, [0] * len(MODEL_COUNTER_COLUMNS))
+                for index, column in enumerate(MODEL_COUNTER_COLUMNS):
+                    delta[index] += row[column]
+
+
+class UsageService:
+    """
+    Service class for recording API usage and serving usage reports from rollups.
+    """
+
+    def __init__(self, aggregator: Optional[UsageRollupAggregator] = None, token_aggregator: Optional[TokenUsageAggregator] = None):
+        self.aggregator = aggregator or UsageRollupAggregator()
+        self.token_aggregator = token_aggregator or TokenUsageAggregator()
+        self._last_flush = time.monotonic()
+        self._flushing: Optional[asyncio.Future] = None
+
+    def record(
+        self,
+        user_id: int,
+        endpoint: str,
+        status_code: int,
+        response_time_ms: int,
+        when: Optional[datetime] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        models: Optional[Dict[str, Sequence[int]]] = None,
+    ) -> None:
+        """
+        Records one API call and starts a flush of pending usage when one is due.
+
+        On the event loop the flush runs in the thread pool, so the request that
+        triggers it does not wait on the database.
+
+        Args:
+            user_id (int): The ID of the calling user.
+            endpoint (str): The endpoint that was called.
+            status_code (int): The HTTP status code returned.
+            response_time_ms (int): The time taken to serve the call, in milliseconds.
+            when (datetime, optional): When the call happened. Defaults to now.
+            prompt_tokens (int, optional): Prompt tokens consumed upstream.
+            completion_tokens (int, optional): Completion tokens generated upstream.
+            models (Dict[str, Sequence[int]], optional): Upstream calls, prompt tokens and completion
+                tokens per model, as in ``TokenTally.models``.
+        """
+        when = when or datetime.now(timezone.utc)
+        pending = self.aggregator.add(
+            user_id,
+            endpoint,
+            status_code,
+            response_time_ms,
+            when,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        if models:
+            self.token_aggregator.add(user_id, models, when)
+        if pending >= USAGE_FLUSH_MAX_PENDING or time.monotonic() - self._last_flush >= USAGE_FLUSH_INTERVAL:
+            self._flush_soon()
+
+    def _flush_soon(self) -> None:
+        self._last_flush = time.monotonic()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        # One flush at a time; events recorded meanwhile go out with the next one.
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(run_in_threadpool(self.flush))
+
+    async def run(self) -> None:
+        """Flushes every ``USAGE_FLUSH_INTERVAL`` seconds until cancelled, so usage recorded just before a quiet spell is written too."""
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+            await run_in_threadpool(self.flush)
+
+    def flush(self) -> None:
+        """
+        Writes pending raw usage rows and adds pending deltas onto the rollup tables.
+
+        Raw rows are bulk inserted and every touched rollup bucket is upserted once,
+        so a flush costs one round trip per statement rather than one per request.
+        """
+        self._last_flush = time.monotonic()
+        rollups, raw = self.aggregator.drain()
+        token_rollups = self.token_aggregator.drain()
+        if not rollups and not raw and not token_rollups:
+            return
+        db = SessionLocal()
+        try:
+            if raw:
+                db.execute(insert(ApiUsage), raw)
+            if rollups:
+                db.execute(self._upsert_statement(db), rollups)
+            if token_rollups:
+                db.execute(self._upsert_statement(db, TokenUsageRollup, "model", MODEL_COUNTER_COLUMNS), token_rollups)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.aggregator.restore(rollups, raw)
+            self.token_aggregator.restore(token_rollups)
+            logger.error(f"Error flushing API usage: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upsert_statement(db: Session, table=UsageRollup, key: str = "endpoint", columns: Sequence[str] = COUNTER_COLUMNS):
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=["user_id", "granularity", "bucket_start", key],
+            set_={
+                column: getattr(table, column) + getattr(statement.excluded, column)
+                for column in columns
+            },
+        )
+
+    @staticmethod
+    def _model_totals(db: Session, granularity: str, start: datetime, end: datetime, user_id: Optional[int] = None) -> List[dict]:
+        """Token usage per model over a window, for one user or everyone."""
+        columns = [func.sum(getattr(TokenUsageRollup, column)).label(column) for column in MODEL_COUNTER_COLUMNS]
+        query = db.query(TokenUsageRollup.model, *columns).filter(
+            TokenUsageRollup.granularity == granularity,
+            TokenUsageRollup.bucket_start >= start,
+            TokenUsageRollup.bucket_start < end,
+        )
+        if user_id is not None:
+            query = query.filter(TokenUsageRollup.user_id == user_id)
+        rows = query.group_by(TokenUsageRollup.model).order_by(TokenUsageRollup.model).all()
+        return [dict(model=row.model, **{column: getattr(row, column) for column in MODEL_COUNTER_COLUMNS}) for row in rows]
+
+    @staticmethod
+    def _report_window(granularity: str, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+        if granularity not in GRANULARITIES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid granularity. Choose from: {', '.join(GRANULARITIES)}",
+            )
+        # Naive query parameters are taken as UTC, like the stored buckets.
+        end = as_utc(end) if end else datetime.now(timezone.utc)
+        start = as_utc(start) if start else end - (timedelta(days=1) if granularity == HOUR else timedelta(days=30))
+        if start >= end:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+        if end - start > MAX_REPORT_SPAN[granularity]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Report window is too large for {granularity} granularity",
+            )
+        return bucket_start(start, granularity), end
+
+    def get_user_usage(
+        self,
+        db: Session,
+        user_id: int,
+        granularity: str = HOUR,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        endpoint: Optional[str] = None,
+    ) -> dict:
+        """
+        Returns the per-bucket usage of one user.
+
+        The query is a range scan on the ``(user_id, granularity, bucket_start)``
+        prefix of the rollup unique index, so its cost depends on the number of
+        buckets in the window and not on the size of ``api_usage``.
+
+        Args:
+            db (Session): The database session.
+            user_id (int): The user to report on.
+            granularity (str, optional): ``"hour"`` or ``"day"``. Defaults to ``"hour"``.
+            start (datetime, optional): Start of the window. Defaults to one day (hourly) or 30 days (daily) before ``end``.
+            end (datetime, optional): End of the window. Defaults to now.
+            endpoint (str, optional): Restricts the buckets to a single endpoint; the per-model totals
+                always cover every endpoint.
+
+        Returns:
+            dict: The usage report.
+
+        Raises:
+            HTTPException: If the granularity or window is invalid.
+        """
+        start, end = self._report_window(granularity, start, end)
+        query = db.query(UsageRollup).filter(
+            UsageRollup.user_id == user_id,
+            UsageRollup.granularity == granularity,
+            UsageRollup.bucket_start >= start,
+            UsageRollup.bucket_start < end,
+        )
+        if endpoint is not None:
+            query = query.filter(UsageRollup.endpoint == endpoint)
+        rows = query.order_by(UsageRollup.bucket_start, UsageRollup.endpoint).all()
+        return {
+            "user_id": user_id,
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+            "buckets": [
+                {
+                    "bucket_start": row.bucket_start,
+                    "endpoint": row.endpoint,
+                    "request_count": row.request_count,
+                    "error_count": row.error_count,
+                    "latency_sum_ms": row.latency_sum_ms,
+                    "latency_histogram": [getattr(row, column) for column in LATENCY_COLUMNS],
+                    "prompt_tokens": row.prompt_tokens,
+                    "completion_tokens": row.completion_tokens,
+                    "total_tokens": row.total_tokens,
+                }
+                for row in rows
+            ],
+            "models": self._model_totals(db, granularity, start, end, user_id),
+        }
+
+    def get_all_usage(
+        self,
+        db: Session,
+        granularity: str = DAY,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> dict:
+        """
+        Returns usage totals per user, and token totals per model, over a window, for administrators.
+
+        Args:
+            db (Session): The database session.
+            granularity (str, optional): The rollup level to sum over. Defaults to ``"day"``.
+            start (datetime, optional): Start of the window.
+            end (datetime, optional): End of the window. Defaults to now.
+
+        Returns:
+            dict: The per-user usage totals.
+
+        Raises:
+            HTTPException: If the granularity or window is invalid.
+        """
+        start, end = self._report_window(granularity, start, end)
+        columns = [func.sum(getattr(UsageRollup, column)).label(column) for column in COUNTER_COLUMNS]
+        rows = (
+            db.query(UsageRollup.user_id, *columns)
+            .filter(
+                UsageRollup.granularity == granularity,
+                UsageRollup.bucket_start >= start,
+                UsageRollup.bucket_start < end,
+            )
+            .group_by(UsageRollup.user_id)
+            .order_by(UsageRollup.user_id)
+            .all()
+        )
+        return {
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+            "users": [
+                {
+                    "user_id": row.user_id,
+                    "request_count": row.request_count,
+                    "error_count": row.error_count,
+                    "latency_sum_ms": row.latency_sum_ms,
+                    "latency_histogram": [getattr(row, column) for column in LATENCY_COLUMNS],
+                    "prompt_tokens": row.prompt_tokens,
+                    "completion_tokens": row.completion_tokens,
+                    "total_tokens": row.total_tokens,
+                }
+                for row in rows
+            ],
+            "models": self._model_totals(db, granularity, start, end),
+        }
+
+
+usage_service = UsageService()
@@ -1,20 +1,27 @@
-from fastapi import HTTPException, status
+from functools import lru_cache
+
+from fastapi import Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
 from dependencies.auth import create_access_token, get_current_user
 from dependencies.database import get_db
 from models.user import User
-from schemas.user import UserCreate, User, UserLogin, Token
-
-from passlib.context import CryptContext
+from api.schemas.user import UserCreate, UserLogin
 
 # Load environment variables
-from .config import settings
+from dependencies.config import settings
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """Returns the password hashing context, importing passlib and bcrypt on first use."""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 class UserService:
@@ -22,7 +29,19 @@ class UserService:
         self.db = db
 
     async def create_user(self, request: UserCreate):
-        hashed_password = pwd_context.hash(request.password)
+        # One lookup served by the unique indexes on username and email; the
+        # IntegrityError handling below still covers concurrent registrations.
+        existing = (
+            self.db.query(User.username, User.email)
+            .filter(or_(User.username == request.username, User.email == request.email))
+            .first()
+        )
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already exists" if existing.username == request.username else "Email already exists",
+            )
+        hashed_password = get_pwd_context().hash(request.password)
         new_user = User(username=request.username, email=request.email, password=hashed_password)
         try:
             self.db.add(new_user)
@@ -54,7 +73,7 @@ class UserService:
                 detail="Invalid credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        if not pwd_context.verify(request.password, user.password):
+        if not get_pwd_context().verify(request.password, user.password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect password",
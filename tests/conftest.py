@@ -4,6 +4,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import StaticPool
 
 from openai_api_client.main import app
 from openai_api_client.dependencies.database import Base, get_async_session
@@ -11,6 +12,7 @@ from openai_api_client.services.user import user_service
 from openai_api_client.services.openai import openai_service
 from openai_api_client.models.user import User
 from openai_api_client.schemas.user import UserCreate
+from openai_api_client.tests.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
 
 # --- Database Setup ---
 
@@ -37,6 +39,47 @@ async def engine():
         await conn.run_sync(Base.metadata.create_all)
     yield async_engine
 
+@pytest.fixture
+def session_factory():
+    # A fresh in-memory SQLite database per test, one connection shared by all its sessions,
+    # with every table and two users: alice (1, with her own API key) and bob (2, shared keys).
+    # Imported here, for their tables, so tests without a database do not load the services.
+    from openai_api_client.dependencies import budget  # noqa: F401
+    from openai_api_client.services import conversations, jobs  # noqa: F401
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    jobs.Job.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            jobs.User.__table__.insert(),
+            [
+                {"id": 1, "username": "alice", "email": "alice@example.com", "password": "x", "api_key": "sk-alice"},
+                {"id": 2, "username": "bob", "email": "bob@example.com", "password": "x", "api_key": None},
+            ],
+        )
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+# --- Clock ---
+
+class FakeClock:
+    """A clock for code taking a ``clock`` callable; tests move ``now`` on by hand."""
+
+    def __init__(self, now=0.0):
+        self.now = float(now)
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
 # --- Mock Services ---
 
 @pytest.fixture
@@ -49,6 +92,33 @@ async def mock_openai_service():
     async with openai_service() as service:
         yield service
 
+@pytest.fixture(scope="session")
+def fake_openai_server():
+    with FakeOpenAIServer(FakeOpenAIConfig(latency_distribution="constant", latency_ms=20, seed=0)) as server:
+        yield server
+
+@pytest.fixture
+def fake_openai(fake_openai_server):
+    # Reset behaviour between tests; tests tweak ``fake_openai.config`` as needed.
+    fake_openai_server.config.update(**vars(FakeOpenAIConfig(latency_distribution="constant", latency_ms=20, seed=0)))
+    fake_openai_server.app.state.stats["requests_by_model"].clear()
+    yield fake_openai_server
+
+@pytest.fixture(scope="session")
+def fake_openai_backend_servers():
+    servers = [FakeOpenAIServer(FakeOpenAIConfig(latency_distribution="constant", latency_ms=20, seed=i)).start() for i in range(3)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def fake_openai_backends(fake_openai_backend_servers):
+    # Three independent stand-ins, e.g. primary region, secondary region and a self-hosted server.
+    for server in fake_openai_backend_servers:
+        server.config.update(**vars(FakeOpenAIConfig(latency_distribution="constant", latency_ms=20, seed=0)))
+        server.app.state.stats["requests_by_key"].clear()
+    yield fake_openai_backend_servers
+
 # --- Test Client ---
 
 @pytest.fixture
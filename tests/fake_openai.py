@@ -0,0 +1,414 @@
+"""
+Local stand-in for the OpenAI HTTP API, for load and latency testing without network access.
+
+Serves ``/v1/completions``, ``/v1/chat/completions`` (both with SSE streaming),
+``/v1/embeddings`` and ``/v1/models/{id}`` with configurable latency distributions,
+token streaming rate, injected 429/5xx errors, ``Retry-After`` and ``x-ratelimit-*``
+headers. Point the gateway at it with ``OPENAI_BASE_URL=http://127.0.0.1:8100/v1``.
+
+Run it with::
+
+    python tests/fake_openai.py --port 8100 --latency-ms 400 --tokens-per-second 80 --error-rate-429 0.02
+
+The configuration can be changed while it runs by posting a partial config to
+``/_fake/config``.
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven wizards quietly "
+    "judge boxing matches near an old stone bridge under pale morning light"
+).split()
+
+
+@dataclass
+class FakeOpenAIConfig:
+    """Behaviour of the fake server. Every field can be set by flag or ``FAKE_OPENAI_<NAME>``."""
+
+    latency_distribution: str = "lognormal"  # constant | uniform | lognormal
+    latency_ms: float = 300.0  # constant value, uniform mean or lognormal median
+    latency_jitter: float = 0.5  # uniform: +/- fraction of latency_ms; lognormal: sigma
+    tokens_per_second: float = 0.0  # generation speed; 0 returns all tokens at once
+    completion_tokens: int = 32  # tokens generated per choice, capped by max_tokens
+    embedding_dimensions: int = 1536
+    token_logprob: float = -0.25  # logprob reported for every generated token when logprobs are requested
+    error_rate_429: float = 0.0
+    error_rate_5xx: float = 0.0
+    retry_after_seconds: float = 1.0
+    rate_limit_requests: int = 10000  # requests per minute per API key before answering 429
+    rate_limit_tokens: int = 2000000  # tokens per minute per API key before answering 429
+    revoked_api_keys: str = ""  # comma-separated keys answered with 401
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeOpenAIConfig":
+        config = cls()
+        for field in fields(cls):
+            value = os.environ.get(f"FAKE_OPENAI_{field.name.upper()}")
+            if value is not None:
+                config.update(**{field.name: value})
+        return config
+
+    def update(self, **values) -> None:
+        for field in fields(self):
+            value = values.get(field.name)
+            if value is not None:
+                convert = int if field.name == "seed" else field.type
+                setattr(self, field.name, convert(value))
+
+
+class RateLimitWindow:
+    """Fixed one-minute request and token budget, reported the way OpenAI reports it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.requests = 0
+        self.tokens = 0
+
+    def consume(self, config: FakeOpenAIConfig, tokens: int):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.requests, self.tokens = now, 0, 0
+            reset = max(0.0, 60 - (now - self.window_start))
+            allowed = self.requests < config.rate_limit_requests and self.tokens + tokens <= config.rate_limit_tokens
+            if allowed:
+                self.requests += 1
+                self.tokens += tokens
+            headers = {
+                "x-ratelimit-limit-requests": str(config.rate_limit_requests),
+                "x-ratelimit-remaining-requests": str(max(0, config.rate_limit_requests - self.requests)),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                "x-ratelimit-limit-tokens": str(config.rate_limit_tokens),
+                "x-ratelimit-remaining-tokens": str(max(0, config.rate_limit_tokens - self.tokens)),
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            }
+            return allowed, reset, headers
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), good enough for load shaping."""
+    return max(1, math.ceil(len(text) / 4))
+
+
+@functools.lru_cache(maxsize=65536)
+def word_vector(word: str, dimensions: int) -> Tuple[float, ...]:
+    seeded = random.Random(hashlib.sha256(word.encode("utf-8")).digest())
+    return tuple(seeded.gauss(0, 1) for _ in range(dimensions))
+
+
+def embed(text: str, dimensions: int) -> List[float]:
+    """
+    Bag-of-words embedding: the normalized sum of a fixed random vector per word.
+
+    Deterministic, and texts sharing most of their words (reworded, reordered or
+    differently cased prompts) get similar vectors, like real embeddings.
+    """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()) or [text]:
+        for position, value in enumerate(word_vector(word, dimensions)):
+            vector[position] += value
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def create_app(config: Optional[FakeOpenAIConfig] = None) -> FastAPI:
+    """Builds the fake OpenAI application around a mutable ``config``."""
+    config = config or FakeOpenAIConfig.from_env()
+    rng = random.Random(config.seed)
+    windows: Dict[str, RateLimitWindow] = {}
+    app = FastAPI(title="Fake OpenAI API")
+    app.state.config = config
+    app.state.stats = {"requests": 0, "errors_429": 0, "errors_5xx": 0, "cancelled_streams": 0, "embedded_inputs": 0, "requests_by_key": {}, "requests_by_model": {}}
+
+    def latency() -> float:
+        base = config.latency_ms / 1000
+        if config.latency_distribution == "constant":
+            return base
+        if config.latency_distribution == "uniform":
+            return max(0.0, rng.uniform(base * (1 - config.latency_jitter), base * (1 + config.latency_jitter)))
+        return rng.lognormvariate(math.log(max(base, 1e-6)), config.latency_jitter)
+
+    def generate(max_tokens: Optional[int]) -> List[str]:
+        count = min(config.completion_tokens, max_tokens or config.completion_tokens)
+        return [WORDS[(index * 7) % len(WORDS)] + " " for index in range(count)]
+
+    def error_response(status_code: int, message: str, error_type: str, headers: dict) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"error": {"message": message, "type": error_type, "param": None, "code": None}},
+            headers=headers,
+        )
+
+    async def admit(request: Request, model: str, prompt_tokens: int, max_tokens: Optional[int]):
+        """Applies auth, rate limits and error injection; returns (error response or None, headers)."""
+        app.state.stats["requests"] += 1
+        api_key = request.headers.get("authorization", "").removeprefix("Bearer ")
+        by_key = app.state.stats["requests_by_key"]
+        by_key[api_key] = by_key.get(api_key, 0) + 1
+        by_model = app.state.stats["requests_by_model"]
+        by_model[model] = by_model.get(model, 0) + 1
+        if api_key in config.revoked_api_keys.split(","):
+            return error_response(401, "Incorrect API key provided (fake server).", "invalid_request_error", {}), {}
+        window = windows.setdefault(api_key, RateLimitWindow())
+        expected_tokens = config.completion_tokens if max_tokens is None else max_tokens
+        allowed, reset, headers = window.consume(config, prompt_tokens + expected_tokens)
+        if not allowed or rng.random() < config.error_rate_429:
+            app.state.stats["errors_429"] += 1
+            retry_after = reset if not allowed else config.retry_after_seconds
+            headers["retry-after"] = f"{retry_after:.3f}"
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            return error_response(429, "Rate limit reached (fake server).", "requests", headers), headers
+        if rng.random() < config.error_rate_5xx:
+            app.state.stats["errors_5xx"] += 1
+            headers["retry-after"] = f"{config.retry_after_seconds:.3f}"
+            return error_response(rng.choice((500, 502, 503)), "Upstream failure (fake server).", "server_error", headers), headers
+        return None, headers
+
+    async def pace(tokens: List[str]):
+        if config.tokens_per_second > 0:
+            await asyncio.sleep(len(tokens) / config.tokens_per_second)
+
+    def usage(prompt_tokens: int, completion_tokens: int) -> dict:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def stream(make_chunk, tokens: List[str], prompt_tokens: int, include_usage: bool, headers: dict):
+        async def events():
+            try:
+                for index, token in enumerate(tokens):
+                    if config.tokens_per_second > 0:
+                        await asyncio.sleep(1 / config.tokens_per_second)
+                    finish_reason = "length" if index == len(tokens) - 1 else None
+                    yield f"data: {json.dumps(make_chunk(token, finish_reason))}\n\n"
+                if include_usage:
+                    final = make_chunk(None, None)
+                    final["choices"] = []
+                    final["usage"] = usage(prompt_tokens, len(tokens))
+                    yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                app.state.stats["cancelled_streams"] += 1
+                raise
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.post("/v1/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        prompt = prompt if isinstance(prompt, str) else " ".join(prompt)
+        prompt_tokens = count_tokens(prompt)
+        model = body.get("model", "text-davinci-003")
+        error, headers = await admit(request, model, prompt_tokens, body.get("max_tokens"))
+        if error is not None:
+            return error
+        await asyncio.sleep(latency())
+        tokens = generate(body.get("max_tokens"))
+        completion_id = f"cmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        want_logprobs = body.get("logprobs") is not None
+
+        def make_chunk(token, finish_reason):
+            choice = {"text": token or "", "index": 0, "logprobs": None, "finish_reason": finish_reason}
+            if want_logprobs and token is not None:
+                choice["logprobs"] = {"tokens": [token], "token_logprobs": [config.token_logprob]}
+            return {"id": completion_id, "object": "text_completion", "created": created, "model": model, "choices": [choice]}
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return stream(make_chunk, tokens, prompt_tokens, include_usage, headers)
+        await pace(tokens)
+        logprobs = {"tokens": tokens, "token_logprobs": [config.token_logprob] * len(tokens)} if want_logprobs else None
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "text_completion",
+                "created": created,
+                "model": model,
+                "choices": [{"text": "".join(tokens), "index": 0, "logprobs": logprobs, "finish_reason": "length"}],
+                "usage": usage(prompt_tokens, len(tokens)),
+            },
+            headers=headers,
+        )
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(count_tokens(str(message.get("content") or "")) + 4 for message in body.get("messages", []))
+        model = body.get("model", "gpt-3.5-turbo")
+        error, headers = await admit(request, model, prompt_tokens, body.get("max_tokens"))
+        if error is not None:
+            return error
+        await asyncio.sleep(latency())
+        tokens = generate(body.get("max_tokens"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def make_chunk(token, finish_reason):
+            delta = {"content": token} if token is not None else {}
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+            }
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return stream(make_chunk, tokens, prompt_tokens, include_usage, headers)
+        await pace(tokens)
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "logprobs": None,
+                        "finish_reason": "length",
+                    }
+                ],
+                "usage": usage(prompt_tokens, len(tokens)),
+            },
+            headers=headers,
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        prompt_tokens = sum(count_tokens(text) for text in inputs)
+        error, headers = await admit(request, body.get("model", "text-embedding-3-small"), prompt_tokens, 0)
+        if error is not None:
+            return error
+        app.state.stats["embedded_inputs"] += len(inputs)
+        await asyncio.sleep(latency())
+        dimensions = body.get("dimensions") or config.embedding_dimensions
+        data = []
+        for index, text in enumerate(inputs):
+            vector = embed(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+            },
+            headers=headers,
+        )
+
+    @app.get("/v1/models/{model_id}")
+    async def retrieve_model(request: Request, model_id: str):
+        error, headers = await admit(request, model_id, 1, 0)
+        if error is not None:
+            return error
+        await asyncio.sleep(latency())
+        return JSONResponse(
+            {"id": model_id, "object": "model", "created": 1669599635, "owned_by": "openai-internal"},
+            headers=headers,
+        )
+
+    @app.get("/_fake/config")
+    async def read_config():
+        return {"config": asdict(config), "stats": app.state.stats}
+
+    @app.post("/_fake/config")
+    async def update_config(request: Request):
+        config.update(**(await request.json()))
+        return {"config": asdict(config), "stats": app.state.stats}
+
+    return app
+
+
+class FakeOpenAIServer:
+    """
+    Runs the fake server with uvicorn in a background thread.
+
+    Example:
+        with FakeOpenAIServer(FakeOpenAIConfig(latency_ms=50)) as server:
+            service = OpenAIService(base_url=server.base_url)
+    """
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        import uvicorn
+
+        self.app = create_app(config)
+        self.config = self.app.state.config
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self.host = host
+
+    @property
+    def base_url(self) -> str:
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake OpenAI server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    for field in fields(FakeOpenAIConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", dest=field.name)
+    args = parser.parse_args()
+    config = FakeOpenAIConfig.from_env()
+    config.update(**vars(args))
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,604 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+from starlette.requests import Request
+
+from openai_api_client.dependencies.backends import Backend
+from openai_api_client.dependencies.cascade import Cascade
+from openai_api_client.dependencies.cassette import Cassette, CassetteTransport
+from openai_api_client.dependencies.credentials import Credential, CredentialPool
+from openai_api_client.dependencies.limiter import AdaptiveLimit
+from openai_api_client.dependencies.deadline import UpstreamTimeouts, deadline
+from openai_api_client.dependencies.openai import OpenAIService, count_tokens
+from openai_api_client.dependencies.semantic_cache import SemanticCache
+from openai_api_client.dependencies.disconnect import cancel_on_disconnect
+from openai_api_client.dependencies.vector_store import VectorStore
+from openai_api_client.services.collections import CollectionService
+
+
+def make_service(fake_openai, **kwargs):
+    return OpenAIService(api_key="sk-test", base_url=fake_openai.base_url, **kwargs)
+
+
+def make_request(disconnect_after=None):
+    """An HTTP request to /api/v1/openai/complete whose client disconnects after ``disconnect_after`` seconds, or never."""
+    async def receive():
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "path": "/api/v1/openai/complete",
+        "query_string": b"",
+        "headers": [],
+    }
+    return Request(scope, receive)
+
+
+class TestOpenAIServiceAgainstFakeServer:
+    def test_complete_text_success(self, fake_openai):
+        """Test a completion round trip through the HTTP client."""
+        response = asyncio.run(make_service(fake_openai).complete_text(text="Once upon a time", max_tokens=5))
+        assert len(response.response.split()) == 5
+
+    def test_translate_text_success(self, fake_openai):
+        """Test that translation goes through chat completions."""
+        response = asyncio.run(make_service(fake_openai).translate_text(text="Hello world", source_language="en", target_language="fr"))
+        assert response.response
+
+    def test_client_created_on_first_use(self, fake_openai):
+        """Test that the client is only built when first needed and rebuilt after reset."""
+        service = make_service(fake_openai)
+        assert service.pool.credentials[0].client is None
+        client = service.client
+        assert service.client is client
+        service.reset()
+        assert service.client is not client
+
+    def test_get_model_success(self, fake_openai):
+        """Test model retrieval."""
+        model = asyncio.run(make_service(fake_openai).get_model("text-davinci-003"))
+        assert model.id == "text-davinci-003"
+        assert model.owned_by == "openai-internal"
+
+    def test_get_model_unknown_id_labelled_other(self, fake_openai):
+        """Test that a model id the API does not accept is not used as a metric label."""
+        def count(model):
+            return REGISTRY.get_sample_value("openai_upstream_duration_seconds_count", {"model": model, "method": "get_model"}) or 0.0
+
+        before = count("other")
+        model = asyncio.run(make_service(fake_openai).get_model("ft:my-model-123"))
+        assert model.id == "ft:my-model-123"
+        assert count("other") == before + 1 and count("ft:my-model-123") == 0
+
+    def test_rate_limit_maps_to_429(self, fake_openai):
+        """Test that an upstream 429 surfaces as HTTP 429."""
+        fake_openai.config.update(error_rate_429=1.0)
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(make_service(fake_openai, max_retries=0).complete_text(text="Hello"))
+        assert exc.value.status_code == 429
+
+    def test_rate_limit_retry_after_is_honoured(self, fake_openai):
+        """Test that the client waits for Retry-After before retrying."""
+        fake_openai.config.update(error_rate_429=1.0, retry_after_seconds=0.2)
+        start = time.perf_counter()
+        with pytest.raises(HTTPException):
+            asyncio.run(make_service(fake_openai, max_retries=1).complete_text(text="Hello"))
+        assert time.perf_counter() - start >= 0.2
+
+    def test_server_error_maps_to_500(self, fake_openai):
+        """Test that an upstream 5xx surfaces as HTTP 500."""
+        fake_openai.config.update(error_rate_5xx=1.0)
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(make_service(fake_openai, max_retries=0).complete_text(text="Hello"))
+        assert exc.value.status_code == 500
+
+    def test_timeout_maps_to_504(self, fake_openai):
+        """Test that a slow upstream surfaces as HTTP 504."""
+        fake_openai.config.update(latency_ms=500)
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(make_service(fake_openai, timeout=0.1, max_retries=0).complete_text(text="Hello"))
+        assert exc.value.status_code == 504
+
+    def test_rate_limit_lowers_concurrency_limit(self, fake_openai):
+        """Test that upstream 429s lower the adaptive limit and successes leave nothing in flight."""
+        limit = AdaptiveLimit(initial=10, minimum=2, backoff=0.5, adaptive=True)
+        service = make_service(fake_openai, max_retries=0, limit=limit)
+
+        async def run():
+            await service.complete_text(text="Hello")
+            fake_openai.config.update(error_rate_429=1.0)
+            with pytest.raises(HTTPException) as exc_info:
+                await service.complete_text(text="Hello")
+            return exc_info.value
+
+        assert asyncio.run(run()).status_code == 429
+        assert limit.limit == 5 and limit.in_flight == 0
+
+    def test_concurrent_calls_overlap(self, fake_openai):
+        """Test that concurrent completions wait on upstream in parallel."""
+        fake_openai.config.update(latency_ms=200)
+        service = make_service(fake_openai)
+
+        async def run():
+            return await asyncio.gather(*(service.complete_text(text=f"prompt {i}") for i in range(50)))
+
+        start = time.perf_counter()
+        responses = asyncio.run(run())
+        assert len(responses) == 50
+        assert time.perf_counter() - start < 2.0
+
+    def test_cassette_replay_without_upstream(self, fake_openai, tmp_path):
+        """Test that a recorded completion replays after the upstream starts failing."""
+        path = str(tmp_path / "openai.jsonl.gz")
+        recorder = make_service(fake_openai, transport=CassetteTransport(Cassette(path), mode="record"))
+        recorded = asyncio.run(recorder.complete_text(text="Once upon a time", max_tokens=5))
+
+        fake_openai.config.update(error_rate_5xx=1.0)
+        replayer = make_service(fake_openai, max_retries=0, transport=CassetteTransport(Cassette(path), mode="replay"))
+        replayed = asyncio.run(replayer.complete_text(text="Once upon a time", max_tokens=5))
+        assert replayed.response == recorded.response
+
+
+class TestCredentialPoolAgainstFakeServer:
+    def test_throughput_scales_with_keys(self, fake_openai):
+        """Test that three keys serve three times one key's request budget."""
+        fake_openai.config.update(rate_limit_requests=5)
+        keys = [f"sk-scale-key-{i}" for i in range(3)]
+        service = OpenAIService(base_url=fake_openai.base_url, credentials=[Credential(key) for key in keys])
+
+        async def run():
+            return await asyncio.gather(*(service.complete_text(text=f"prompt {i}", max_tokens=4) for i in range(15)))
+
+        assert len(asyncio.run(run())) == 15
+        by_key = fake_openai.app.state.stats["requests_by_key"]
+        assert [by_key[key] for key in keys] == [5, 5, 5]
+
+        single = OpenAIService(api_key="sk-scale-single", base_url=fake_openai.base_url, max_retries=0)
+
+        async def run_single():
+            for i in range(5):
+                await single.complete_text(text=f"prompt {i}", max_tokens=4)
+            await single.complete_text(text="one too many", max_tokens=4)
+
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run_single())
+        assert exc.value.status_code == 429
+
+    def test_rate_limited_key_fails_over(self, fake_openai):
+        """Test that a call answered with 429 is retried on another key and the key ejected."""
+        fake_openai.config.update(rate_limit_requests=1, retry_after_seconds=30)
+        # Use up the first key's budget outside the pool, so the pool only learns of it from a 429.
+        asyncio.run(OpenAIService(api_key="sk-failover-a", base_url=fake_openai.base_url).complete_text(text="elsewhere", max_tokens=4))
+        exhausted, fresh = Credential("sk-failover-a"), Credential("sk-failover-b")
+        service = OpenAIService(base_url=fake_openai.base_url, credentials=[exhausted, fresh], max_retries=1)
+        response = asyncio.run(service.complete_text(text="first", max_tokens=4))
+        assert response.response
+        assert exhausted.ejected_until > time.monotonic()
+        assert fake_openai.app.state.stats["requests_by_key"]["sk-failover-b"] == 1
+
+    def test_revoked_key_is_ejected(self, fake_openai):
+        """Test that a key the API rejects is skipped after its first failure."""
+        fake_openai.config.update(revoked_api_keys="sk-revoked-key")
+        service = OpenAIService(
+            base_url=fake_openai.base_url,
+            credentials=[Credential("sk-revoked-key"), Credential("sk-working-key")],
+        )
+
+        async def run():
+            for i in range(4):
+                await service.complete_text(text=f"prompt {i}", max_tokens=4)
+
+        asyncio.run(run())
+        assert fake_openai.app.state.stats["requests_by_key"]["sk-revoked-key"] == 1
+
+
+class TestUserKeysAgainstFakeServer:
+    def test_user_keys_are_isolated(self, fake_openai):
+        """Test that concurrent calls with different user keys each go out with their own key."""
+        service = make_service(fake_openai)
+        users = [f"sk-byok-user-{i}" for i in range(4)]
+
+        async def run():
+            await asyncio.gather(*(service.complete_text(text="Hello", max_tokens=4, api_key=key) for key in users * 5))
+
+        asyncio.run(run())
+        by_key = fake_openai.app.state.stats["requests_by_key"]
+        assert [by_key[key] for key in users] == [5, 5, 5, 5]
+        clients = {id(pool.credentials[0].client) for pool in service.user_pools}
+        assert len(service.user_pools) == 4 and len(clients) == 4
+
+
+def make_backends(servers):
+    return [
+        Backend(name, server.base_url, CredentialPool([Credential(f"sk-{name}-0001")]))
+        for name, server in zip(("primary", "secondary", "self-hosted"), servers)
+    ]
+
+
+def backend_requests(server):
+    return sum(server.app.state.stats["requests_by_key"].values())
+
+
+class TestBackendRoutingAgainstFakeServers:
+    def test_slow_backend_gets_less_traffic(self, fake_openai_backends):
+        """Test that calls concentrate on the backends with lower latency."""
+        fast, other_fast, slow = fake_openai_backends
+        slow.config.update(latency_ms=300)
+        service = OpenAIService(backends=make_backends(fake_openai_backends))
+
+        async def run():
+            for i in range(30):
+                await service.complete_text(text=f"prompt {i}", max_tokens=4)
+
+        asyncio.run(run())
+        assert backend_requests(slow) <= 2
+        assert backend_requests(fast) + backend_requests(other_fast) >= 28
+
+    def test_failing_backend_fails_over_and_is_ejected(self, fake_openai_backends):
+        """Test that 5xx answers are retried on another backend and the failing backend ejected."""
+        failing = fake_openai_backends[0]
+        failing.config.update(error_rate_5xx=1.0)
+        backends = make_backends(fake_openai_backends)
+        service = OpenAIService(backends=backends, max_retries=2)
+
+        async def run():
+            return await asyncio.gather(*(service.complete_text(text=f"prompt {i}", max_tokens=4) for i in range(40)))
+
+        assert len(asyncio.run(run())) == 40
+        assert backends[0].ejected_until > time.monotonic()
+        assert backend_requests(failing) < 20
+
+    def test_unreachable_backend_fails_over(self, fake_openai_backends):
+        """Test that connection errors are retried on another backend."""
+        backends = [Backend("down", "http://127.0.0.1:9/v1", CredentialPool([Credential("sk-down-0001")]))]
+        backends += make_backends(fake_openai_backends[:1])
+        service = OpenAIService(backends=backends, max_retries=1, timeout=2)
+
+        async def run():
+            return [await service.complete_text(text=f"prompt {i}", max_tokens=4) for i in range(10)]
+
+        assert len(asyncio.run(run())) == 10
+        assert backend_requests(fake_openai_backends[0]) == 10
+
+
+class TestCascadeAgainstFakeServer:
+    def test_fast_model_answer_accepted(self, fake_openai):
+        """Test that an acceptable fast-model answer is returned without calling the requested model."""
+        service = make_service(fake_openai, cascade=Cascade.from_spec("text-curie-001", "min_length=5"))
+        response = asyncio.run(service.complete_text(text="Hello", model="text-davinci-003", max_tokens=8, cascade=True))
+        assert response.response
+        assert fake_openai.app.state.stats["requests_by_model"] == {"text-curie-001": 1}
+
+    def test_low_confidence_escalates(self, fake_openai):
+        """Test that a fast-model answer below the logprob threshold is replaced by the requested model's."""
+        fake_openai.config.update(token_logprob=-3.0)
+        service = make_service(fake_openai, cascade=Cascade.from_spec("text-curie-001", "min_logprob=-1.0"))
+        asyncio.run(service.complete_text(text="Hello", model="text-davinci-003", max_tokens=8, cascade=True))
+        assert fake_openai.app.state.stats["requests_by_model"] == {"text-curie-001": 1, "text-davinci-003": 1}
+
+    def test_without_cascade_uses_requested_model(self, fake_openai):
+        """Test that completions without cascade mode are unchanged."""
+        asyncio.run(make_service(fake_openai).complete_text(text="Hello", model="text-davinci-003", max_tokens=8))
+        assert fake_openai.app.state.stats["requests_by_model"] == {"text-davinci-003": 1}
+
+
+class TestSemanticCacheAgainstFakeServer:
+    def make_cached_service(self, fake_openai):
+        return make_service(fake_openai, semantic_cache=SemanticCache(dimensions=64, max_entries=1000, threshold=0.9, path=None))
+
+    def test_paraphrased_prompt_served_from_cache(self, fake_openai):
+        """Test that a reworded prompt is answered from the cache without another completion."""
+        service = self.make_cached_service(fake_openai)
+
+        async def run():
+            first = await service.complete_text(text="What is the capital city of France?", max_tokens=8)
+            second = await service.complete_text(text="what is the capital city of france", max_tokens=8)
+            exact = await service.complete_text(text="what is the capital city of france", max_tokens=8)
+            return first, second, exact
+
+        first, second, exact = asyncio.run(run())
+        assert first.response == second.response == exact.response
+        by_model = fake_openai.app.state.stats["requests_by_model"]
+        assert by_model["text-davinci-003"] == 1
+        # The exact repeat is found by text, without embedding it again.
+        assert by_model["text-embedding-3-small"] == 2
+
+    def test_other_parameters_miss(self, fake_openai):
+        """Test that cached answers are only reused for the same endpoint and parameters."""
+        service = self.make_cached_service(fake_openai)
+
+        async def run():
+            await service.complete_text(text="Tell me a story", max_tokens=8)
+            await service.complete_text(text="Tell me a story", max_tokens=16)
+            await service.summarize_text(text="Tell me a story")
+
+        asyncio.run(run())
+        by_model = fake_openai.app.state.stats["requests_by_model"]
+        assert by_model["text-davinci-003"] == 3
+
+    def test_user_keys_bypass_cache(self, fake_openai):
+        """Test that calls with a user's own key neither use nor fill the shared cache."""
+        service = self.make_cached_service(fake_openai)
+
+        async def run():
+            await service.complete_text(text="Tell me a story", max_tokens=8, api_key="sk-byok-user-1")
+            await service.complete_text(text="Tell me a story", max_tokens=8, api_key="sk-byok-user-1")
+
+        asyncio.run(run())
+        assert "text-embedding-3-small" not in fake_openai.app.state.stats["requests_by_model"]
+        assert len(service.semantic_cache) == 0
+
+
+class TestChatStreamingAgainstFakeServer:
+    def test_stream_chat_yields_tokens(self, fake_openai):
+        """Test that a streamed chat completion arrives piece by piece and its usage is recorded."""
+        service = make_service(fake_openai)
+
+        async def run():
+            return [text async for text in service.stream_chat([{"role": "user", "content": "Hello"}], max_tokens=6)]
+
+        pieces = asyncio.run(run())
+        assert len(pieces) == 6
+        assert all(piece for piece in pieces)
+
+    def test_closing_stream_stops_upstream(self, fake_openai):
+        """Test that stopping the iteration early closes the upstream stream instead of reading it to the end."""
+        fake_openai.config.update(tokens_per_second=50)
+        service = make_service(fake_openai)
+        stats = fake_openai.app.state.stats
+
+        async def run():
+            before = stats["cancelled_streams"]
+            stream = service.stream_chat([{"role": "user", "content": "Hello"}], max_tokens=200)
+            async for _ in stream:
+                break
+            await stream.aclose()
+            for _ in range(50):
+                if stats["cancelled_streams"] > before:
+                    break
+                await asyncio.sleep(0.02)
+            return stats["cancelled_streams"] - before
+
+        assert asyncio.run(run()) == 1
+
+
+class TestTokenUsageAgainstFakeServer:
+    def test_response_carries_upstream_usage(self, fake_openai):
+        """Test that the usage block of the upstream response is returned with the answer."""
+        response = asyncio.run(make_service(fake_openai).complete_text(text="Once upon a time", max_tokens=5))
+        assert response.usage.completion_tokens == 5
+        assert response.usage.total_tokens == response.usage.prompt_tokens + 5
+
+    def test_escalated_cascade_counts_both_models(self, fake_openai):
+        """Test that a request's tally holds the tokens of every call made for it, per model."""
+        fake_openai.config.update(token_logprob=-3.0)
+        service = make_service(fake_openai, cascade=Cascade.from_spec("text-curie-001", "min_logprob=-1.0"))
+
+        async def run():
+            with count_tokens() as tally:
+                response = await service.complete_text(text="Hello", model="text-davinci-003", max_tokens=8, cascade=True)
+            return response, tally
+
+        response, tally = asyncio.run(run())
+        assert sorted(tally.models) == ["text-curie-001", "text-davinci-003"]
+        assert all(counts[0] == 1 and counts[2] == 8 for counts in tally.models.values())
+        assert response.usage.completion_tokens == 16
+
+    def test_stream_usage_counted(self, fake_openai):
+        """Test that a stream's usage is counted from its last chunk, and estimated when it is stopped early."""
+        fake_openai.config.update(tokens_per_second=200)
+        service = make_service(fake_openai)
+
+        async def run():
+            with count_tokens() as full:
+                [text async for text in service.stream_chat([{"role": "user", "content": "Hello"}], max_tokens=6)]
+            with count_tokens() as stopped:
+                stream = service.stream_chat([{"role": "user", "content": "Hello"}], max_tokens=200)
+                async for _ in stream:
+                    break
+                await stream.aclose()
+            return full, stopped
+
+        full, stopped = asyncio.run(run())
+        assert full.models["gpt-3.5-turbo"][0] == 1 and full.models["gpt-3.5-turbo"][2] == 6
+        assert stopped.models["gpt-3.5-turbo"][0] == 1 and stopped.prompt_tokens > 0
+
+
+class TestDeadlinesAgainstFakeServer:
+    def test_call_abandoned_at_deadline(self, fake_openai):
+        """Test that a call still running at the caller's deadline is abandoned with a 504, without a retry."""
+        fake_openai.config.update(latency_ms=500)
+        service = make_service(fake_openai, max_retries=2)
+
+        async def run():
+            with deadline(0.1):
+                await service.complete_text(text="Hello")
+
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run())
+        assert exc.value.status_code == 504 and "Deadline" in exc.value.detail
+        assert time.perf_counter() - started < 0.4
+        assert sum(fake_openai.app.state.stats["requests_by_model"].values()) == 1
+
+    def test_no_call_after_deadline(self, fake_openai):
+        """Test that no upstream call is started once the deadline has passed."""
+        service = make_service(fake_openai)
+
+        async def run():
+            with deadline(0.01):
+                await asyncio.sleep(0.02)
+                await service.complete_text(text="Hello")
+
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run())
+        assert exc.value.status_code == 504
+        assert not fake_openai.app.state.stats["requests_by_model"]
+
+    def test_stalled_stream_stopped_at_deadline(self, fake_openai):
+        """Test that a stream waiting for its next chunk is stopped with a 504 at the deadline, not when the chunk arrives."""
+        # A chunk every 0.9s: each read is within the client's read timeout, but the second ends past the deadline.
+        fake_openai.config.update(tokens_per_second=1 / 0.9)
+        service = make_service(fake_openai)
+
+        async def run():
+            with deadline(1.0):
+                return [text async for text in service.stream_chat([{"role": "user", "content": "Hello"}], max_tokens=6)]
+
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run())
+        assert exc.value.status_code == 504 and "Deadline" in exc.value.detail
+        assert time.perf_counter() - started < 1.4
+
+    def test_timeout_set_from_model_latency(self, fake_openai):
+        """Test that once a model is known to be fast, a call far slower than usual times out well before the maximum."""
+        timeouts = UpstreamTimeouts(maximum=5, minimum=0.1, factor=2)
+        service = make_service(fake_openai, timeouts=timeouts, max_retries=0)
+
+        async def run():
+            for _ in range(20):
+                await service.complete_text(text="Hello", max_tokens=1)
+            fake_openai.config.update(latency_ms=1000)
+            await service.complete_text(text="Hello", max_tokens=1)
+
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run())
+        assert exc.value.status_code == 504 and "timed out" in exc.value.detail
+        assert timeouts.timeout("complete_text:text-davinci-003") < 1
+        assert time.perf_counter() - started < 2
+
+
+class TestDisconnectsAgainstFakeServer:
+    def test_call_cancelled_on_disconnect(self, fake_openai):
+        """Test that a client disconnecting cancels its upstream call at once with a 499, freeing its slot."""
+        fake_openai.config.update(latency_ms=1000)
+        limit = AdaptiveLimit(initial=10, minimum=2, adaptive=True)
+        service = make_service(fake_openai, limit=limit)
+
+        async def run():
+            await cancel_on_disconnect(make_request(disconnect_after=0.05), service.complete_text(text="Hello"))
+
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(run())
+        assert exc.value.status_code == 499
+        assert time.perf_counter() - started < 0.5
+        assert limit.in_flight == 0 and limit.limit == 10
+
+    def test_result_returned_while_connected(self, fake_openai):
+        """Test that the result of a call finishing while the client is still connected is returned."""
+        service = make_service(fake_openai)
+        response = asyncio.run(cancel_on_disconnect(make_request(), service.complete_text(text="Hello", max_tokens=3)))
+        assert len(response.response.split()) == 3
+
+
+class TestEmbeddingsAgainstFakeServer:
+    def test_repeated_inputs_embedded_once(self, fake_openai):
+        """Test that duplicate inputs are sent upstream once and returned at every position."""
+        service = make_service(fake_openai)
+        stats = fake_openai.app.state.stats
+        before = stats["embedded_inputs"]
+        vectors, prompt_tokens, cached = asyncio.run(service.embed_texts(["red apple", "green pear", "red apple"], dimensions=32))
+        assert vectors.shape == (3, 32) and vectors.dtype == np.float32
+        assert np.array_equal(vectors[0], vectors[2])
+        assert stats["embedded_inputs"] - before == 2
+        assert prompt_tokens > 0 and cached == 0
+
+    def test_second_call_served_from_cache(self, fake_openai):
+        """Test that texts embedded before are not sent again, and that only the new ones are."""
+        service = make_service(fake_openai)
+        stats = fake_openai.app.state.stats
+
+        async def run():
+            first, _, _ = await service.embed_texts(["red apple", "green pear"])
+            before = stats["embedded_inputs"]
+            second, _, cached = await service.embed_texts(["green pear", "blue plum", "red apple"])
+            return first, second, cached, stats["embedded_inputs"] - before
+
+        first, second, cached, sent = asyncio.run(run())
+        assert (cached, sent) == (2, 1)
+        assert np.array_equal(second[0], first[1]) and np.array_equal(second[2], first[0])
+
+    def test_misses_sent_in_maximal_batches(self, fake_openai):
+        """Test that misses go upstream in as few requests as the per-request token limit allows."""
+        service = make_service(fake_openai)
+        # About 125k tokens each against the 300k limit: two fit in a request.
+        texts = [f"{i} " + "word " * 100_000 for i in range(5)]
+        vectors, _, _ = asyncio.run(service.embed_texts(texts, dimensions=8))
+        assert len(vectors) == 5
+        assert fake_openai.app.state.stats["requests_by_model"]["text-embedding-3-small"] == 3
+
+    def test_user_keys_bypass_cache(self, fake_openai):
+        """Test that calls with a user's own key neither use nor fill the shared cache."""
+        service = make_service(fake_openai)
+
+        async def run():
+            await service.embed_texts(["red apple"], api_key="sk-byok-user-1")
+            return await service.embed_texts(["red apple"])
+
+        _, _, cached = asyncio.run(run())
+        assert cached == 0
+        assert fake_openai.app.state.stats["requests_by_model"]["text-embedding-3-small"] == 2
+
+
+class TestCollectionsAgainstFakeServer:
+    def test_add_and_search_by_text(self, fake_openai, tmp_path):
+        """Test that documents are embedded once, stored, and found by a query text."""
+        service = CollectionService(VectorStore(str(tmp_path)), make_service(fake_openai))
+        documents = [
+            {"text": "the cat sat on the mat", "metadata": {"kind": "pets"}},
+            {"id": "news", "text": "stock markets fell sharply", "metadata": {"kind": "news"}},
+        ]
+
+        async def run():
+            added = await service.add_documents("1", "docs", documents, dimensions=64)
+            found = await service.search("1", "docs", text="stock markets", k=1)
+            filtered = await service.search("1", "docs", text="stock markets", filter={"kind": "pets"})
+            return added, found, filtered
+
+        added, found, filtered = asyncio.run(run())
+        assert added["count"] == 2 and added["ids"][1] == "news"
+        assert found["results"][0]["id"] == "news"
+        assert [result["text"] for result in filtered["results"]] == ["the cat sat on the mat"]
+
+    def test_unknown_collection_and_mismatched_model(self, fake_openai, tmp_path):
+        """Test that searching a missing collection is a 404 and adding with another size a 400."""
+        service = CollectionService(VectorStore(str(tmp_path)), make_service(fake_openai))
+
+        async def run():
+            with pytest.raises(HTTPException) as missing:
+                await service.search("1", "docs", text="anything")
+            await service.add_documents("1", "docs", [{"text": "hello"}], dimensions=64)
+            with pytest.raises(HTTPException) as mismatched:
+                await service.add_documents("1", "docs", [{"text": "hello"}], dimensions=32)
+            return missing.value, mismatched.value
+
+        missing, mismatched = asyncio.run(run())
+        assert (missing.status_code, mismatched.status_code) == (404, 400)
+
+    def test_concurrently_created_collection_of_another_size(self, fake_openai, tmp_path):
+        """Test that adding to a collection created meanwhile with another embedding size is a 400, not a 500."""
+        service = CollectionService(VectorStore(str(tmp_path)), make_service(fake_openai))
+
+        async def run():
+            return await asyncio.gather(
+                service.add_documents("1", "docs", [{"text": "hello"}], dimensions=64),
+                service.add_documents("1", "docs", [{"text": "world"}], dimensions=32),
+                return_exceptions=True,
+            )
+
+        outcomes = asyncio.run(run())
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        assert len(errors) == 1 and isinstance(errors[0], HTTPException) and errors[0].status_code == 400
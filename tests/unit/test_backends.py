@@ -0,0 +1,150 @@
+import random
+import time
+
+import pytest
+
+from openai_api_client.dependencies.backends import (
+    OPENAI_BACKEND_EJECT_SECONDS,
+    Backend,
+    BackendPool,
+    parse_backends,
+)
+from openai_api_client.dependencies.credentials import Credential, CredentialPool
+
+
+def make_backend(name):
+    return Backend(name, f"http://{name}.example/v1", CredentialPool([Credential(f"sk-{name}-key-0001")]))
+
+
+def serve(pool, backend, seconds, failed=False, times=1):
+    for _ in range(times):
+        backend.in_flight += 1
+        pool.release(backend, seconds, failed)
+
+# Test cases for latency and error tracking
+class TestBackend:
+    def test_first_observation_sets_latency(self):
+        """Test that the first call's latency is taken as is and later ones are averaged in."""
+        backend = make_backend("a")
+        backend.observe(0.5, False, time.monotonic())
+        assert backend.latency == 0.5
+        backend.observe(1.5, False, time.monotonic())
+        assert 0.5 < backend.latency < 1.5
+
+    def test_unobserved_backend_is_free(self):
+        """Test that a backend without observations is tried before measured ones."""
+        assert make_backend("a").cost(time.monotonic()) == 0.0
+
+    def test_cost_grows_with_load_and_errors(self):
+        """Test that calls in flight and errors make a backend more expensive."""
+        now = time.monotonic()
+        backend = make_backend("a")
+        backend.observe(0.1, False, now)
+        idle = backend.cost(now)
+        backend.in_flight = 3
+        assert backend.cost(now) == pytest.approx(4 * idle)
+        backend.in_flight = 0
+        backend.observe(0.1, True, now)
+        assert backend.cost(now) > idle
+
+    def test_latency_fades_while_unused(self):
+        """Test that a backend that was slow once is tried again after a while."""
+        now = time.monotonic()
+        backend = make_backend("a")
+        backend.observe(1.0, False, now)
+        assert backend.cost(now + 60) < backend.cost(now) / 100
+
+# Test cases for power-of-two-choices routing and outlier ejection
+class TestBackendPool:
+    def test_prefers_faster_backend(self):
+        """Test that most calls go to the backend with lower latency."""
+        fast, slow = make_backend("fast"), make_backend("slow")
+        pool = BackendPool([fast, slow], rng=random.Random(0))
+        serve(pool, fast, 0.05)
+        serve(pool, slow, 0.5)
+        chosen = []
+        for _ in range(20):
+            backend = pool.acquire()
+            chosen.append(backend)
+            pool.release(backend, 0.05 if backend is fast else 0.5)
+        assert chosen.count(fast) == 20
+
+    def test_load_spreads_when_fast_backend_queues(self):
+        """Test that calls in flight push new calls to the slower backend."""
+        fast, slow = make_backend("fast"), make_backend("slow")
+        pool = BackendPool([fast, slow], rng=random.Random(0))
+        serve(pool, fast, 0.1)
+        serve(pool, slow, 0.3)
+        chosen = [pool.acquire() for _ in range(8)]
+        assert chosen.count(fast) > chosen.count(slow) > 0
+
+    def test_failing_backend_is_ejected(self):
+        """Test that a backend whose error rate passes the threshold leaves rotation."""
+        good, bad = make_backend("good"), make_backend("bad")
+        pool = BackendPool([good, bad], rng=random.Random(0))
+        serve(pool, bad, 0.01, failed=True, times=4)
+        assert bad.ejected_until > time.monotonic() + OPENAI_BACKEND_EJECT_SECONDS / 2
+        assert all(pool.acquire() is good for _ in range(10))
+
+    def test_ejection_backs_off(self):
+        """Test that a backend failing again right after it returns is ejected for longer."""
+        good, bad = make_backend("good"), make_backend("bad")
+        pool = BackendPool([good, bad])
+        serve(pool, bad, 0.01, failed=True, times=4)
+        first = bad.ejected_until - time.monotonic()
+        bad.ejected_until = 0.0
+        serve(pool, bad, 0.01, failed=True)
+        assert bad.ejected_until - time.monotonic() > 1.5 * first
+
+    def test_success_readmits(self):
+        """Test that a returning backend that succeeds stays in rotation."""
+        good, bad = make_backend("good"), make_backend("bad")
+        pool = BackendPool([good, bad])
+        serve(pool, bad, 0.01, failed=True, times=4)
+        bad.ejected_until = 0.0
+        serve(pool, bad, 0.01, times=2)
+        serve(pool, bad, 0.01, failed=True)
+        assert bad.ejected_until == 0.0
+        assert bad.consecutive_ejections == 0
+
+    def test_last_backend_is_not_ejected(self):
+        """Test that the only backend still available keeps serving."""
+        only = make_backend("only")
+        pool = BackendPool([only])
+        serve(pool, only, 0.01, failed=True, times=10)
+        assert only.ejected_until == 0.0
+        assert pool.acquire() is only
+
+    def test_excluded_backend_avoided(self):
+        """Test that a backend that already failed a call is skipped when retrying it."""
+        first, second = make_backend("first"), make_backend("second")
+        pool = BackendPool([first, second], rng=random.Random(0))
+        assert all(pool.acquire(exclude=[first]) is second for _ in range(10))
+        assert pool.acquire(exclude=[first, second]) in (first, second)
+
+    def test_rate_limited_backend_avoided(self):
+        """Test that a backend whose keys are all ejected is skipped while others have keys."""
+        limited, open_ = make_backend("limited"), make_backend("open")
+        limited.pool.credentials[0].ejected_until = time.monotonic() + 30
+        pool = BackendPool([limited, open_], rng=random.Random(0))
+        assert all(pool.acquire() is open_ for _ in range(10))
+
+
+class TestParseBackends:
+    def test_backends_with_shared_and_own_keys(self, monkeypatch):
+        """Test that a backend uses OPENAI_BACKEND_<NAME>_API_KEYS when set, else the shared keys."""
+        monkeypatch.setenv("OPENAI_BACKEND_SELF_HOSTED_API_KEYS", "sk-local")
+        backends = parse_backends(
+            "primary=https://api.openai.com/v1, self-hosted=http://llm:8000/v1",
+            lambda: [Credential("sk-shared")],
+        )
+        assert [(b.name, b.base_url) for b in backends] == [
+            ("primary", "https://api.openai.com/v1"),
+            ("self-hosted", "http://llm:8000/v1"),
+        ]
+        assert [[c.api_key for c in b.pool.credentials] for b in backends] == [["sk-shared"], ["sk-local"]]
+
+    def test_invalid_entry(self):
+        """Test that an entry without a base URL is rejected."""
+        with pytest.raises(ValueError):
+            parse_backends("primary", lambda: [Credential("sk-shared")])
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from openai_api_client.dependencies import budget
+from openai_api_client.dependencies.budget import MINUTE, REQUESTS, TOKENS, SlidingWindow, UserBudgets
+
+
+def make_budgets(clock, session_factory=None, shard=None, **limits):
+    return UserBudgets(limits=limits, session_factory=session_factory, sync_interval=0.01, shards=4, shard=shard, clock=clock)
+
+
+# Test cases for the sliding window counter
+class TestSlidingWindow:
+    def test_previous_window_weighted_by_overlap(self):
+        """Test that the previous window counts for the share of it the sliding window still covers."""
+        window = SlidingWindow(60)
+        window.roll(600)
+        window.current[REQUESTS] = 10
+        assert window.count(615, REQUESTS) == 10
+        # A quarter into the next window, three quarters of the previous one still count.
+        assert window.count(675, REQUESTS) == pytest.approx(7.5)
+        assert window.count(795, REQUESTS) == 0
+
+    def test_retry_after_when_count_drops(self):
+        """Test that retry_after is when the weighted count falls to what is allowed."""
+        window = SlidingWindow(60)
+        window.roll(600)
+        window.current[TOKENS] = 100
+        # Still in the window: wait for it to end, then for half of it to slide out.
+        assert window.retry_after(630, TOKENS, 50) == pytest.approx(30 + 30)
+        # In the next window, 100 * (1 - t / 60) <= 50 at t = 30.
+        assert window.retry_after(670, TOKENS, 50) == pytest.approx(20)
+
+
+# Test cases for per-user budgets
+class TestUserBudgets:
+    def test_request_budget_enforced_per_user(self, clock):
+        """Test that a user over their request budget gets a 429 with Retry-After, without affecting others."""
+        budgets = make_budgets(clock, requests_per_minute=3)
+        for _ in range(3):
+            budgets.admit(1)
+        with pytest.raises(HTTPException) as e:
+            budgets.admit(1)
+        assert e.value.status_code == 429
+        assert int(e.value.headers["Retry-After"]) >= 1
+        budgets.admit(2)
+        # Once the sliding window has moved on far enough, the user is admitted again.
+        clock.now += int(e.value.headers["Retry-After"]) + 60
+        budgets.admit(1)
+
+    def test_token_budget_counts_charged_tokens(self, clock):
+        """Test that charged tokens use up the token budget, refusing requests until it has slid by."""
+        budgets = make_budgets(clock, tokens_per_minute=1000)
+        budgets.admit(1)
+        budgets.charge(1, 999)
+        budgets.admit(1)
+        budgets.charge(1, 50)
+        with pytest.raises(HTTPException) as e:
+            budgets.admit(1)
+        assert "tokens per minute" in e.value.detail
+        clock.now += 120
+        budgets.admit(1)
+
+    def test_disabled_without_limits(self, clock):
+        """Test that without budgets nothing is counted or kept."""
+        budgets = make_budgets(clock)
+        for _ in range(100):
+            budgets.admit(1)
+        budgets.charge(1, 10**9)
+        assert not budgets.enabled and not budgets.windows
+
+    def test_sync_shares_counts_across_workers(self, session_factory, clock):
+        """Test that workers see each other's counts after syncing, each writing its own shard."""
+        first = make_budgets(clock, session_factory, requests_per_minute=5, shard=0)
+        second = make_budgets(clock, session_factory, requests_per_minute=5, shard=1)
+        for _ in range(3):
+            first.admit(7)
+        second.admit(7)
+        second.admit(7)
+
+        async def run():
+            await first.sync()
+            await second.sync()
+            await first.sync()
+
+        asyncio.run(run())
+        for workers in (first, second):
+            with pytest.raises(HTTPException):
+                workers.admit(7)
+        db = session_factory()
+        try:
+            rows = db.execute(select(budget.BudgetCounter.shard, budget.BudgetCounter.requests).where(budget.BudgetCounter.window == MINUTE)).all()
+        finally:
+            db.close()
+        assert sorted(rows) == [(0, 3), (1, 2)]
+
+    def test_failed_sync_keeps_counts(self, session_factory, clock):
+        """Test that counts a sync could not write are written by the next one."""
+        budgets = make_budgets(clock, session_factory, requests_per_minute=10, shard=0)
+        budgets.admit(1)
+        working = budgets.session_factory
+
+        def broken():
+            raise RuntimeError("database down")
+
+        budgets.session_factory = broken
+        asyncio.run(budgets.sync())
+        budgets.admit(1)
+        budgets.session_factory = working
+        asyncio.run(budgets.sync())
+        db = session_factory()
+        try:
+            total = db.scalar(select(budget.BudgetCounter.requests).where(budget.BudgetCounter.window == MINUTE))
+        finally:
+            db.close()
+        assert total == 2 and budgets.windows[1][MINUTE].current[REQUESTS] == 2
+
+    def test_idle_users_forgotten(self, session_factory, clock):
+        """Test that a sync drops users with nothing counted in the windows kept."""
+        budgets = make_budgets(clock, session_factory, requests_per_minute=10, shard=0)
+        budgets.admit(1)
+        asyncio.run(budgets.sync())
+        assert 1 in budgets.windows
+        clock.now += 3 * 86400
+        asyncio.run(budgets.sync())
+        assert not budgets.windows
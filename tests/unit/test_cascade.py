@@ -0,0 +1,55 @@
+import pytest
+
+from openai_api_client.dependencies.cascade import ACCEPTANCE_CHECKS, Candidate, Cascade, acceptance_check
+
+# Test cases for acceptance checks
+class TestAcceptanceChecks:
+    def test_min_length(self):
+        """Test that short or blank answers escalate."""
+        cascade = Cascade.from_spec("fast", "min_length=5")
+        assert cascade.evaluate(Candidate("  hello world ")) is None
+        assert cascade.evaluate(Candidate("  hi   ")) == "min_length"
+
+    def test_min_logprob(self):
+        """Test the mean token logprob threshold and that answers without logprobs escalate."""
+        cascade = Cascade.from_spec("fast", "min_logprob=-1.0")
+        assert cascade.logprobs
+        assert cascade.evaluate(Candidate("sure", token_logprobs=[-0.1, -0.5, None])) is None
+        assert cascade.evaluate(Candidate("maybe", token_logprobs=[-0.5, -2.5])) == "min_logprob"
+        assert cascade.evaluate(Candidate("unknown")) == "min_logprob"
+
+    def test_reject_and_require(self):
+        """Test regular expression checks."""
+        cascade = Cascade.from_spec("fast", "reject=(?i)i don't know;require=\\d")
+        assert cascade.evaluate(Candidate("It is 42.")) is None
+        assert cascade.evaluate(Candidate("I don't know, maybe 42")) == "reject"
+        assert cascade.evaluate(Candidate("It is forty-two.")) == "require"
+
+    def test_complete(self):
+        """Test that answers cut off by max_tokens escalate."""
+        cascade = Cascade.from_spec("fast", "complete")
+        assert cascade.evaluate(Candidate("done", finish_reason="stop")) is None
+        assert cascade.evaluate(Candidate("cut", finish_reason="length")) == "complete"
+
+    def test_first_failing_check_is_reported(self):
+        """Test that checks run in the configured order."""
+        cascade = Cascade.from_spec("fast", "min_length=50; complete")
+        assert cascade.evaluate(Candidate("short", finish_reason="length")) == "min_length"
+
+    def test_unknown_check(self):
+        """Test that a misspelled check fails at startup rather than accepting everything."""
+        with pytest.raises(ValueError):
+            Cascade.from_spec("fast", "min_lenght=5")
+
+    def test_custom_check(self):
+        """Test that registered checks can be used in the spec."""
+
+        @acceptance_check("no_apology")
+        def no_apology(value):
+            return lambda candidate: "sorry" not in candidate.text.lower()
+
+        try:
+            cascade = Cascade.from_spec("fast", "no_apology")
+            assert cascade.evaluate(Candidate("Sorry, I can't.")) == "no_apology"
+        finally:
+            del ACCEPTANCE_CHECKS["no_apology"]
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from openai_api_client.dependencies.cassette import (
+    Cassette,
+    CassetteMissError,
+    CassetteTransport,
+    request_key,
+)
+
+
+class ChunkedStream(httpx.AsyncByteStream):
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def upstream(calls):
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, headers={"x-ratelimit-remaining-requests": "99"}, stream=ChunkedStream([b"data: a\n\n", b"data: b\n\n"]))
+    return httpx.MockTransport(handler)
+
+
+async def post(transport, body, path="/v1/completions"):
+    async with httpx.AsyncClient(transport=transport, base_url="http://upstream.test") as client:
+        response = await client.post(path, content=json.dumps(body))
+        return response, await response.aread()
+
+# Test cases for request normalization
+class TestRequestKey:
+    def test_key_ignores_json_key_order(self):
+        """Test that equal bodies with different key order hash the same."""
+        assert request_key("POST", "/v1/completions", b"", b'{"a": 1, "b": 2}') == request_key("POST", "/v1/completions", b"", b'{"b":2,"a":1}')
+
+    def test_key_ignores_volatile_fields(self):
+        """Test that the end-user identifier does not affect the key."""
+        assert request_key("POST", "/v1/completions", b"", b'{"a": 1, "user": "x"}') == request_key("POST", "/v1/completions", b"", b'{"a": 1}')
+
+    def test_key_depends_on_body_and_path(self):
+        """Test that different requests hash differently."""
+        key = request_key("POST", "/v1/completions", b"", b'{"a": 1}')
+        assert key != request_key("POST", "/v1/completions", b"", b'{"a": 2}')
+        assert key != request_key("POST", "/v1/embeddings", b"", b'{"a": 1}')
+
+# Test cases for recording and replaying exchanges
+class TestCassetteTransport:
+    def test_record_then_replay(self, tmp_path):
+        """Test that a recorded streamed exchange replays byte for byte without upstream."""
+        calls = []
+        path = str(tmp_path / "openai.jsonl.gz")
+        recorder = CassetteTransport(Cassette(path), mode="record", wrapped=upstream(calls))
+        recorded, recorded_body = asyncio.run(post(recorder, {"prompt": "hi"}))
+
+        replayer = CassetteTransport(Cassette(path), mode="replay", wrapped=upstream(calls))
+        replayed, replayed_body = asyncio.run(post(replayer, {"prompt": "hi"}))
+        assert len(calls) == 1
+        assert replayed.status_code == recorded.status_code
+        assert replayed.headers["x-ratelimit-remaining-requests"] == "99"
+        assert replayed_body == recorded_body == b"data: a\n\ndata: b\n\n"
+
+    def test_replay_miss_raises(self, tmp_path):
+        """Test that replay mode never reaches upstream on a miss."""
+        calls = []
+        transport = CassetteTransport(Cassette(str(tmp_path)), mode="replay", wrapped=upstream(calls))
+        with pytest.raises(CassetteMissError):
+            asyncio.run(post(transport, {"prompt": "unknown"}))
+        assert calls == []
+
+    def test_replay_or_record_records_misses_once(self, tmp_path):
+        """Test that a miss is recorded and then served from the cassette."""
+        calls = []
+        transport = CassetteTransport(Cassette(str(tmp_path)), mode="replay_or_record", wrapped=upstream(calls))
+        asyncio.run(post(transport, {"prompt": "hi"}))
+        asyncio.run(post(transport, {"prompt": "hi"}))
+        assert len(calls) == 1
+        assert len(Cassette(str(tmp_path))) == 1
+
+    def test_repeated_requests_replay_in_order(self, tmp_path):
+        """Test that several recordings of one request are served in recording order."""
+        path = str(tmp_path / "openai.jsonl.gz")
+        responses = iter([b"first", b"second"])
+        recorder = CassetteTransport(
+            Cassette(path), mode="record", wrapped=httpx.MockTransport(lambda request: httpx.Response(200, content=next(responses)))
+        )
+        asyncio.run(post(recorder, {"prompt": "hi"}))
+        asyncio.run(post(recorder, {"prompt": "hi"}))
+        replayer = CassetteTransport(Cassette(path), mode="replay")
+        bodies = [asyncio.run(post(replayer, {"prompt": "hi"}))[1] for _ in range(3)]
+        assert bodies == [b"first", b"second", b"first"]
@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+from fastapi import WebSocketDisconnect
+
+from openai_api_client.dependencies.limiter import AdaptiveLimit
+from openai_api_client.dependencies.scheduler import FairScheduler
+from openai_api_client.api.schemas.openai import ChatStreamGenerate
+from openai_api_client.services.chat_stream import ChatStreamSession
+
+
+class FakeWebSocket:
+    """Hands out queued frames to the session and keeps the ones it sends; None disconnects."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+
+    async def receive_text(self):
+        text = await self.incoming.get()
+        if text is None:
+            raise WebSocketDisconnect(1000)
+        return text
+
+    async def send_text(self, text):
+        self.sent.append(orjson.loads(text))
+
+    def push(self, frame):
+        self.incoming.put_nowait(frame if frame is None or isinstance(frame, str) else orjson.dumps(frame).decode())
+
+
+class FakeOpenAI:
+    """Streams ``tokens`` pieces of text, one every ``delay`` seconds, and notes streams closed early."""
+
+    def __init__(self, tokens=3, delay=0.01):
+        self.tokens = tokens
+        self.delay = delay
+        self.closed = []
+
+    async def stream_chat(self, messages, model, temperature, max_tokens, api_key=None):
+        sent = 0
+        try:
+            for sent in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                yield f"{messages[-1]['content']}-{sent} "
+            sent = self.tokens
+        finally:
+            if sent < self.tokens:
+                self.closed.append(messages[-1]["content"])
+
+
+def make_session(openai=None, **kwargs):
+    scheduler = FairScheduler(limit=AdaptiveLimit(initial=8, minimum=1, adaptive=False), priorities={"interactive": 4, "batch": 1}, timeouts={})
+    user = SimpleNamespace(id=1, api_key=None, priority=None)
+    return ChatStreamSession(FakeWebSocket(), user, openai=openai or FakeOpenAI(), scheduler=scheduler, **kwargs)
+
+
+def generate(generation_id, content="hi", **fields):
+    return dict({"type": "generate", "id": generation_id, "messages": [{"role": "user", "content": content}]}, **fields)
+
+
+async def serve(session, frames, wait=0.2):
+    runner = asyncio.create_task(session.run())
+    for frame in frames:
+        session.websocket.push(frame)
+        await asyncio.sleep(0)
+    await asyncio.sleep(wait)
+    session.websocket.push(None)
+    await runner
+    return session.websocket.sent
+
+# Test cases for chat WebSocket sessions
+class TestChatStreamSession:
+    def test_generations_multiplexed(self):
+        """Test that two generations on one connection stream side by side, each ending with done."""
+        session = make_session()
+        sent = asyncio.run(serve(session, [generate("a", "x"), generate("b", "y")]))
+        texts = {gid: "".join(f["text"] for f in sent if f["type"] == "token" and f["id"] == gid) for gid in "ab"}
+        assert texts == {"a": "x-0 x-1 x-2 ", "b": "y-0 y-1 y-2 "}
+        ids = [frame["id"] for frame in sent if frame["type"] == "token"]
+        assert ids[:2] in (["a", "b"], ["b", "a"])
+        done = sorted((frame["id"], frame["reason"]) for frame in sent if frame["type"] == "done")
+        assert done == [("a", "stop"), ("b", "stop")]
+        assert session.scheduler.in_use == 0
+
+    def test_cancel_mid_stream(self):
+        """Test that a cancelled generation stops streaming, closes its upstream stream and frees its slot."""
+        openai = FakeOpenAI(tokens=50, delay=0.01)
+        session = make_session(openai)
+
+        async def run():
+            runner = asyncio.create_task(session.run())
+            session.websocket.push(generate("slow", "x"))
+            await asyncio.sleep(0.05)
+            session.websocket.push({"type": "cancel", "id": "slow"})
+            await asyncio.sleep(0.1)
+            session.websocket.push(None)
+            await runner
+
+        asyncio.run(run())
+        sent = session.websocket.sent
+        assert sent[-1] == {"type": "done", "id": "slow", "reason": "cancelled"}
+        assert 0 < len([frame for frame in sent if frame["type"] == "token"]) < 50
+        assert openai.closed == ["x"]
+        assert session.scheduler.in_use == 0 and not session.generations
+
+    def test_disconnect_cancels_generations(self):
+        """Test that closing the connection stops every generation still running."""
+        openai = FakeOpenAI(tokens=50, delay=0.01)
+        session = make_session(openai)
+        asyncio.run(serve(session, [generate("a", "x"), generate("b", "y")], wait=0.05))
+        assert sorted(openai.closed) == ["x", "y"]
+        assert session.scheduler.in_use == 0
+
+    def test_stream_closed_when_send_fails(self):
+        """Test that a generation whose client cannot be sent to closes its upstream stream before giving up its slot."""
+        openai = FakeOpenAI(tokens=50, delay=0.001)
+        session = make_session(openai)
+
+        async def broken_send(text):
+            raise ConnectionResetError("gone")
+
+        session.websocket.send_text = broken_send
+
+        async def run():
+            await session.generate(ChatStreamGenerate.model_validate(generate("a", "x")))
+            # Closed by the generation itself, not later by the event loop's async generator finalizer.
+            return list(openai.closed)
+
+        assert asyncio.run(run()) == ["x"]
+        assert session.scheduler.in_use == 0
+
+    def test_bad_frames_get_errors(self):
+        """Test that malformed, invalid, duplicate and excess frames are answered with errors, not a closed socket."""
+        session = make_session(FakeOpenAI(tokens=50), max_generations=1)
+        sent = asyncio.run(
+            serve(
+                session,
+                ["not json", {"type": "ping"}, generate("a", messages=[]), generate("b"), generate("b"), generate("c"), {"type": "cancel", "id": "zzz"}],
+                wait=0.05,
+            )
+        )
+        errors = [(frame["id"], frame["status"]) for frame in sent if frame["type"] == "error"]
+        assert errors == [(None, 400), (None, 400), ("a", 422), ("b", 409), ("c", 429), ("zzz", 404)]
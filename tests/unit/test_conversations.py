@@ -0,0 +1,189 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from openai_api_client.api.schemas.openai import OpenAIResponse
+from openai_api_client.services import conversations
+from openai_api_client.services.conversations import (
+    SUMMARY_INSTRUCTIONS,
+    SUMMARY_PREFIX,
+    ConversationService,
+    message_tokens,
+    pack_text,
+    unpack_text,
+)
+
+ALICE = SimpleNamespace(id=1, api_key="sk-alice")
+BOB = SimpleNamespace(id=2, api_key=None)
+
+
+class FakeOpenAI:
+    """Answers chats without an upstream, noting what each was sent; ``errors`` (``summary_errors`` for summaries) are raised, in order, first."""
+
+    def __init__(self, reply="ok", errors=(), summary_errors=()):
+        self.reply = reply
+        self.errors = list(errors)
+        self.summary_errors = list(summary_errors)
+        self.calls = []
+        self.summaries = []
+
+    async def chat(self, messages, model, temperature, max_tokens, api_key=None):
+        if messages[0]["content"] == SUMMARY_INSTRUCTIONS:
+            self.summaries.append(messages[1]["content"])
+            if self.summary_errors:
+                raise self.summary_errors.pop(0)
+            return OpenAIResponse(response=f"summary {len(self.summaries)}")
+        self.calls.append(messages)
+        if self.errors:
+            raise self.errors.pop(0)
+        return OpenAIResponse(response=self.reply)
+
+
+def make_service(openai=None, **kwargs):
+    return ConversationService(openai=openai or FakeOpenAI(), **kwargs)
+
+
+def turn(service, db, conversation_id, content, user=ALICE, max_tokens=50):
+    return asyncio.run(service.reply(db, user, conversation_id, content, max_tokens=max_tokens))
+
+# Test cases for compact message storage
+class TestMessageStorage:
+    def test_pack_text_round_trip(self):
+        """Test that message text survives compression, and repetitive text shrinks."""
+        text = "hello " * 500
+        assert unpack_text(pack_text(text)) == text
+        assert len(pack_text(text)) < 100
+        assert unpack_text(None) is None and pack_text(None) is None
+
+# Test cases for server-side conversations
+class TestConversationService:
+    def test_turns_send_history_kept_server_side(self, db):
+        """Test that a turn sends the stored history with the new message, and stores both with their token counts."""
+        openai = FakeOpenAI(reply="hi there")
+        service = make_service(openai)
+        conversation_id = service.create(db, 1, "gpt-4o-mini", system="Be brief.")["id"]
+        turn(service, db, conversation_id, "hello")
+        reply = turn(service, db, conversation_id, "how are you?")
+        assert reply["response"] == "hi there"
+        assert reply["context"] == {"messages": 4, "tokens": reply["context"]["tokens"], "trimmed": 0, "summarized": False}
+        assert [message["content"] for message in openai.calls[-1]] == ["Be brief.", "hello", "hi there", "how are you?"]
+
+        conversation = service.get(db, 1, conversation_id)
+        assert [message["role"] for message in conversation["messages"]] == ["user", "assistant"] * 2
+        assert [message["tokens"] for message in conversation["messages"]] == [message_tokens(m["content"]) for m in conversation["messages"]]
+        assert conversation["context_tokens"] == sum(message["tokens"] for message in conversation["messages"])
+        assert conversation["message_count"] == 4
+
+    def test_trim_keeps_window_within_budget(self, db):
+        """Test that old turns leave the window down to the trim target, and the next turns fit without trimming again."""
+        openai = FakeOpenAI(reply="r" * 40)
+        service = make_service(openai, context_tokens=250, trim_mode="trim", trim_target=0.5)
+        conversation_id = service.create(db, 1, "gpt-4")["id"]
+        budget = service.budget("gpt-4", 50)
+        replies = [turn(service, db, conversation_id, f"message {i} " + "x" * 40) for i in range(8)]
+        trimming = [i for i, reply in enumerate(replies) if reply["context"]["trimmed"]]
+        assert trimming and trimming[0] > 0
+        assert len(trimming) < len(replies) - trimming[0]
+        assert all(reply["context"]["tokens"] <= budget for reply in replies)
+        # The oldest messages are no longer sent, the latest still are.
+        sent = [message["content"] for message in openai.calls[-1]]
+        assert not any(content.startswith("message 0 ") for content in sent)
+        assert sent[-1].startswith("message 7 ")
+        assert not openai.summaries
+        # Only the window was read back; the history itself is all still there.
+        assert service.get(db, 1, conversation_id)["message_count"] == 16
+
+    def test_trimmed_turns_summarized(self, db):
+        """Test that trimmed turns are folded into a running summary sent in their place."""
+        openai = FakeOpenAI(reply="r" * 40)
+        service = make_service(openai, context_tokens=200, trim_target=0.5, summary_tokens=20)
+        conversation_id = service.create(db, 1, "gpt-4")["id"]
+        replies = [turn(service, db, conversation_id, f"message {i} " + "x" * 40) for i in range(12)]
+        summarized = [reply for reply in replies if reply["context"]["summarized"]]
+        assert len(summarized) >= 2 and all(reply["context"]["trimmed"] for reply in summarized)
+        assert "message 0 " in openai.summaries[0]
+        # Later trims build on the summary so far.
+        assert openai.summaries[1].startswith(SUMMARY_PREFIX + "summary 1")
+        sent = openai.calls[-1]
+        assert sent[0] == {"role": "system", "content": SUMMARY_PREFIX + f"summary {len(openai.summaries)}"}
+        assert service.get(db, 1, conversation_id)["summary"] == f"summary {len(openai.summaries)}"
+
+    def test_failed_summary_falls_back_to_trim(self, db):
+        """Test that a turn is still answered when its summary cannot be written."""
+        openai = FakeOpenAI(reply="r" * 40, summary_errors=[HTTPException(status_code=503, detail="down")])
+        service = make_service(openai, context_tokens=200, trim_target=0.5, summary_tokens=20)
+        conversation_id = service.create(db, 1, "gpt-4")["id"]
+        replies = [turn(service, db, conversation_id, "x" * 50) for _ in range(8)]
+        reply = next(reply for reply in replies if reply["context"]["trimmed"])
+        assert reply["response"] == "r" * 40 and not reply["context"]["summarized"]
+        assert openai.summaries
+
+    def test_failed_turn_stores_nothing(self, db):
+        """Test that an upstream error leaves the conversation as it was."""
+        service = make_service(FakeOpenAI(errors=[HTTPException(status_code=429, detail="rate limited")]))
+        conversation_id = service.create(db, 1, "gpt-4o")["id"]
+        with pytest.raises(HTTPException) as exc_info:
+            turn(service, db, conversation_id, "hello")
+        assert exc_info.value.status_code == 429
+        conversation = service.get(db, 1, conversation_id)
+        assert conversation["message_count"] == 0 and conversation["messages"] == []
+
+    def test_concurrent_turn_conflicts(self, db):
+        """Test that a turn finishing after another turn of the same conversation was stored gets a 409."""
+        service = make_service()
+        conversation_id = service.create(db, 1, "gpt-4o")["id"]
+
+        class RacingOpenAI(FakeOpenAI):
+            async def chat(self, messages, model, temperature, max_tokens, api_key=None):
+                db.query(conversations.Conversation).filter_by(id=conversation_id).update({"message_count": 2})
+                db.commit()
+                return await super().chat(messages, model, temperature, max_tokens, api_key)
+
+        service.openai = RacingOpenAI()
+        with pytest.raises(HTTPException) as exc_info:
+            turn(service, db, conversation_id, "hello")
+        assert exc_info.value.status_code == 409
+        assert db.query(conversations.ConversationMessage).count() == 0
+
+    def test_no_transaction_held_during_upstream_calls(self, db):
+        """Test that the turn's database transaction has ended, giving back its connection, while the upstream answers."""
+        service = make_service()
+        conversation_id = service.create(db, 1, "gpt-4o-mini")["id"]
+        held = []
+
+        class WatchingOpenAI(FakeOpenAI):
+            async def chat(self, messages, model, temperature, max_tokens, api_key=None):
+                held.append(db.in_transaction())
+                return await super().chat(messages, model, temperature, max_tokens, api_key)
+
+        service.openai = WatchingOpenAI()
+        for index in range(3):
+            turn(service, db, conversation_id, f"message {index}")
+        assert held == [False, False, False]
+        assert service.get(db, 1, conversation_id)["message_count"] == 6
+
+    def test_message_too_long_rejected(self, db):
+        """Test that a message that cannot fit the window even on its own gets a 400 without an upstream call."""
+        openai = FakeOpenAI()
+        service = make_service(openai, context_tokens=200)
+        conversation_id = service.create(db, 1, "gpt-4")["id"]
+        with pytest.raises(HTTPException) as exc_info:
+            turn(service, db, conversation_id, "x" * 1000)
+        assert exc_info.value.status_code == 400
+        assert not openai.calls
+
+    def test_conversations_private_to_their_user(self, db):
+        """Test that another user's conversation looks like a missing one, and deleting removes its messages."""
+        service = make_service()
+        conversation_id = service.create(db, 1, "gpt-4o")["id"]
+        turn(service, db, conversation_id, "hello")
+        for call in (lambda: service.get(db, 2, conversation_id), lambda: turn(service, db, conversation_id, "hi", user=BOB)):
+            with pytest.raises(HTTPException) as exc_info:
+                call()
+            assert exc_info.value.status_code == 404
+        service.delete(db, 1, conversation_id)
+        assert db.query(conversations.ConversationMessage).count() == 0
+        with pytest.raises(HTTPException):
+            service.get(db, 1, conversation_id)
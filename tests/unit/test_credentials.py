@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+from openai_api_client.dependencies.credentials import (
+    Credential,
+    CredentialCache,
+    CredentialPool,
+    credential_id,
+    parse_credentials,
+    parse_reset,
+)
+
+
+def rate_limit_headers(remaining_requests, limit_requests=100, remaining_tokens=10000, limit_tokens=10000, reset="60s"):
+    return {
+        "x-ratelimit-limit-requests": str(limit_requests),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+        "x-ratelimit-reset-requests": reset,
+        "x-ratelimit-limit-tokens": str(limit_tokens),
+        "x-ratelimit-remaining-tokens": str(remaining_tokens),
+        "x-ratelimit-reset-tokens": reset,
+    }
+
+# Test cases for rate-limit header parsing
+class TestParsing:
+    @pytest.mark.parametrize("value,seconds", [("20ms", 0.02), ("1s", 1.0), ("6m0s", 360.0), ("1h2m3.5s", 3723.5), ("0.250s", 0.25)])
+    def test_parse_reset(self, value, seconds):
+        """Test the duration formats used by x-ratelimit-reset-* headers."""
+        assert parse_reset(value) == pytest.approx(seconds)
+
+    @pytest.mark.parametrize("value", [None, "", "soon", "5"])
+    def test_parse_reset_invalid(self, value):
+        """Test that missing or malformed durations are ignored."""
+        assert parse_reset(value) is None
+
+    def test_parse_credentials(self):
+        """Test keys with and without an organization."""
+        credentials = parse_credentials("sk-one:org-a, sk-two ,", organization="org-default")
+        assert [(c.api_key, c.organization) for c in credentials] == [("sk-one", "org-a"), ("sk-two", "org-default")]
+
+# Test cases for headroom-based routing
+class TestCredentialPool:
+    def test_unknown_keys_alternate(self):
+        """Test that keys without reported limits share load by calls in flight."""
+        pool = CredentialPool([Credential("sk-aaaaaaaa1"), Credential("sk-aaaaaaaa2")])
+        first = pool.acquire()
+        second = pool.acquire()
+        assert first is not second
+
+    def test_routes_to_most_headroom(self):
+        """Test that the key with the larger remaining budget is chosen."""
+        low, high = Credential("sk-lowlowlow"), Credential("sk-highhigh")
+        pool = CredentialPool([low, high])
+        for credential, remaining in ((low, 5), (high, 80)):
+            pool.acquire()
+            pool.release(credential, rate_limit_headers(remaining))
+        assert pool.acquire() is high
+
+    def test_token_budget_counts(self):
+        """Test that a key short on tokens loses even with requests to spare."""
+        tokens_short, balanced = Credential("sk-tokshort"), Credential("sk-balanced")
+        tokens_short.observe(rate_limit_headers(99, remaining_tokens=100), time.monotonic())
+        balanced.observe(rate_limit_headers(50, remaining_tokens=5000), time.monotonic())
+        assert CredentialPool([tokens_short, balanced]).acquire(tokens=50) is balanced
+
+    def test_budget_refills_after_reset(self):
+        """Test that a depleted budget is treated as full once its reset time has passed."""
+        credential = Credential("sk-refilled")
+        credential.observe(rate_limit_headers(0, reset="10ms"), time.monotonic())
+        time.sleep(0.02)
+        assert credential.headroom(time.monotonic()) == 1.0
+
+    def test_rate_limited_key_is_ejected(self):
+        """Test that a 429 takes the key out of rotation for its Retry-After."""
+        limited, other = Credential("sk-limited1"), Credential("sk-otherkey")
+        pool = CredentialPool([limited, other])
+        pool.acquire()
+        pool.release(limited, {"retry-after-ms": "5000"}, rate_limited=True)
+        assert limited.ejected_until - time.monotonic() == pytest.approx(5.0, abs=0.1)
+        assert all(pool.acquire() is other for _ in range(3))
+
+    def test_unauthorized_key_is_ejected(self):
+        """Test that a rejected key is ejected for the auth cooldown."""
+        revoked, other = Credential("sk-revoked1"), Credential("sk-otherkey")
+        pool = CredentialPool([revoked, other])
+        pool.acquire()
+        pool.release(revoked, unauthorized=True)
+        assert revoked.ejected_until > time.monotonic() + 60
+        assert pool.acquire() is other
+
+    def test_all_ejected_uses_soonest(self):
+        """Test that with every key ejected the one returning soonest is used."""
+        soon, late = Credential("sk-soonsoon"), Credential("sk-latelate")
+        soon.ejected_until = time.monotonic() + 1
+        late.ejected_until = time.monotonic() + 100
+        assert CredentialPool([late, soon]).acquire() is soon
+
+    def test_release_restores_in_flight(self):
+        """Test that release undoes the in-flight and token reservations of acquire."""
+        credential = Credential("sk-inflight")
+        pool = CredentialPool([credential])
+        pool.acquire(tokens=40)
+        assert (credential.in_flight, credential.reserved_tokens) == (1, 40)
+        pool.release(credential, tokens=40)
+        assert (credential.in_flight, credential.reserved_tokens) == (0, 0)
+
+# Test cases for the per-user key cache
+class TestCredentialCache:
+    def test_same_key_reuses_pool(self):
+        """Test that a key maps to one pool and different keys to different pools."""
+        cache = CredentialCache()
+        assert cache.get("sk-user-one") is cache.get("sk-user-one")
+        assert cache.get("sk-user-one") is not cache.get("sk-user-two")
+
+    def test_keyed_by_hash(self):
+        """Test that the raw key is not used as the cache key."""
+        cache = CredentialCache()
+        cache.get("sk-user-secret")
+        assert list(cache._entries) == [credential_id("sk-user-secret")]
+
+    def test_lru_eviction(self):
+        """Test that the least recently used key is evicted beyond max_size."""
+        evicted = []
+        cache = CredentialCache(max_size=2, on_evict=evicted.append)
+        cache.get("sk-user-one")
+        two = cache.get("sk-user-two")
+        cache.get("sk-user-one")
+        cache.get("sk-user-three")
+        assert evicted == [two]
+        assert len(cache) == 2
+
+    def test_idle_eviction(self):
+        """Test that an unused key is evicted after idle_seconds."""
+        evicted = []
+        cache = CredentialCache(idle_seconds=0.01, on_evict=evicted.append)
+        idle = cache.get("sk-user-idle")
+        time.sleep(0.02)
+        cache.get("sk-user-busy")
+        assert evicted == [idle]
+
+    def test_in_flight_not_evicted(self):
+        """Test that a pool with calls in flight survives eviction."""
+        evicted = []
+        cache = CredentialCache(max_size=1, on_evict=evicted.append)
+        busy = cache.get("sk-user-busy")
+        busy.acquire()
+        cache.get("sk-user-other")
+        assert evicted == []
+        assert len(cache) == 2
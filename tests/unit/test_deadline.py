@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from openai_api_client.dependencies.deadline import DeadlineMiddleware, UpstreamTimeouts, check_deadline, deadline, remaining
+
+
+async def call_middleware(middleware, headers):
+    """Runs an HTTP request through ``middleware``; returns the app's view of the deadline and what was sent."""
+    seen = []
+    sent = []
+
+    async def app(scope, receive, send):
+        seen.append(remaining())
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(name.encode(), value.encode()) for name, value in headers]}
+    await DeadlineMiddleware(app, **middleware)(scope, receive, send)
+    return seen, sent
+
+
+# Test cases for request deadlines
+class TestDeadline:
+    def test_inner_deadline_never_later(self):
+        """Test that a nested deadline can shorten the current one but not extend it."""
+        assert remaining() is None
+        with deadline(10):
+            with deadline(100):
+                assert remaining() <= 10
+            with deadline(1):
+                assert remaining() <= 1
+            with deadline(None):
+                assert 1 < remaining() <= 10
+        assert remaining() is None
+
+    def test_passed_deadline_stops_work(self):
+        """Test that check_deadline raises a 504 once the deadline has passed, and not before."""
+        check_deadline("auth")
+        with deadline(0.01):
+            check_deadline("auth")
+            asyncio.run(asyncio.sleep(0.02))
+            with pytest.raises(HTTPException) as exc_info:
+                check_deadline("auth")
+        assert exc_info.value.status_code == 504 and "auth" in exc_info.value.detail
+
+    def test_middleware_takes_header_capped(self):
+        """Test that the header sets the request's deadline, capped at the maximum that also applies without it."""
+        seen, _ = asyncio.run(call_middleware({"max_seconds": 30}, [("x-request-timeout", "2.5")]))
+        assert 2 < seen[0] <= 2.5
+        seen, _ = asyncio.run(call_middleware({"max_seconds": 30}, [("x-request-timeout", "600")]))
+        assert 29 < seen[0] <= 30
+        seen, _ = asyncio.run(call_middleware({"max_seconds": 30}, []))
+        assert 29 < seen[0] <= 30
+
+    def test_middleware_rejects_invalid_header(self):
+        """Test that a header that is not a positive number of seconds gets a 400 without reaching the app."""
+        for value in ("soon", "0", "-1", "nan"):
+            seen, sent = asyncio.run(call_middleware({}, [("x-request-timeout", value)]))
+            assert not seen and sent[0]["status"] == 400
+
+
+# Test cases for per-model upstream timeouts
+class TestUpstreamTimeouts:
+    def test_timeout_follows_latency_percentile(self):
+        """Test that a kind's timeout is the factor times its latency percentile, once enough latencies were seen."""
+        timeouts = UpstreamTimeouts(maximum=30, minimum=1, percentile=0.9, factor=2, samples=100)
+        for _ in range(19):
+            timeouts.observe("chat:gpt-4o", 2.0)
+        assert timeouts.timeout("chat:gpt-4o") == 30
+        timeouts.observe("chat:gpt-4o", 3.0)
+        assert timeouts.timeout("chat:gpt-4o") == 4.0
+        # Slower calls move the percentile up once they are a tenth of the window.
+        for _ in range(10):
+            timeouts.observe("chat:gpt-4o", 5.0)
+        assert timeouts.timeout("chat:gpt-4o") == 10.0
+        assert timeouts.timeout("chat:gpt-3.5-turbo") == 30
+
+    def test_timeout_kept_within_bounds(self):
+        """Test that very fast and very slow kinds get the minimum and maximum timeouts."""
+        timeouts = UpstreamTimeouts(maximum=30, minimum=1, factor=2, samples=20)
+        for _ in range(20):
+            timeouts.observe("fast", 0.01)
+            timeouts.observe("slow", 60.0)
+        assert timeouts.timeout("fast") == 1 and timeouts.timeout("slow") == 30
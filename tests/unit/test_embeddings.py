@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from openai_api_client.dependencies.embeddings import EmbeddingCache, decode_embedding, embedding_key, encode_embedding, plan_batches
+
+# Test cases for batching upstream embedding requests
+class TestPlanBatches:
+    def test_splits_by_count(self):
+        """Test that no batch holds more inputs than the upstream accepts."""
+        assert plan_batches(["a"] * 7, lambda text: 1, max_inputs=3) == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_splits_by_tokens(self):
+        """Test that batches stay within the token limit, and an oversized text still gets a batch of its own."""
+        assert plan_batches(["4", "4", "4", "20", "1"], int, max_tokens=10) == [[0, 1], [2], [3], [4]]
+
+# Test cases for encoding and caching embeddings
+class TestEmbeddingCache:
+    def test_base64_round_trip(self):
+        """Test that base64 vectors decode to the same float32 values as float lists."""
+        vector = np.array([0.1, -2.5, 3.0], dtype=np.float32)
+        assert np.array_equal(decode_embedding(encode_embedding(vector)), vector)
+        assert decode_embedding([0.1, -2.5, 3.0]).dtype == np.float32
+
+    def test_key_covers_model_and_dimensions(self):
+        """Test that the same text embedded by another model or at another size is a different entry."""
+        keys = {embedding_key("m", None, "text"), embedding_key("m", 256, "text"), embedding_key("n", None, "text")}
+        assert len(keys) == 3
+
+    def test_least_recently_used_evicted(self):
+        """Test that a full cache drops the entry unused for longest and that entries are read-only."""
+        cache = EmbeddingCache(max_size=2)
+        one, two, three = (np.full(2, i, dtype=np.float32) for i in range(3))
+        cache.put("one", one)
+        cache.put("two", two)
+        cache.get_many(["one"])
+        cache.put("three", three)
+        hits = cache.get_many(["one", "two", "three"])
+        assert [hit is not None for hit in hits] == [True, False, True]
+        with pytest.raises(ValueError):
+            hits[0][0] = 1
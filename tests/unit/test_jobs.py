@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from openai_api_client.api.schemas.openai import OpenAIResponse
+from openai_api_client.dependencies.budget import UserBudgets
+from openai_api_client.dependencies.limiter import AdaptiveLimit
+from openai_api_client.dependencies.scheduler import FairScheduler
+from openai_api_client.services import jobs
+from openai_api_client.services.jobs import JobService, pack, unpack
+
+
+class FakeOpenAI:
+    """Answers jobs without an upstream; ``errors`` are raised, in order, before answering."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def summarize_text(self, text, model, api_key=None):
+        self.calls.append(("summarize", text, api_key))
+        if self.errors:
+            raise self.errors.pop(0)
+        return OpenAIResponse(response=f"summary of {text}")
+
+    async def translate_text(self, text, source_language, target_language, api_key=None):
+        self.calls.append(("translate", text, api_key))
+        return OpenAIResponse(response=f"{text} in {target_language}")
+
+
+def make_service(session_factory, openai=None, **kwargs):
+    scheduler = FairScheduler(limit=AdaptiveLimit(initial=4, minimum=1, adaptive=False), priorities={"interactive": 4, "batch": 1}, timeouts={})
+    kwargs.setdefault("poll_interval", 0.01)
+    return JobService(session_factory=session_factory, openai=openai or FakeOpenAI(), scheduler=scheduler, **kwargs)
+
+
+def enqueue(service, user_id=1, kind="summarize", text="a long text"):
+    db = service.session_factory()
+    try:
+        params = {"text": text, "model": "text-davinci-003", "source_language": "en", "target_language": "fr"}
+        return service.enqueue(db, user_id, kind, params)["id"]
+    finally:
+        db.close()
+
+
+def get(service, job_id, user_id=1):
+    db = service.session_factory()
+    try:
+        return service.get(db, user_id, job_id)
+    finally:
+        db.close()
+
+# Test cases for compact job storage
+class TestJobStorage:
+    def test_pack_round_trip(self):
+        """Test that requests and results survive compression, and repetitive text shrinks."""
+        value = {"text": "word " * 1000, "model": "text-davinci-003"}
+        assert unpack(pack(value)) == value
+        assert len(pack(value)) < 200
+        assert unpack(None) is None
+
+# Test cases for the job queue and worker
+class TestJobService:
+    def test_claim_takes_each_job_once(self, session_factory):
+        """Test that a queued job is claimed by one worker, under its lease, and by no other."""
+        first, second = make_service(session_factory), make_service(session_factory)
+        job_id = enqueue(first)
+        claimed = first.claim()
+        assert claimed.id == job_id and claimed.attempts == 1 and claimed.api_key == "sk-alice"
+        assert claimed.params["text"] == "a long text"
+        assert second.claim() is None
+        assert get(first, job_id)["status"] == "running"
+
+    def test_expired_lease_taken_over(self, session_factory):
+        """Test that a job whose worker stopped renewing its lease is claimed again, and the old worker's result is dropped."""
+        stale = make_service(session_factory, lease_seconds=-1)
+        job_id = enqueue(stale)
+        old = stale.claim()
+        fresh = make_service(session_factory)
+        new = fresh.claim()
+        assert new.id == job_id and new.attempts == 2
+        assert not stale.finish(old, {"response": "late"})
+        assert fresh.finish(new, {"response": "done"})
+        assert get(fresh, job_id)["result"] == {"response": "done"}
+
+    def test_expired_lease_on_last_attempt_fails_job(self, session_factory):
+        """Test that a job whose lease ran out on its last attempt is marked failed rather than claimed again."""
+        stale = make_service(session_factory, lease_seconds=-1, max_attempts=2)
+        job_id = enqueue(stale)
+        assert stale.claim().attempts == 1
+        assert stale.claim().attempts == 2
+        assert stale.claim() is None
+        job = get(stale, job_id)
+        assert job["status"] == "failed" and job["attempts"] == 2 and "lease" in job["error"]
+
+    def test_unknown_job_priority_fails_job(self, session_factory, monkeypatch):
+        """Test that a job cannot be left running when JOB_PRIORITY is not a configured tier."""
+        monkeypatch.setattr(jobs, "JOB_PRIORITY", "bulk")
+        openai = FakeOpenAI()
+        service = make_service(session_factory, openai)
+        job_id = enqueue(service)
+        asyncio.run(service.execute(service.claim()))
+        job = get(service, job_id)
+        assert job["status"] == "failed" and "bulk" in job["error"]
+        assert not openai.calls and service.scheduler.in_use == 0
+
+    def test_execute_stores_result(self, session_factory):
+        """Test that a run job is marked succeeded with its result, using the user's own key."""
+        openai = FakeOpenAI()
+        service = make_service(session_factory, openai)
+        summarize, translate = enqueue(service), enqueue(service, kind="translate", text="hello")
+        for _ in range(2):
+            asyncio.run(service.execute(service.claim()))
+        assert get(service, summarize)["result"] == {"response": "summary of a long text"}
+        job = get(service, translate)
+        assert job["status"] == "succeeded" and job["result"] == {"response": "hello in fr"}
+        assert job["finished_at"] is not None and job["error"] is None
+        assert openai.calls[0] == ("summarize", "a long text", "sk-alice")
+        assert service.scheduler.in_use == 0
+
+    def test_upstream_errors_retried_then_failed(self, session_factory):
+        """Test that a 429 or 5xx puts the job back for later until its attempts run out, and a 400 fails it at once."""
+        errors = [HTTPException(status_code=429, detail="rate limited"), HTTPException(status_code=503, detail="down")]
+        service = make_service(session_factory, FakeOpenAI(errors), max_attempts=2)
+        job_id = enqueue(service)
+        asyncio.run(service.execute(service.claim()))
+        job = get(service, job_id)
+        assert job["status"] == "queued" and job["error"] == "rate limited"
+        # Not due again until its backoff has passed.
+        assert service.claim() is None
+        db = service.session_factory()
+        db.get(jobs.Job, job_id).run_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+        db.close()
+        asyncio.run(service.execute(service.claim()))
+        job = get(service, job_id)
+        assert job["status"] == "failed" and job["attempts"] == 2 and job["error"] == "down"
+
+        service.openai.errors = [HTTPException(status_code=400, detail="bad request")]
+        job_id = enqueue(service)
+        asyncio.run(service.execute(service.claim()))
+        assert get(service, job_id)["status"] == "failed"
+
+    def test_job_over_budget_requeued(self, session_factory):
+        """Test that a job of a user over budget goes back to the queue, without using up an attempt or a slot."""
+        budgets = UserBudgets(limits={"requests_per_minute": 1})
+        openai = FakeOpenAI()
+        service = make_service(session_factory, openai, budgets=budgets)
+        first, second = enqueue(service), enqueue(service)
+        asyncio.run(service.execute(service.claim()))
+        asyncio.run(service.execute(service.claim()))
+        assert get(service, first)["status"] == "succeeded"
+        job = get(service, second)
+        assert job["status"] == "queued" and job["attempts"] == 0
+        assert len(openai.calls) == 1 and service.scheduler.in_use == 0
+
+    def test_pending_jobs_bounded(self, session_factory):
+        """Test that a user with too many unfinished jobs gets a 429, and other users do not."""
+        service = make_service(session_factory, max_pending_per_user=2)
+        enqueue(service)
+        enqueue(service)
+        with pytest.raises(HTTPException) as exc_info:
+            enqueue(service)
+        assert exc_info.value.status_code == 429
+        enqueue(service, user_id=2)
+
+    def test_jobs_private_to_their_user(self, session_factory):
+        """Test that another user's job looks like a missing one."""
+        service = make_service(session_factory)
+        job_id = enqueue(service)
+        with pytest.raises(HTTPException) as exc_info:
+            get(service, job_id, user_id=2)
+        assert exc_info.value.status_code == 404
+
+    def test_run_processes_queue_and_streams_events(self, session_factory):
+        """Test that the worker loop runs queued jobs and the event stream follows a job until it finishes."""
+        service = make_service(session_factory)
+
+        async def run():
+            worker = asyncio.create_task(service.run())
+            await asyncio.sleep(0.05)
+            job_id = enqueue(service)
+            statuses = []
+
+            async def follow():
+                async for job in service.events(1, job_id, interval=0.01):
+                    statuses.append(job["status"])
+
+            await asyncio.wait_for(follow(), 5)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+            return statuses
+
+        statuses = asyncio.run(run())
+        assert statuses[-1] == "succeeded"
+        assert set(statuses) <= {"queued", "running", "succeeded"}
+
+    def test_cancelled_job_returned_to_queue(self, session_factory):
+        """Test that a job still running at shutdown goes back to the queue without using up an attempt."""
+
+        class SlowOpenAI(FakeOpenAI):
+            async def summarize_text(self, text, model, api_key=None):
+                await asyncio.sleep(10)
+
+        service = make_service(session_factory, SlowOpenAI())
+        job_id = enqueue(service)
+
+        async def run():
+            worker = asyncio.create_task(service.run())
+            await asyncio.sleep(0.1)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+        asyncio.run(run())
+        job = get(service, job_id)
+        assert job["status"] == "queued" and job["attempts"] == 0
+        assert service.scheduler.in_use == 0
@@ -0,0 +1,73 @@
+from openai_api_client.dependencies.limiter import AdaptiveLimit
+
+
+def make_limit(clock, initial=10, **kwargs):
+    return AdaptiveLimit(initial=initial, minimum=2, maximum=20, tolerance=2.0, backoff=0.5, adaptive=True, clock=clock, **kwargs)
+
+
+def run_calls(limit, count, seconds=1.0, concurrent=None, kind="complete_text:model"):
+    for _ in range(concurrent or limit.limit):
+        limit.start()
+    for _ in range(count):
+        limit.observe(kind, seconds)
+        limit.start()
+
+
+# Test cases for the adaptive upstream limit
+class TestAdaptiveLimit:
+    def test_grows_while_saturated(self, clock):
+        """Test that the limit rises by about one per limit's worth of calls while it is in use."""
+        limit = make_limit(clock)
+        run_calls(limit, 10)
+        assert limit.limit == 10
+        run_calls(limit, 10)
+        assert limit.limit == 11
+
+    def test_does_not_grow_while_idle(self, clock):
+        """Test that calls made well below the limit do not raise it."""
+        limit = make_limit(clock)
+        run_calls(limit, 100, concurrent=2)
+        assert limit.limit == 10
+
+    def test_backs_off_on_congestion(self, clock):
+        """Test that a 429 or a timeout multiplies the limit by the backoff, down to the minimum."""
+        limit = make_limit(clock)
+        for expected in (5, 2, 2):
+            limit.start()
+            limit.observe("complete_text:model", None, congested=True)
+            clock.now += 10
+            assert limit.limit == expected
+
+    def test_backs_off_on_slow_calls(self, clock):
+        """Test that a call much slower than its kind's usual latency lowers the limit, unlike a slow call of another kind."""
+        limit = make_limit(clock)
+        run_calls(limit, 5, concurrent=1, seconds=1.0)
+        limit.observe("complete_text:model", 1.5)
+        limit.start()
+        limit.observe("summarize_text:model", 30.0)
+        assert limit.limit == 10
+        limit.start()
+        limit.observe("complete_text:model", 3.0)
+        assert limit.limit == 5
+
+    def test_backs_off_once_per_round_trip(self, clock):
+        """Test that calls failing together lower the limit once, not once each."""
+        limit = make_limit(clock)
+        run_calls(limit, 5, concurrent=1, seconds=1.0)
+        for _ in range(5):
+            limit.start()
+        for _ in range(5):
+            limit.observe("complete_text:model", None, congested=True)
+        assert limit.limit == 5
+        clock.now += 1.5
+        limit.start()
+        limit.observe("complete_text:model", None, congested=True)
+        assert limit.limit == 2
+
+    def test_fixed_when_not_adaptive(self):
+        """Test that a non-adaptive limit stays at its initial value and within its bounds."""
+        limit = AdaptiveLimit(initial=1000, minimum=2, maximum=20, adaptive=False)
+        assert limit.limit == 20
+        limit.start()
+        limit.observe("complete_text:model", None, congested=True)
+        assert limit.limit == 20 and limit.in_flight == 0
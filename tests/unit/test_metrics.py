@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import MagicMock
+from prometheus_client import REGISTRY
+
+from openai_api_client.dependencies.metrics import observe_upstream, record_tokens
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+# Test cases for upstream call instrumentation
+class TestObserveUpstream:
+    def test_observe_upstream_success(self):
+        """Test that a successful call is timed and leaves nothing in flight."""
+        labels = {"model": "text-davinci-003", "method": "complete_text"}
+        before = sample("openai_upstream_duration_seconds_count", labels)
+        with observe_upstream("complete_text", "text-davinci-003"):
+            pass
+        assert sample("openai_upstream_duration_seconds_count", labels) == before + 1
+        assert sample("openai_upstream_in_flight", {"method": "complete_text"}) == 0
+
+    def test_observe_upstream_error(self):
+        """Test that a failing call is counted as an error and re-raised."""
+        labels = {"model": "text-davinci-003", "method": "summarize_text", "error": "ValueError"}
+        before = sample("openai_upstream_errors_total", labels)
+        with pytest.raises(ValueError):
+            with observe_upstream("summarize_text", "text-davinci-003"):
+                raise ValueError("boom")
+        assert sample("openai_upstream_errors_total", labels) == before + 1
+
+# Test cases for token counters
+class TestRecordTokens:
+    def test_record_tokens(self):
+        """Test that prompt and completion tokens are counted separately."""
+        prompt = {"model": "text-ada-001", "kind": "prompt"}
+        completion = {"model": "text-ada-001", "kind": "completion"}
+        before_prompt = sample("openai_tokens_total", prompt)
+        before_completion = sample("openai_tokens_total", completion)
+        record_tokens("text-ada-001", MagicMock(prompt_tokens=12, completion_tokens=30))
+        assert sample("openai_tokens_total", prompt) == before_prompt + 12
+        assert sample("openai_tokens_total", completion) == before_completion + 30
+
+    def test_record_tokens_missing_usage(self):
+        """Test that a response without usage is ignored."""
+        record_tokens("text-ada-001", None)
@@ -0,0 +1,36 @@
+import json
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+
+from openai_api_client.api.schemas.openai import OpenAIResponse
+from openai_api_client.api.schemas.usage import UsageReport
+from openai_api_client.dependencies.responses import FastJSONResponse
+
+# Test cases for the fast JSON response class
+class TestFastJSONResponse:
+    def test_render_pydantic_model(self):
+        """Test that a pydantic model is serialized directly."""
+        response = FastJSONResponse(content=OpenAIResponse(response="Bonjour"))
+        assert response.body == b'{"response":"Bonjour","usage":null}'
+        assert response.headers["content-type"] == "application/json"
+
+    def test_render_matches_jsonable_encoder(self):
+        """Test that the output decodes to what jsonable_encoder produced."""
+        report = {
+            "user_id": 1,
+            "granularity": "hour",
+            "start": datetime(2024, 1, 1, tzinfo=timezone.utc),
+            "end": datetime(2024, 1, 2, tzinfo=timezone.utc),
+            "latency_buckets_ms": [100, 250],
+            "buckets": [],
+        }
+        model = UsageReport(**report)
+        assert json.loads(FastJSONResponse(content=report).body) == jsonable_encoder(report)
+        assert json.loads(FastJSONResponse(content=model).body) == jsonable_encoder(model)
+
+    def test_render_status_code(self):
+        """Test that the status code is passed through."""
+        response = FastJSONResponse(status_code=201, content={"id": 1})
+        assert response.status_code == 201
+        assert response.body == b'{"id":1}'
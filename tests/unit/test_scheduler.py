@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from openai_api_client.dependencies.deadline import deadline
+from openai_api_client.dependencies.limiter import AdaptiveLimit
+from openai_api_client.dependencies.scheduler import FairScheduler, parse_tiers
+
+
+def make_scheduler(slots=2, **kwargs):
+    kwargs.setdefault("timeouts", {})
+    limit = AdaptiveLimit(initial=slots, minimum=1, adaptive=False)
+    return FairScheduler(limit=limit, priorities={"interactive": 4, "batch": 1}, default_priority="interactive", **kwargs)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+# Test cases for the fair scheduler
+class TestFairScheduler:
+    def test_slots_granted_immediately_while_free(self):
+        """Test that requests do not queue while slots are free."""
+        scheduler = make_scheduler(slots=2)
+
+        async def run():
+            await scheduler.acquire(1, "batch")
+            await scheduler.acquire(1, "batch")
+            return scheduler.in_use
+
+        assert asyncio.run(run()) == 2
+
+    def test_freed_slot_goes_to_user_with_fewest(self):
+        """Test that a user holding every slot does not get the next one while another user waits."""
+        scheduler = make_scheduler(slots=2)
+        order = []
+
+        async def request(user):
+            async with scheduler.slot(user, "interactive"):
+                order.append(user)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            await scheduler.acquire(1, "interactive")
+            waiting = [asyncio.create_task(request(1)) for _ in range(3)]
+            await settle()
+            waiting.append(asyncio.create_task(request(2)))
+            await settle()
+            scheduler.release(1, "interactive")
+            await asyncio.gather(*waiting)
+            scheduler.release(1, "interactive")
+
+        asyncio.run(run())
+        assert order[0] == 2
+        assert not scheduler.flows and scheduler.in_use == 0
+
+    def test_slots_shared_by_weight(self):
+        """Test that under contention interactive requests get their weight's share of the slots."""
+        scheduler = make_scheduler(slots=5)
+        held = {"interactive": 0, "batch": 0}
+        peak = {}
+
+        async def request(user, priority):
+            async with scheduler.slot(user, priority):
+                held[priority] += 1
+                if held["interactive"] + held["batch"] == 5:
+                    peak.setdefault("slots", dict(held))
+                await asyncio.sleep(0.01)
+                held[priority] -= 1
+
+        async def run():
+            blockers = [await scheduler.acquire(3, "batch") for _ in range(5)]
+            tasks = [asyncio.create_task(request(1, "batch")) for _ in range(20)]
+            tasks += [asyncio.create_task(request(2, "interactive")) for _ in range(20)]
+            await settle()
+            for _ in blockers:
+                scheduler.release(3, "batch")
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        assert peak["slots"] == {"interactive": 4, "batch": 1}
+
+    def test_user_queue_bounded(self):
+        """Test that a user with too many requests waiting gets a 429."""
+        scheduler = make_scheduler(slots=1, max_queue_per_user=1)
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            waiting = asyncio.create_task(scheduler.acquire(1, "interactive"))
+            await settle()
+            with pytest.raises(HTTPException) as exc_info:
+                await scheduler.acquire(1, "interactive")
+            other = asyncio.create_task(scheduler.acquire(2, "interactive"))
+            await settle()
+            waiting.cancel()
+            other.cancel()
+            return exc_info.value
+
+        error = asyncio.run(run())
+        assert error.status_code == 429 and error.headers["Retry-After"] == "1"
+
+    def test_queue_timeout(self):
+        """Test that a request waiting longer than its tier's timeout gets a 503 and leaves the queue."""
+        scheduler = make_scheduler(slots=1, timeouts={"batch": 0.01})
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            with pytest.raises(HTTPException) as exc_info:
+                await scheduler.acquire(2, "batch")
+            return exc_info.value
+
+        assert asyncio.run(run()).status_code == 503
+        assert list(scheduler.flows) == [(1, "interactive")]
+
+    def test_sheds_when_expected_wait_exceeds_timeout(self):
+        """Test that a request expected to wait past its timeout gets a 503 at once, with a matching Retry-After."""
+        scheduler = make_scheduler(slots=1, timeouts={"interactive": 10, "batch": 10})
+        scheduler.hold_seconds = 4.0
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            queued = [asyncio.create_task(scheduler.acquire(2, "batch")) for _ in range(2)]
+            await settle()
+            # Two batch requests ahead count for a quarter slot each against an interactive one.
+            interactive = asyncio.create_task(scheduler.acquire(3, "interactive"))
+            await settle()
+            with pytest.raises(HTTPException) as exc_info:
+                await scheduler.acquire(4, "batch")
+            for task in queued + [interactive]:
+                task.cancel()
+            return exc_info.value
+
+        error = asyncio.run(run())
+        assert error.status_code == 503 and error.headers["Retry-After"] == "16"
+        assert not any(key[0] == 4 for key in scheduler.flows)
+
+    def test_deadline_bounds_queueing(self):
+        """Test that a request gets a 504 at once when its deadline comes before the expected wait, and leaves the queue when it passes."""
+        scheduler = make_scheduler(slots=1, timeouts={"interactive": 10, "batch": 10})
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            with deadline(0.02):
+                with pytest.raises(HTTPException) as waited:
+                    await scheduler.acquire(2, "interactive")
+            scheduler.hold_seconds = 4.0
+            with deadline(1):
+                with pytest.raises(HTTPException) as shed:
+                    await scheduler.acquire(3, "interactive")
+            return waited.value, shed.value
+
+        waited, shed = asyncio.run(run())
+        assert waited.status_code == 504 and shed.status_code == 504
+        assert list(scheduler.flows) == [(1, "interactive")] and not scheduler._queued
+
+    def test_slots_follow_limit(self):
+        """Test that the scheduler hands out as many slots as the adaptive limit allows."""
+        limit = AdaptiveLimit(initial=1, minimum=1, adaptive=False)
+        scheduler = FairScheduler(limit=limit, priorities={"interactive": 1}, timeouts={})
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            waiting = asyncio.create_task(scheduler.acquire(2, "interactive"))
+            await settle()
+            blocked = not waiting.done()
+            limit._limit = 2.0
+            scheduler.release(1, "interactive")
+            await scheduler.acquire(3, "interactive")
+            await waiting
+            return blocked, scheduler.in_use
+
+        assert asyncio.run(run()) == (True, 2)
+
+    def test_cancelled_waiter_releases_nothing(self):
+        """Test that a request cancelled while queued, e.g. by a disconnect, neither takes nor leaks a slot."""
+        scheduler = make_scheduler(slots=1)
+
+        async def run():
+            await scheduler.acquire(1, "interactive")
+            waiting = asyncio.create_task(scheduler.acquire(2, "interactive"))
+            await settle()
+            waiting.cancel()
+            await settle()
+            scheduler.release(1, "interactive")
+            return scheduler.in_use
+
+        assert asyncio.run(run()) == 0
+        assert not scheduler.flows
+
+    def test_priority_for(self):
+        """Test that a request may lower its tier but not raise it above the user's."""
+        scheduler = make_scheduler()
+        assert scheduler.priority_for(None) == "interactive"
+        assert scheduler.priority_for(None, "batch") == "batch"
+        assert scheduler.priority_for("batch", "interactive") == "batch"
+        with pytest.raises(HTTPException) as exc_info:
+            scheduler.priority_for(None, "urgent")
+        assert exc_info.value.status_code == 400
+        assert parse_tiers("interactive=4, batch=1") == {"interactive": 4.0, "batch": 1.0}
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from openai_api_client.api.schemas.openai import EmbeddingRequest, OpenAIRequest
+from openai_api_client.api.schemas.user import UserCreate
+from openai_api_client.dependencies.utils import json_body
+
+
+def make_request(body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+# Test cases for the OpenAI request schema
+class TestOpenAIRequest:
+    def test_defaults(self):
+        """Test that omitted fields take their defaults."""
+        request = OpenAIRequest(text="Hello")
+        assert (request.model, request.temperature, request.max_tokens) == ("text-davinci-003", 0.7, 256)
+
+    def test_invalid_model(self):
+        """Test that a model outside the allowed set is rejected."""
+        with pytest.raises(ValidationError) as exc_info:
+            OpenAIRequest(text="Hello", model="invalid_model")
+        assert exc_info.value.errors()[0]["type"] == "literal_error"
+
+    @pytest.mark.parametrize("field,value", [("temperature", -0.1), ("temperature", 1.5), ("max_tokens", 0), ("max_tokens", 4097)])
+    def test_out_of_bounds(self, field, value):
+        """Test that temperature and max_tokens are bounded."""
+        with pytest.raises(ValidationError):
+            OpenAIRequest(text="Hello", **{field: value})
+
+# Test cases for the embeddings request schema
+class TestEmbeddingRequest:
+    def test_single_or_many_inputs(self):
+        """Test that input is one text or a list of texts."""
+        assert EmbeddingRequest(input="Hello").input == "Hello"
+        assert EmbeddingRequest(input=["Hello", "World"], encoding_format="base64").input == ["Hello", "World"]
+
+    @pytest.mark.parametrize("body", [{"input": []}, {"input": ["x"] * 2049}, {"input": "x", "dimensions": 0}, {"input": "x", "encoding_format": "hex"}])
+    def test_invalid(self, body):
+        """Test that empty or oversized batches, bad dimensions and unknown encodings are rejected."""
+        with pytest.raises(ValidationError):
+            EmbeddingRequest(**body)
+
+# Test cases for the user registration schema
+class TestUserCreate:
+    def test_valid_password(self):
+        """Test that a strong password is accepted."""
+        user = UserCreate(username="testuser", email="test@example.com", password="Password123")
+        assert user.username == "testuser"
+
+    @pytest.mark.parametrize("password", ["Pass1", "password123", "PASSWORD123", "Passwordabc"])
+    def test_weak_password(self, password):
+        """Test that short passwords and passwords missing a character class are rejected."""
+        with pytest.raises(ValidationError):
+            UserCreate(username="testuser", email="test@example.com", password=password)
+
+# Test cases for raw-bytes body parsing
+class TestJsonBody:
+    def test_parses_raw_body(self):
+        """Test that the body is parsed into the model."""
+        request = asyncio.run(json_body(OpenAIRequest)(make_request(b'{"text": "Hello", "max_tokens": 16}')))
+        assert isinstance(request, OpenAIRequest)
+        assert request.max_tokens == 16
+
+    def test_invalid_body_raises_request_validation_error(self):
+        """Test that validation errors carry body locations like FastAPI's own."""
+        with pytest.raises(RequestValidationError) as exc_info:
+            asyncio.run(json_body(OpenAIRequest)(make_request(b'{"text": "Hello", "temperature": 2}')))
+        assert exc_info.value.errors()[0]["loc"] == ("body", "temperature")
+
+    def test_malformed_json(self):
+        """Test that malformed JSON is reported as a validation error."""
+        with pytest.raises(RequestValidationError) as exc_info:
+            asyncio.run(json_body(OpenAIRequest)(make_request(b'{"text": ')))
+        assert exc_info.value.errors()[0]["type"] == "json_invalid"
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from openai_api_client.dependencies.semantic_cache import SemanticCache, VectorIndex, normalize
+
+
+def random_vectors(count, dimensions=64, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def near(vector, similarity, seed=1):
+    noise = np.random.default_rng(seed).standard_normal(len(vector)).astype(np.float32)
+    noise -= (noise @ vector) * vector
+    noise /= np.linalg.norm(noise)
+    return (similarity * vector + np.sqrt(1 - similarity**2) * noise).astype(np.float32)
+
+# Test cases for the vector index
+class TestVectorIndex:
+    def test_finds_neighbour_above_threshold(self):
+        """Test that a query close to a stored vector finds its slot."""
+        vectors = random_vectors(2000)
+        index = VectorIndex(64, 10000, threshold=0.9)
+        for vector in vectors:
+            index.add(vector)
+        for target in (0, 999, 1999):
+            slot, score = index.search(near(vectors[target], 0.95, seed=1000 + target))
+            assert slot == target
+            assert score == pytest.approx(0.95, abs=1e-4)
+
+    def test_ignores_neighbour_below_threshold(self):
+        """Test that a vector less similar than the threshold is not a match."""
+        vectors = random_vectors(100)
+        index = VectorIndex(64, 1000, threshold=0.95)
+        for vector in vectors:
+            index.add(vector)
+        assert index.search(near(vectors[5], 0.8))[0] is None
+
+    def test_labels_separate_entries(self):
+        """Test that a search only matches slots with the same label."""
+        vector = random_vectors(1)[0]
+        index = VectorIndex(64, 10, threshold=0.9)
+        index.add(vector, label=1)
+        assert index.search(vector, label=2)[0] is None
+        assert index.search(vector, label=1)[0] == 0
+
+    def test_grows_up_to_max_size(self):
+        """Test that storage grows geometrically from a small start to max_size."""
+        index = VectorIndex(64, 3000, threshold=0.9, capacity=16)
+        for vector in random_vectors(3000):
+            index.add(vector)
+        assert len(index) == 3000
+        assert index.capacity == 3000
+
+    def test_least_recently_used_replaced_when_full(self):
+        """Test that a full index replaces the entry unused for longest."""
+        vectors = random_vectors(4)
+        index = VectorIndex(64, 3, threshold=0.9)
+        for vector in vectors[:3]:
+            index.add(vector)
+        index.search(vectors[0])
+        slot, replaced = index.add(vectors[3])
+        assert (slot, replaced) == (1, True)
+        assert index.search(vectors[1])[0] is None
+        assert index.search(vectors[0])[0] == 0
+
+# Test cases for the semantic cache
+class TestSemanticCache:
+    def test_exact_and_similar_prompts(self):
+        """Test exact lookups by text and similar lookups by embedding."""
+        cache = SemanticCache(dimensions=64, max_entries=100, threshold=0.9, path=None)
+        vector = random_vectors(1)[0]
+        cache.put("complete:m", "What is the capital of France?", vector, "Paris")
+        assert cache.get_exact("complete:m", "What is the capital of France?") == "Paris"
+        assert cache.get_exact("complete:m", "what's the capital of france") is None
+        assert cache.get("complete:m", near(vector, 0.95)) == "Paris"
+        assert cache.get("complete:other", vector) is None
+
+    def test_replaced_entry_forgotten(self):
+        """Test that an entry replaced in the index is no longer found by text either."""
+        cache = SemanticCache(dimensions=64, max_entries=1, threshold=0.9, path=None)
+        first, second = random_vectors(2)
+        cache.put("scope", "first", first, "one")
+        cache.put("scope", "second", second, "two")
+        assert cache.get_exact("scope", "first") is None
+        assert cache.get_exact("scope", "second") == "two"
+        assert len(cache) == 1
+
+    def test_save_and_load_memory_mapped(self, tmp_path):
+        """Test that a saved cache loads memory-mapped, answers lookups and takes new entries."""
+        vectors = random_vectors(50)
+        cache = SemanticCache(dimensions=64, max_entries=100, threshold=0.9, path=str(tmp_path))
+        for i, vector in enumerate(vectors):
+            cache.put("scope", f"prompt {i}", vector, f"answer {i}")
+        cache.save()
+
+        loaded = SemanticCache(dimensions=64, max_entries=100, threshold=0.9, path=str(tmp_path))
+        assert len(loaded) == 50
+        assert isinstance(loaded.index.vectors, np.memmap)
+        assert loaded.get("scope", near(vectors[7], 0.95)) == "answer 7"
+        assert loaded.get_exact("scope", "prompt 3") == "answer 3"
+        extra = normalize(np.ones(64))
+        loaded.put("scope", "extra", extra, "extra answer")
+        assert loaded.get("scope", extra) == "extra answer"
+        # Copy-on-write: the saved files are unchanged by the insert.
+        assert len(SemanticCache(dimensions=64, max_entries=100, threshold=0.9, path=str(tmp_path))) == 50
+
+    def test_mismatched_saved_cache_ignored(self, tmp_path):
+        """Test that a cache saved with other dimensions is ignored rather than misread."""
+        cache = SemanticCache(dimensions=64, max_entries=10, threshold=0.9, path=str(tmp_path))
+        cache.put("scope", "prompt", random_vectors(1)[0], "answer")
+        cache.save()
+        assert len(SemanticCache(dimensions=32, max_entries=10, threshold=0.9, path=str(tmp_path))) == 0
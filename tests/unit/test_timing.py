@@ -0,0 +1,74 @@
+import asyncio
+import re
+
+from openai_api_client.dependencies.timing import ServerTimingMiddleware, StageTimer, stage
+
+
+async def call_middleware(app):
+    """Runs an HTTP request through ``ServerTimingMiddleware`` around ``app``; returns the messages sent."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    await ServerTimingMiddleware(app)(scope, receive, send)
+    return sent
+
+
+def respond(*stages):
+    """An app that runs ``stages`` (name, seconds) one after another, then sends an empty 200."""
+    async def app(scope, receive, send):
+        for name, seconds in stages:
+            with stage(name):
+                await asyncio.sleep(seconds)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"{}"})
+    return app
+
+
+def server_timing(message):
+    return dict(message["headers"])[b"server-timing"].decode()
+
+
+# Test cases for the per-request stage timer
+class TestStageTimer:
+    def test_repeated_stages_accumulate(self):
+        """Test that a stage run several times is listed each time and summed in the log fields."""
+        timer = StageTimer()
+        timer.add("db", 0.0, 0.002)
+        timer.add("upstream", 0.002, 0.012)
+        timer.add("db", 0.012, 0.015)
+        fields = timer.as_log_fields()
+        assert fields["db"] == 5.0 and fields["upstream"] == 10.0
+        assert fields["total"] >= 0
+        names = [entry.split(";")[0] for entry in timer.header_value().split(", ")]
+        assert names == ["db", "upstream", "db", "total"]
+
+    def test_stage_outside_request_ignored(self):
+        """Test that stage does nothing outside a request timed by the middleware."""
+        with stage("db"):
+            pass
+
+
+# Test cases for the Server-Timing middleware
+class TestServerTimingMiddleware:
+    def test_header_lists_stages(self):
+        """Test that the response carries a Server-Timing header with each stage and the total."""
+        sent = asyncio.run(call_middleware(respond(("auth", 0.01), ("upstream", 0.02))))
+        value = server_timing(sent[0])
+        entries = dict(re.fullmatch(r"(\w+);dur=([\d.]+)", entry).groups() for entry in value.split(", "))
+        assert list(entries) == ["auth", "upstream", "total"]
+        assert float(entries["auth"]) >= 10 and float(entries["upstream"]) >= 20
+        assert float(entries["total"]) >= float(entries["auth"]) + float(entries["upstream"])
+        # The app's own headers are kept.
+        assert dict(sent[0]["headers"])[b"content-type"] == b"application/json"
+
+    def test_header_without_stages(self):
+        """Test that a request recording no stages still gets a header, with only the total."""
+        sent = asyncio.run(call_middleware(respond()))
+        assert re.fullmatch(r"total;dur=[\d.]+", server_timing(sent[0]))
+        assert sent[1]["body"] == b"{}"
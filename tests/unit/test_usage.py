@@ -0,0 +1,170 @@
+import asyncio
+import threading
+
+import pytest
+from datetime import datetime, timezone
+from fastapi import HTTPException, status
+
+from openai_api_client.dependencies.token_usage import TokenTally, add_tokens, count_tokens
+from openai_api_client.services.usage import (
+    TokenUsageAggregator,
+    UsageRollupAggregator,
+    UsageService,
+    COUNTER_COLUMNS,
+    HOUR,
+    DAY,
+    bucket_start,
+    latency_bucket_index,
+)
+
+WHEN = datetime(2024, 5, 17, 13, 42, 7, tzinfo=timezone.utc)
+
+# Test cases for bucketing helpers
+class TestUsageBuckets:
+    def test_bucket_start_hour(self):
+        """Test truncation of a timestamp to its hour."""
+        assert bucket_start(WHEN, HOUR) == datetime(2024, 5, 17, 13, tzinfo=timezone.utc)
+
+    def test_bucket_start_day(self):
+        """Test truncation of a timestamp to its day."""
+        assert bucket_start(WHEN, DAY) == datetime(2024, 5, 17, tzinfo=timezone.utc)
+
+    def test_latency_bucket_index(self):
+        """Test assignment of latencies to histogram columns."""
+        assert latency_bucket_index(0) == 0
+        assert latency_bucket_index(100) == 0
+        assert latency_bucket_index(101) == 1
+        assert latency_bucket_index(10000) == 6
+        assert latency_bucket_index(60000) == 7
+
+# Test cases for the in-memory rollup aggregator
+class TestUsageRollupAggregator:
+    def test_add_updates_hour_and_day(self):
+        """Test that one event produces one hourly and one daily delta."""
+        aggregator = UsageRollupAggregator()
+        aggregator.add(1, "/api/v1/openai/complete", 200, 120, WHEN, prompt_tokens=10, completion_tokens=5)
+        rollups, raw = aggregator.drain()
+        assert sorted(row["granularity"] for row in rollups) == [DAY, HOUR]
+        for row in rollups:
+            assert row["request_count"] == 1
+            assert row["error_count"] == 0
+            assert row["latency_sum_ms"] == 120
+            assert row["latency_le_250"] == 1
+            assert row["total_tokens"] == 15
+        assert len(raw) == 1
+        assert raw[0]["status_code"] == 200
+        assert raw[0]["total_tokens"] == 15
+
+    def test_add_accumulates_same_bucket(self):
+        """Test that events in the same bucket are folded into one delta."""
+        aggregator = UsageRollupAggregator()
+        aggregator.add(1, "/api/v1/openai/complete", 200, 50, WHEN)
+        aggregator.add(1, "/api/v1/openai/complete", 500, 20000, WHEN)
+        rollups, raw = aggregator.drain()
+        hourly = next(row for row in rollups if row["granularity"] == HOUR)
+        assert hourly["request_count"] == 2
+        assert hourly["error_count"] == 1
+        assert hourly["latency_le_100"] == 1
+        assert hourly["latency_gt_10000"] == 1
+        assert len(raw) == 2
+
+    def test_drain_empties_aggregator(self):
+        """Test that draining leaves nothing pending."""
+        aggregator = UsageRollupAggregator()
+        aggregator.add(1, "/api/v1/openai/complete", 200, 50, WHEN)
+        aggregator.drain()
+        assert aggregator.drain() == ([], [])
+
+    def test_restore_merges_deltas(self):
+        """Test that restored rows are merged with newer pending deltas."""
+        aggregator = UsageRollupAggregator()
+        aggregator.add(1, "/api/v1/openai/complete", 200, 50, WHEN)
+        rollups, raw = aggregator.drain()
+        aggregator.add(1, "/api/v1/openai/complete", 200, 50, WHEN)
+        aggregator.restore(rollups, raw)
+        rollups, raw = aggregator.drain()
+        assert all(row["request_count"] == 2 for row in rollups)
+        assert set(COUNTER_COLUMNS) <= set(rollups[0])
+        assert len(raw) == 2
+
+# Test cases for per-request token tallies
+class TestTokenTally:
+    def test_nested_scopes_add_up(self):
+        """Test that usage counted in a nested scope is also counted in the scopes around it."""
+        with count_tokens() as request:
+            add_tokens("gpt-4o", 10, 5)
+            with count_tokens() as inner:
+                add_tokens("gpt-4o-mini", 3, 1)
+        add_tokens("gpt-4o", 100, 100)
+        assert inner.models == {"gpt-4o-mini": [1, 3, 1]}
+        assert request.models == {"gpt-4o": [1, 10, 5], "gpt-4o-mini": [1, 3, 1]}
+        assert request.usage() == {"prompt_tokens": 13, "completion_tokens": 6, "total_tokens": 19}
+
+    def test_no_calls_no_usage(self):
+        """Test that a scope without upstream calls reports no usage rather than zeros."""
+        assert TokenTally().usage() is None
+
+# Test cases for the in-memory per-model token aggregator
+class TestTokenUsageAggregator:
+    def test_add_drain_restore(self):
+        """Test that per-model usage is folded into hourly and daily deltas, and restored ones are merged."""
+        aggregator = TokenUsageAggregator()
+        aggregator.add(1, {"gpt-4o": [2, 10, 5]}, WHEN)
+        aggregator.add(1, {"gpt-4o": [1, 1, 1], "gpt-4o-mini": [1, 3, 1]}, WHEN)
+        rows = aggregator.drain()
+        hourly = {row["model"]: row for row in rows if row["granularity"] == HOUR}
+        assert hourly["gpt-4o"]["call_count"] == 3 and hourly["gpt-4o"]["total_tokens"] == 17
+        assert hourly["gpt-4o-mini"]["prompt_tokens"] == 3
+        assert len(rows) == 4 and aggregator.drain() == []
+        aggregator.add(1, {"gpt-4o": [1, 1, 1]}, WHEN)
+        aggregator.restore(rows)
+        hourly = {row["model"]: row for row in aggregator.drain() if row["granularity"] == HOUR}
+        assert hourly["gpt-4o"]["call_count"] == 4 and hourly["gpt-4o"]["total_tokens"] == 19
+
+# Test cases for usage flushing
+class TestUsageService_Flush:
+    def test_flush_off_event_loop(self):
+        """Test that a flush due while serving requests runs in a worker thread, not on the event loop."""
+        threads = []
+
+        class Service(UsageService):
+            def flush(self):
+                threads.append(threading.get_ident())
+
+        service = Service()
+        service._last_flush = float("-inf")
+
+        async def run():
+            service.record(1, "/api/v1/openai/complete", 200, 12, when=WHEN)
+            await service._flushing
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(run())
+        assert len(threads) == 1 and threads[0] != loop_thread
+
+# Test cases for report window validation
+class TestUsageService_ReportWindow:
+    def test_invalid_granularity(self):
+        """Test handling of an unknown granularity."""
+        with pytest.raises(HTTPException) as exc:
+            UsageService._report_window("minute", None, None)
+        assert exc.value.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_window_too_large(self):
+        """Test handling of an hourly window longer than the allowed span."""
+        with pytest.raises(HTTPException) as exc:
+            UsageService._report_window(HOUR, datetime(2024, 1, 1, tzinfo=timezone.utc), WHEN)
+        assert exc.value.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_window_aligned_to_bucket(self):
+        """Test that the window start is aligned to the bucket boundary."""
+        start, end = UsageService._report_window(DAY, WHEN.replace(day=1), WHEN)
+        assert start == datetime(2024, 5, 1, tzinfo=timezone.utc)
+        assert end == WHEN
+
+    def test_naive_window_taken_as_utc(self):
+        """Test that naive start and end values are compared as UTC rather than failing against aware ones."""
+        start, end = UsageService._report_window(HOUR, WHEN.replace(hour=1, tzinfo=None), WHEN)
+        assert start == datetime(2024, 5, 17, 1, tzinfo=timezone.utc) and end == WHEN
+        start, end = UsageService._report_window(HOUR, None, WHEN.replace(tzinfo=None))
+        assert end == WHEN and start == datetime(2024, 5, 16, 13, tzinfo=timezone.utc)
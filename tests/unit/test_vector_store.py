@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from openai_api_client.dependencies.vector_store import Collection, VectorStore
+
+
+def random_vectors(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimensions)).astype(np.float32)
+
+
+def add(collection, vectors, start=0, **metadata):
+    ids = [f"doc-{i}" for i in range(start, start + len(vectors))]
+    collection.add(vectors, ids, [f"text {i}" for i in range(start, start + len(vectors))], [dict(metadata, n=i) for i in range(start, start + len(vectors))])
+
+# Test cases for collections
+class TestCollection:
+    def test_top_k_by_cosine_similarity(self, tmp_path):
+        """Test that search returns the k most similar documents, best first, across segments."""
+        collection = Collection.create(str(tmp_path), "m", 16, segment_rows=64)
+        vectors = random_vectors(200)
+        add(collection, vectors)
+        assert len(collection.segments) == 4
+        results = collection.search(vectors[150] * 3, k=5)
+        assert results[0]["id"] == "doc-150"
+        assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+        assert results[0]["text"] == "text 150" and results[0]["metadata"] == {"n": 150}
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ normalized[150]))[:5]
+        assert [result["id"] for result in results] == [f"doc-{i}" for i in expected]
+
+    def test_filter(self, tmp_path):
+        """Test that only documents whose metadata matches the filter are returned."""
+        collection = Collection.create(str(tmp_path), "m", 16)
+        vectors = random_vectors(20)
+        add(collection, vectors[:10], lang="en")
+        add(collection, vectors[10:], start=10, lang="fr")
+        results = collection.search(vectors[3], k=20, filter={"lang": "fr"})
+        assert len(results) == 10
+        assert all(result["metadata"]["lang"] == "fr" for result in results)
+        assert len(collection.search(vectors[3], k=20, filter={"lang": ["en", "fr"], "n": [1, 12]})) == 2
+        add(collection, vectors[:1], start=20, lang="de")
+        assert [result["id"] for result in collection.search(vectors[3], filter={"lang": "de"})] == ["doc-20"]
+        assert collection.search(vectors[3], filter={"missing": "x"}) == []
+
+    def test_appends_seen_by_other_workers(self, tmp_path):
+        """Test that a second process's view picks up rows appended after it opened the collection."""
+        writer = Collection.create(str(tmp_path), "m", 16, segment_rows=8)
+        reader = Collection.open(str(tmp_path), segment_rows=8)
+        vectors = random_vectors(20)
+        add(writer, vectors[:5])
+        assert reader.search(vectors[2], k=1)[0]["id"] == "doc-2"
+        add(writer, vectors[5:], start=5)
+        assert reader.search(vectors[17], k=1)[0]["id"] == "doc-17"
+        assert len(reader) == 20
+        assert isinstance(reader.segments[0].matrix, np.memmap)
+
+    def test_interrupted_append_discarded(self, tmp_path):
+        """Test that vectors written without their sidecar line are dropped before the next append."""
+        collection = Collection.create(str(tmp_path), "m", 16)
+        vectors = random_vectors(3)
+        add(collection, vectors[:1])
+        segment = collection.segments[0]
+        with open(segment.vectors_path, "ab") as f:
+            f.write(vectors[1].tobytes())
+        with open(segment.sidecar_path, "ab") as f:
+            f.write(b'{"id": "doc-1", "te')
+        add(collection, vectors[2:], start=2)
+        reopened = Collection.open(str(tmp_path))
+        assert len(reopened) == 2
+        assert reopened.search(vectors[2], k=1)[0]["id"] == "doc-2"
+
+    def test_wrong_dimensions_rejected(self, tmp_path):
+        """Test that vectors of another size are rejected."""
+        collection = Collection.create(str(tmp_path), "m", 16)
+        with pytest.raises(ValueError):
+            collection.search(np.ones(8))
+
+# Test cases for the collection store
+class TestVectorStore:
+    def test_collections_are_per_owner(self, tmp_path):
+        """Test that a user's collection is not visible to another user."""
+        store = VectorStore(str(tmp_path))
+        store.get_or_create("1", "docs", "m", 16)
+        assert store.get("1", "docs").dimensions == 16
+        with pytest.raises(KeyError):
+            store.get("2", "docs")
+
+    def test_invalid_name_rejected(self, tmp_path):
+        """Test that names that could escape the store directory are rejected."""
+        with pytest.raises(ValueError):
+            VectorStore(str(tmp_path)).get("1", "../2")